@@ -1,4 +1,5 @@
-import paho.mqtt.client as mqtt
+import os
+import sys
 import json
 import time
 import logging
@@ -6,6 +7,13 @@ from datetime import datetime
 import tkinter as tk
 from tkinter import messagebox
 
+# Shared modules live in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from transport import BROKER, PORT, create_client
+from priority import PriorityDispatcher, EMERGENCY, HIGH, NORMAL
+from incidents import IncidentCoalescer, AckBatcher
+import metrics
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -14,8 +22,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # MQTT broker details
-broker = "broker.emqx.io"
-port = 1883
+broker = BROKER
+port = PORT
 client_id = f"python-backend-{int(time.time())}"
 
 # MQTT Topics
@@ -26,11 +34,39 @@ TOPICS = {
     "overspeeding": "car/overspeeding"
 }
 
+# Reports folded into incidents (kind by topic); each new incident is
+# published once to DISPATCH_TOPIC and reporters get batched acknowledgements
+COALESCED_TOPICS = {TOPICS["accident"]: "accident", TOPICS["towing"]: "towing",
+                    TOPICS["overspeeding"]: "overspeeding"}
+DISPATCH_TOPIC = "dispatch/{}"
+
+# Worker pool lanes; accidents and help requests never wait behind the rest
+TOPIC_PRIORITIES = {
+    TOPICS["accident"]: EMERGENCY,
+    TOPICS["help"]: EMERGENCY,
+    TOPICS["towing"]: HIGH,
+    TOPICS["overspeeding"]: NORMAL,
+}
+# Worker threads per lane; 0 handles every message on the MQTT network thread
+WORKERS = int(os.environ.get("BUTTON_WORKERS", "4"))
+
 class EmergencyHandler:
-    def __init__(self):
-        self.client = mqtt.Client(client_id)
+    def __init__(self, workers=WORKERS):
+        self.client = create_client(client_id)
         self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
+        self.incidents = IncidentCoalescer()
+        self.acks = AckBatcher(self.client)
+        self.dispatcher = None
+        if workers:
+            self.dispatcher = PriorityDispatcher(
+                self.on_message, TOPIC_PRIORITIES, workers={priority: workers for priority in (EMERGENCY, HIGH, NORMAL)},
+                default_priority=NORMAL, component="button")
+            self.client.on_message = self.dispatcher.on_message
+        else:
+            self.client.on_message = self.on_message
+        metrics.gauge("button_open_incidents", lambda: len(self.incidents), "Incidents still collecting reports")
+        metrics.registry.describe("button_reports_total", "Location reports received, by kind")
+        metrics.registry.describe("button_incidents_total", "Incidents opened and dispatched, by kind")
         self.setup_client()
 
     def setup_client(self):
@@ -51,30 +87,41 @@ class EmergencyHandler:
         else:
             logger.error(f"Failed to connect, return code: {rc}")
 
+    @metrics.instrument("button")
     def on_message(self, client, userdata, msg):
         try:
             # Parse the incoming message
             payload = json.loads(msg.payload.decode())
-            logger.info(f"Received message on topic {msg.topic}: {payload}")
+            logger.debug(f"Received message on topic {msg.topic}: {payload}")
 
             # Process the message based on topic
             response = self.process_message(msg.topic, payload)
+            if response is None:
+                return  # Acknowledged in the next batch
+            # Response topics are shared, so clients pick out their own by reporter
+            response.setdefault("reporter", payload.get("reporter", payload.get("vehicle_id")))
 
             # Send response back
             response_topic = f"{msg.topic}/response"
             response_payload = json.dumps(response)
             self.client.publish(response_topic, response_payload)
-            logger.info(f"Sent response to {response_topic}: {response}")
+            logger.debug(f"Sent response to {response_topic}: {response}")
 
         except json.JSONDecodeError:
+            metrics.record_error("button", msg.topic, "decode")
             logger.error("Failed to decode message payload")
             self.send_error_response(msg.topic)
         except Exception as e:
+            metrics.record_error("button", msg.topic, "handler")
             logger.error(f"Error processing message: {e}")
             self.send_error_response(msg.topic)
 
     def process_message(self, topic, payload):
-        """Process incoming messages and return appropriate response"""
+        """Process incoming messages and return the response to publish.
+
+        Coalesced reports return None; their acknowledgement goes out with
+        the next batch on the topic's response topic.
+        """
         response = {
             "timestamp": datetime.utcnow().isoformat(),
             "status": True,
@@ -98,9 +145,8 @@ class EmergencyHandler:
         if not self.verify_location(payload):
             return self.create_error_response("Location data required for accident reporting")
 
-        logger.info("Processing accident report")
         response["message"] = "Accident report received and processed. Emergency services notified."
-        return response
+        return self.coalesce(TOPICS["accident"], payload, response)
 
     def handle_help(self, payload, response):
         logger.info("Processing help request")
@@ -111,17 +157,36 @@ class EmergencyHandler:
         if not self.verify_location(payload):
             return self.create_error_response("Location data required for towing service")
 
-        logger.info("Processing towing request")
         response["message"] = "Towing request received. Service provider dispatched."
-        return response
+        return self.coalesce(TOPICS["towing"], payload, response)
 
     def handle_overspeeding(self, payload, response):
         if not self.verify_location(payload):
             return self.create_error_response("Location data required for overspeeding report")
 
-        logger.info("Processing overspeeding report")
         response["message"] = "Overspeeding report logged successfully."
-        return response
+        return self.coalesce(TOPICS["overspeeding"], payload, response)
+
+    def coalesce(self, topic, payload, response):
+        """Fold a located report into its incident and queue the reporter's acknowledgement.
+
+        Only the report that opens an incident is dispatched downstream;
+        later reports of the same incident are just acknowledged.
+        """
+        kind = COALESCED_TOPICS[topic]
+        location = payload["location"]
+        reporter = payload.get("reporter", payload.get("vehicle_id"))
+        incident, created = self.incidents.report(kind, location["lat"], location["lng"], reporter)
+        metrics.registry.inc("button_reports_total", (("kind", kind),))
+        if created:
+            logger.info(f"New {kind} incident {incident.incident_id} at {location['lat']}, {location['lng']}")
+            self.client.publish(DISPATCH_TOPIC.format(kind), json.dumps(incident.to_dict()))
+            metrics.registry.inc("button_incidents_total", (("kind", kind),))
+        response["incident_id"] = incident.incident_id
+        response["reporter"] = reporter
+        response["duplicate"] = not created
+        self.acks.add(f"{topic}/response", response)
+        return None
 
     def verify_location(self, payload):
         """Verify that the payload contains valid location data"""
@@ -148,14 +213,28 @@ class EmergencyHandler:
         response_topic = f"{original_topic}/response"
         self.client.publish(response_topic, json.dumps(response))
 
+    def start(self):
+        """Start the acknowledgement batcher and the worker pool"""
+        self.acks.start()
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+
+    def stop(self):
+        """Finish queued reports, then publish the outstanding acknowledgements"""
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+        self.acks.stop()
+
     def run(self):
         """Start the MQTT client loop"""
+        self.start()
         try:
             logger.info("Starting MQTT client loop")
             self.client.loop_forever()
         except KeyboardInterrupt:
             logger.info("Shutting down emergency handler")
             self.client.disconnect()
+            self.stop()
             logger.info("Disconnected from MQTT broker")
 
 class EmergencyApp:
@@ -202,6 +281,7 @@ class EmergencyApp:
 
 if __name__ == "__main__":
     handler = EmergencyHandler()
+    metrics.serve()
 
     # Start MQTT client in a separate thread
     import threading
@@ -26,9 +26,58 @@ function initLeafletMap() {
         showNotification('Location access denied. Please enable location services.', 'error');
     });
 
+    // Traffic and road-condition heatmap, refreshed from the main server's tile aggregates
+    const heatmap = new HeatmapLayer({ maxNativeZoom: HEATMAP_MAX_ZOOM, opacity: 0.8 }).addTo(map);
+    setInterval(() => heatmap.redraw(), HEATMAP_REFRESH_MS);
+
     return map;
 }
 
+// Heatmap tiles: each /tiles/z/x/y response is a grid of finer cells for that tile only
+const TILE_SERVER = 'http://localhost:5000';
+const HEATMAP_MAX_ZOOM = 16;
+const HEATMAP_REFRESH_MS = 30000;
+
+const HeatmapLayer = L.GridLayer.extend({
+    createTile: function (coords, done) {
+        const tile = document.createElement('canvas');
+        const size = this.getTileSize();
+        tile.width = size.x;
+        tile.height = size.y;
+        fetch(`${TILE_SERVER}/tiles/${coords.z}/${coords.x}/${coords.y}`)
+            .then((response) => (response.ok ? response.json() : null))
+            .then((data) => {
+                if (data) {
+                    drawHeatmapTile(tile, coords, data);
+                }
+                done(null, tile);
+            })
+            .catch((error) => done(error, tile));
+        return tile;
+    }
+});
+
+function drawHeatmapTile(tile, coords, data) {
+    const ctx = tile.getContext('2d');
+    const span = 1 << (data.cell_zoom - coords.z);
+    const cell = tile.width / span;
+    const left = (x) => (x - coords.x * span) * cell;
+    const top = (y) => (y - coords.y * span) * cell;
+
+    // Busier cells are more opaque; slow traffic is red, free flow green
+    data.layers.traffic.forEach(([x, y, weight, speed]) => {
+        const hue = speed === null ? 40 : Math.min(speed, 60) * 2;
+        ctx.fillStyle = `hsla(${hue}, 90%, 50%, ${Math.min(weight / 20, 1) * 0.6})`;
+        ctx.fillRect(left(x), top(y), cell, cell);
+    });
+    // Road-condition reports outline their cells
+    data.layers.roadcondition.forEach(([x, y, weight]) => {
+        ctx.strokeStyle = `rgba(120, 0, 160, ${Math.min(weight / 5, 1)})`;
+        ctx.lineWidth = 2;
+        ctx.strokeRect(left(x) + 1, top(y) + 1, cell - 2, cell - 2);
+    });
+}
+
 // Notification System
 function showNotification(message, type = 'info') {
     const notification = document.createElement('div');
@@ -70,9 +119,27 @@ function setupButtonActions() {
         }
     };
 
+    // Responses arrive one per request or as batches {"acks": [...]} shared by every
+    // reporter on the topic; only the ones addressed to this client are shown
     mqttClient.onMessageArrived = (message) => {
-        console.log('Message received:', message.payloadString);
-        showNotification('Response received: ' + message.payloadString, 'success');
+        let response;
+        try {
+            response = JSON.parse(message.payloadString);
+        } catch (error) {
+            console.error('Unreadable response:', message.payloadString);
+            return;
+        }
+        const responses = Array.isArray(response.acks) ? response.acks : [response];
+        responses
+            .filter((ack) => !ack.reporter || ack.reporter === clientId)
+            .forEach((ack) => {
+                console.log('Response received:', ack);
+                let text = ack.message || 'Response received';
+                if (ack.duplicate) {
+                    text += ' Already reported as incident ' + ack.incident_id + '.';
+                }
+                showNotification(text, ack.status === false ? 'error' : 'success');
+            });
     };
 
     // Connect to MQTT broker
@@ -83,6 +150,7 @@ function setupButtonActions() {
             onSuccess: () => {
                 console.log('Connected to MQTT broker');
                 showNotification('Connected to emergency services', 'success');
+                Object.values(buttonConfig).forEach((config) => client.subscribe(config.topic + '/response'));
             },
             onFailure: (err) => {
                 console.error('Failed to connect:', err);
@@ -143,7 +211,8 @@ function setupButtonActions() {
                         lat: window.userLocation.lat,
                         lng: window.userLocation.lng
                     } : null,
-                    message: config.message
+                    message: config.message,
+                    reporter: clientId
                 };
 
                 // Send MQTT message
@@ -0,0 +1,83 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Default repeat-alert plan: three publishes one second apart
+DEFAULT_ALERT_COUNT = 3
+DEFAULT_ALERT_INTERVAL = 1.0
+
+
+class AlertScheduler:
+    """Publishes repeated alerts from a background timer thread.
+
+    The MQTT receive thread only registers a plan and returns immediately.
+    Plans are de-duplicated per key (normally the vehicle_id): while a plan
+    is pending, a new alert for the same key just refreshes its message
+    instead of starting a second series.
+    """
+
+    def __init__(self, count=DEFAULT_ALERT_COUNT, interval=DEFAULT_ALERT_INTERVAL):
+        self.count = count
+        self.interval = interval
+        self.plans = {}
+        self.heap = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def __len__(self):
+        return len(self.plans)
+
+    def schedule(self, client, key, topic, message):
+        """Register an alert plan, returning False if one is already pending for key"""
+        with self.condition:
+            plan = self.plans.get(key)
+            if plan is not None:
+                plan["topic"] = topic
+                plan["message"] = message
+                return False
+            self.plans[key] = {"client": client, "topic": topic, "message": message, "remaining": self.count}
+            heapq.heappush(self.heap, (time.monotonic(), next(self.sequence), key))
+            self.condition.notify()
+        return True
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and (not self.heap or self.heap[0][0] > time.monotonic()):
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                _, _, key = heapq.heappop(self.heap)
+                plan = self.plans[key]
+                plan["remaining"] -= 1
+                if plan["remaining"] > 0:
+                    heapq.heappush(self.heap, (time.monotonic() + self.interval, next(self.sequence), key))
+                else:
+                    del self.plans[key]
+                client, topic, message = plan["client"], plan["topic"], plan["message"]
+
+            try:
+                client.publish(topic, message)
+                print(f"Alert sent to {key}: {message}")
+            except Exception as e:
+                print(f"Error sending alert to {key}: {e}")
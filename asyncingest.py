@@ -0,0 +1,117 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from priority import BULK, PriorityLanes, TopicPriorities
+import metrics
+
+# Upstream publishes run in this many threads at once
+DEFAULT_FORWARD_WORKERS = 4
+
+
+class AsyncIngest:
+    """asyncio receive -> process -> forward pipeline with per-topic priorities.
+
+    submit() may be called from any thread (e.g. paho's network thread) and
+    hands the message to the event loop, where it is placed in a priority
+    lane. Worker tasks process messages most-urgent-first with the given
+    process(topic, payload, timestamp) function. Upstream publishes queued
+    with forward() run concurrently as upstream(data, topic) in a small
+    thread pool, ordered by the same priorities, so a slow uplink never
+    blocks processing.
+    """
+
+    def __init__(self, process, priorities, upstream=None, lanes=None, default_priority=BULK,
+                 workers=1, forward_workers=DEFAULT_FORWARD_WORKERS, component="ingest"):
+        self.process = process
+        self.priority_of = TopicPriorities(priorities, default_priority)
+        self.default_priority = default_priority
+        self.upstream = upstream
+        self.component = component
+        self.inbox = PriorityLanes(lanes)
+        self.outbox = PriorityLanes(lanes)
+        self.workers = workers
+        self.forward_workers = forward_workers
+        self.executor = None
+        self.loop = None
+        self.inbox_ready = None
+        self.outbox_ready = None
+        self.stopping = None
+        self.histograms = {}
+        metrics.gauge(f"{component}_queue_depth", self.inbox.depths, "Messages waiting per priority lane", label="lane")
+        metrics.gauge(f"{component}_forward_depth", self.outbox.depths, "Upstream publishes waiting per lane",
+                      label="lane")
+
+    def submit(self, topic, payload, timestamp=None):
+        """Queue a received message; safe to call from any thread"""
+        if self.loop is None:
+            raise RuntimeError("AsyncIngest is not running")
+        timestamp = time.time() if timestamp is None else timestamp
+        self.loop.call_soon_threadsafe(self._offer, topic, payload, timestamp)
+
+    def _offer(self, topic, payload, timestamp):
+        if self.inbox.offer(self.priority_of(topic), (topic, payload, timestamp)):
+            self.inbox_ready.set()
+
+    def forward(self, data, topic=None):
+        """Queue an upstream publish; call from the event loop (i.e. from process)"""
+        priority = self.priority_of(topic) if topic is not None else self.default_priority
+        if self.outbox.offer(priority, (data, topic)):
+            self.outbox_ready.set()
+
+    async def _process_worker(self):
+        while not self.stopping.is_set():
+            entry = self.inbox.take()
+            if entry is None:
+                self.inbox_ready.clear()
+                await self.inbox_ready.wait()
+                continue
+            topic, payload, timestamp = entry[1]
+            start = time.perf_counter()
+            try:
+                self.process(topic, payload, timestamp)
+            except Exception as e:
+                metrics.record_error(self.component, topic, "handler")
+                print(f"Error processing message on {topic}: {e}")
+            histogram = self.histograms.get(topic)
+            if histogram is None:
+                histogram = self.histograms[topic] = metrics.registry.handler_histogram(self.component, topic)
+            with metrics.registry.lock:
+                histogram.observe(time.perf_counter() - start)
+            # Let receives and forwards run between messages
+            await asyncio.sleep(0)
+
+    async def _forward_worker(self):
+        while not self.stopping.is_set():
+            entry = self.outbox.take()
+            if entry is None:
+                self.outbox_ready.clear()
+                await self.outbox_ready.wait()
+                continue
+            try:
+                await self.loop.run_in_executor(self.executor, self.upstream, *entry[1])
+            except Exception as e:
+                metrics.record_error(self.component, "upstream", "handler")
+                print(f"Error forwarding upstream: {e}")
+
+    async def run(self):
+        """Run the workers until stop() is called"""
+        self.loop = asyncio.get_running_loop()
+        self.inbox_ready = asyncio.Event()
+        self.outbox_ready = asyncio.Event()
+        self.stopping = asyncio.Event()
+        self.executor = ThreadPoolExecutor(max(1, self.forward_workers), thread_name_prefix=f"{self.component}-forward")
+        tasks = [asyncio.create_task(self._process_worker()) for _ in range(self.workers)]
+        if self.upstream is not None:
+            tasks += [asyncio.create_task(self._forward_worker()) for _ in range(self.forward_workers)]
+        try:
+            await self.stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.executor.shutdown(wait=False)
+
+    def stop(self):
+        """Stop the workers; safe to call from any thread"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
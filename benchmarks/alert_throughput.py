@@ -0,0 +1,95 @@
+# comb5.on_message throughput while many cars are speeding at once
+#
+# Compares the AlertScheduler dispatch with the old blocking loop that slept
+# between repeated alerts inside the receive callback. The blocking run uses
+# a shortened interval so it finishes; its rate scales down with the interval.
+#
+# Run from the repository root:
+#     python -m benchmarks.alert_throughput [speeders] [messages]
+import contextlib
+import io
+import json
+import sys
+import time
+import random
+import comb5
+from alertscheduler import AlertScheduler
+
+BLOCKING_INTERVAL = 0.01  # Stand-in for the original 1 second sleep
+
+
+class Message:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class CountingClient:
+    def __init__(self):
+        self.published = 0
+
+    def publish(self, topic, payload):
+        self.published += 1
+
+
+def build_messages(speeders, total):
+    messages = []
+    for i in range(total):
+        status = {
+            "vehicle_id": f"car{i % speeders}",
+            "latitude": 12.9716 + random.uniform(-0.05, 0.05),
+            "longitude": 77.5946 + random.uniform(-0.05, 0.05),
+            "speed": random.uniform(120, 150),
+        }
+        messages.append(Message("myvehiclestatus/car1", json.dumps(status).encode()))
+    return messages
+
+
+class BlockingScheduler:
+    """The original dispatch: publish and sleep in the calling thread"""
+
+    def __init__(self, count, interval):
+        self.count = count
+        self.interval = interval
+
+    def schedule(self, client, key, topic, message):
+        for _ in range(self.count):
+            client.publish(topic, message)
+            time.sleep(self.interval)
+        return True
+
+
+def measure(scheduler, messages):
+    comb5.vehicles.clear()
+    comb5.window_store.log_path = None
+    comb5.alert_scheduler = scheduler
+    client = CountingClient()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for msg in messages:
+            comb5.on_message(client, None, msg)
+        elapsed = time.perf_counter() - start
+    return len(messages) / elapsed
+
+
+def main():
+    speeders = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    total = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    random.seed(42)
+    messages = build_messages(speeders, total)
+
+    scheduler = AlertScheduler(comb5.alert_count, comb5.alert_interval)
+    scheduler.start()
+    rate = measure(scheduler, messages)
+    pending = len(scheduler)
+    scheduler.stop()
+    print(f"scheduled dispatch: {rate:12.0f} msg/s with {pending} alert plans pending")
+
+    blocking_messages = messages[:min(total, 200)]
+    rate = measure(BlockingScheduler(comb5.alert_count, BLOCKING_INTERVAL), blocking_messages)
+    print(f"blocking dispatch:  {rate:12.0f} msg/s at a {BLOCKING_INTERVAL} s interval "
+          f"(~{rate * BLOCKING_INTERVAL / comb5.alert_interval:.2f} msg/s at {comb5.alert_interval} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# Emergency latency under telemetry floods: threaded on_message vs --async ingest
+#
+# A publisher thread floods myvehiclestatus/frame at a fixed rate while an
+# accident event is sent every few milliseconds. The threaded run mirrors
+# paho's network loop (one FIFO queue into edgeserver.on_message); the async
+# run feeds the same process_message through AsyncIngest priority lanes.
+# Latency is publish -> accident processed. The uplink is made slow on
+# purpose so that forwarding has to run concurrently.
+#
+# Run from the repository root:
+#     python -m benchmarks.async_ingest_bench [frames/s ...]
+import os
+import io
+import sys
+import json
+import time
+import asyncio
+import threading
+import contextlib
+import numpy as np
+os.environ.setdefault("MQTT_TRANSPORT", "loopback")
+
+from fleetsim import FleetSimulator, json_frame
+from telemetry import TOPIC_VEHICLE_STATUS_FRAME
+from transport import LoopbackBroker, LoopbackClient
+from asyncingest import AsyncIngest
+import edgeserver
+
+DURATION = 2.0  # seconds of load per run
+FRAME_SIZE = 200  # readings per telemetry frame
+ACCIDENT_INTERVAL = 0.005  # seconds between accident events
+UPLINK_DELAY = 0.002  # seconds per upstream publish
+
+
+def build_frames(count):
+    fleet = FleetSimulator(FRAME_SIZE * 50, seed=1)
+    frames = [json.dumps(json_frame(frame)).encode() for frame in fleet.frames(FRAME_SIZE)]
+    return [frames[i % len(frames)] for i in range(count)]
+
+
+def slow_upstream(data, topic=None):
+    time.sleep(UPLINK_DELAY)
+
+
+def publish_load(publisher, frames_per_second, frames, done):
+    """Publish frames at the given rate and accidents every ACCIDENT_INTERVAL"""
+    start = time.perf_counter()
+    next_accident = start
+    sent = 0
+    while True:
+        now = time.perf_counter()
+        if now - start >= DURATION:
+            break
+        if now >= next_accident:
+            publisher.publish(edgeserver.TOPIC_ACCIDENT, json.dumps({"sent": now, "message": "Accident reported"}))
+            next_accident += ACCIDENT_INTERVAL
+        due = int((now - start) * frames_per_second)
+        while sent < due:
+            publisher.publish(TOPIC_VEHICLE_STATUS_FRAME, frames[sent % len(frames)])
+            sent += 1
+        time.sleep(0.0002)
+    done.set()
+
+
+def latency_recorder(latencies):
+    def record(topic, payload):
+        if topic == edgeserver.TOPIC_ACCIDENT:
+            latencies.append(time.perf_counter() - json.loads(payload)["sent"])
+    return record
+
+
+def run_threaded(frames_per_second, frames):
+    broker = LoopbackBroker()
+    latencies = []
+    record = latency_recorder(latencies)
+    processed = [0]
+
+    def on_message(client, userdata, msg):
+        # Forwarding happens inline, as in the original handler
+        edgeserver.process_message(client, msg.topic, msg.payload, time.time(), slow_upstream)
+        processed[0] += 1
+        record(msg.topic, msg.payload)
+
+    edge = LoopbackClient("edge", broker, threaded=True)
+    edge.on_connect = edgeserver.on_connect
+    edge.on_message = on_message
+    edge.connect()
+    edge.loop_start()
+    done = threading.Event()
+    publisher = LoopbackClient("load", broker)
+    publish_load(publisher, frames_per_second, frames, done)
+    backlog = edge.inbox.qsize()
+    # Drain what is left so accidents stuck behind the flood are measured
+    while edge.inbox.qsize():
+        time.sleep(0.01)
+    edge.loop_stop()
+    return latencies, processed[0], backlog, 0
+
+
+def run_async(frames_per_second, frames):
+    broker = LoopbackBroker()
+    latencies = []
+    record = latency_recorder(latencies)
+    processed = [0]
+
+    async def main():
+        def process(topic, payload, timestamp):
+            edgeserver.process_message(None, topic, payload, timestamp, ingest.forward)
+            processed[0] += 1
+            record(topic, payload)
+
+        ingest = AsyncIngest(process, edgeserver.TOPIC_PRIORITIES, upstream=slow_upstream, component="bench")
+        runner = asyncio.create_task(ingest.run())
+        await asyncio.sleep(0)
+        edge = LoopbackClient("edge", broker)
+        edge.on_connect = edgeserver.on_connect
+        edge.on_message = lambda client, userdata, msg: ingest.submit(msg.topic, msg.payload)
+        edge.connect()
+        done = threading.Event()
+        publisher = LoopbackClient("load", broker)
+        thread = threading.Thread(target=publish_load, args=(publisher, frames_per_second, frames, done))
+        thread.start()
+        while not done.is_set():
+            await asyncio.sleep(0.01)
+        thread.join()
+        backlog = len(ingest.inbox)
+        while len(ingest.inbox):
+            await asyncio.sleep(0.01)
+        ingest.stop()
+        await runner
+        return backlog, sum(ingest.inbox.dropped.values())
+
+    backlog, dropped = asyncio.run(main())
+    return latencies, processed[0], backlog, dropped
+
+
+def report(label, frames_per_second, result):
+    latencies, processed, backlog, dropped = result
+    latencies = np.asarray(latencies) * 1e3
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"{label:<9} {frames_per_second:6} frames/s | accident p50 {p50:9.2f} ms | p99 {p99:9.2f} ms | "
+          f"{processed:6} processed | backlog {backlog:6} | dropped {dropped:6}")
+
+
+def main():
+    rates = [int(arg) for arg in sys.argv[1:]] or [100, 500, 2000, 5000]
+    frames = build_frames(256)
+    for rate in rates:
+        with contextlib.redirect_stdout(io.StringIO()):
+            threaded = run_threaded(rate, frames)
+            asynchronous = run_async(rate, frames)
+        report("threaded", rate, threaded)
+        report("async", rate, asynchronous)
+
+
+if __name__ == "__main__":
+    main()
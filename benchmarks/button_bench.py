@@ -0,0 +1,99 @@
+# Emergency button backend: per-report handling vs worker pool + incident coalescing
+#
+# A burst of crashes, each reported by many nearby cars within a few
+# seconds, plus scattered overspeeding reports, is fed to
+# EmergencyHandler.client.on_message as the MQTT thread would. Every new
+# dispatch costs DISPATCH_COST seconds (the downstream service call);
+# other publishes are free. The per-report run mirrors the old handler:
+# messages handled inline on the MQTT thread, a 1 cm coalescing radius
+# (every report is its own incident) and one acknowledgement per message.
+# Timing ends when every report has been handled and acknowledged.
+#
+# Run from the repository root:
+#     python -m benchmarks.button_bench [crashes] [reports per crash]
+import os
+import sys
+import json
+import time
+import logging
+os.environ.setdefault("MQTT_TRANSPORT", "loopback")
+
+import numpy as np
+from transport import LoopbackMessage
+from incidents import IncidentCoalescer, AckBatcher
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "CR_Website"))
+import button
+
+DISPATCH_COST = 0.002
+OVERSPEEDING_REPORTS = 2000
+CENTER = (12.9716, 77.5946)
+
+
+def build_reports(crashes, per_crash):
+    rng = np.random.default_rng(3)
+    sites = np.array(CENTER) + rng.uniform(-0.05, 0.05, (crashes, 2))
+    reports = []
+    for crash, (lat, lon) in enumerate(sites.tolist()):
+        for car in range(per_crash):
+            jitter = rng.normal(0, 0.0002, 2)  # ~20 m of GPS scatter around the crash
+            reports.append((button.TOPICS["accident"], {"message": "Accident reported", "reporter": f"car-{crash}-{car}",
+                                                        "location": {"lat": lat + jitter[0], "lng": lon + jitter[1]}}))
+    for i, (lat, lon) in enumerate((np.array(CENTER) + rng.uniform(-0.05, 0.05, (OVERSPEEDING_REPORTS, 2))).tolist()):
+        reports.append((button.TOPICS["overspeeding"], {"message": "Overspeeding reported", "reporter": f"witness-{i}",
+                                                        "location": {"lat": lat, "lng": lon}}))
+    order = rng.permutation(len(reports))
+    return [LoopbackMessage(reports[i][0], json.dumps(reports[i][1]).encode()) for i in order.tolist()]
+
+
+class CountingPublisher:
+    """Wraps the handler client's publish: counts messages and charges dispatches"""
+
+    def __init__(self, client):
+        self.publish_through = client.publish
+        self.dispatches = 0
+        self.responses = 0
+        self.acks = 0
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if topic.startswith("dispatch/"):
+            self.dispatches += 1
+            time.sleep(DISPATCH_COST)
+        else:
+            self.responses += 1
+            self.acks += len(json.loads(payload).get("acks", (None,)))
+        return self.publish_through(topic, payload, qos, retain)
+
+
+def run(messages, workers, coalesce):
+    handler = button.EmergencyHandler(workers=workers)
+    counter = CountingPublisher(handler.client)
+    handler.client.publish = counter.publish
+    if not coalesce:
+        handler.incidents = IncidentCoalescer(radius=0.01)  # 1 cm: every report is its own incident
+        handler.acks = AckBatcher(handler.client, max_batch=1)
+    handler.start()
+    start = time.perf_counter()
+    for msg in messages:
+        handler.client.on_message(handler.client, None, msg)
+    handler.stop()
+    elapsed = time.perf_counter() - start
+    assert counter.acks == len(messages), (counter.acks, len(messages))
+    return elapsed, counter
+
+
+def main():
+    crashes = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    per_crash = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    logging.getLogger(button.__name__).setLevel(logging.WARNING)
+    messages = build_reports(crashes, per_crash)
+    print(f"{len(messages)} reports: {crashes} crashes x {per_crash} reporters + {OVERSPEEDING_REPORTS} overspeeding")
+    runs = [("per report, inline", 0, False), ("coalesced, inline", 0, True),
+            ("coalesced, 4 workers", 4, True)]
+    for label, workers, coalesce in runs:
+        elapsed, counter = run(messages, workers, coalesce)
+        print(f"{label:<21}: {len(messages) / elapsed:8.0f} reports/s | {counter.dispatches:6} dispatches | "
+              f"{counter.responses:6} response messages")
+
+
+if __name__ == "__main__":
+    main()
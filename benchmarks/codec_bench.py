@@ -0,0 +1,55 @@
+# Encode/decode cost and bytes on the wire: JSON vs binary vs delta binary
+#
+# Run from the repository root:
+#     python -m benchmarks.codec_bench [frame size]
+import sys
+import json
+import time
+import random
+from codec import encode, decode
+from telemetry import build_frame
+
+
+def make_reading(i):
+    return {
+        "vehicle_id": f"car{i}",
+        "latitude": 12.9716 + random.uniform(-0.05, 0.05),
+        "longitude": 77.5946 + random.uniform(-0.05, 0.05),
+        "speed": random.uniform(0, 150),
+        "timestamp": time.time(),
+    }
+
+
+def bench(function, argument, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(argument)
+    return (time.perf_counter() - start) / repeat
+
+
+def report(label, data, readings, repeat):
+    formats = [
+        ("json", lambda d: json.dumps(d).encode()),
+        ("binary", lambda d: encode(d, binary=True)),
+        ("binary+delta", lambda d: encode(d, binary=True, delta=True)),
+    ]
+    print(label)
+    for name, encoder in formats:
+        payload = encoder(data)
+        encode_time = bench(encoder, data, repeat)
+        decode_time = bench(decode, payload, repeat)
+        print(f"  {name:<13} {len(payload) / readings:7.1f} bytes/reading | "
+              f"encode {encode_time / readings * 1e9:8.0f} ns/reading | "
+              f"decode {decode_time / readings * 1e9:8.0f} ns/reading")
+
+
+def main():
+    frame_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    random.seed(42)
+    report("single reading", make_reading(0), 1, 20000)
+    readings = [make_reading(i) for i in range(frame_size)]
+    report(f"frame of {frame_size} readings", build_frame(readings), frame_size, 200)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# Ambulance moving-radius queries: re-query from scratch vs ContinuousQueries
+#
+# A fleet from the simulator fills the area. Ambulances drive at about
+# 60 km/h with a heading, so each has a 50 m radius plus a forward corridor,
+# and report once per second. The scratch run mirrors the old ambloc
+# handler: a grid query over the whole region on every report, diffed
+# against the previous answer to get enter/leave deltas. The incremental run
+# registers each ambulance with ContinuousQueries. Car location updates
+# (a slice of the fleet per tick) go through update_car and emit deltas too;
+# scratch only sees the net change between two reports, so it counts fewer.
+#
+# Run from the repository root:
+#     python -m benchmarks.continuous_query_bench [vehicles ...]
+import sys
+import math
+import time
+import numpy as np
+from fleetsim import FleetSimulator
+from spatialindex import GridIndex
+from continuousquery import ContinuousQueries, MovingRegion
+from edgestate import AMBULANCE_RADIUS
+
+AMBULANCES = 50
+TICKS = 30
+CAR_UPDATES_PER_TICK = 2000
+AMBULANCE_SPEED = 17  # m/s
+
+
+def ambulance_paths(fleet):
+    """(ticks, ambulances) latitudes, longitudes and headings driving straight through the fleet"""
+    rng = np.random.default_rng(11)
+    headings = rng.uniform(0, 360, AMBULANCES)
+    start = rng.choice(fleet.count, AMBULANCES, replace=False)
+    steps = np.arange(TICKS)[:, None] * AMBULANCE_SPEED
+    north = steps * np.cos(np.radians(headings))
+    east = steps * np.sin(np.radians(headings))
+    latitudes = fleet.latitude[start] + north / 111320.0
+    longitudes = fleet.longitude[start] + east / (111320.0 * math.cos(math.radians(fleet.center[0])))
+    return latitudes, longitudes, headings
+
+
+def scratch(fleet, paths, car_moves):
+    index = GridIndex()
+    for car_id, lat, lon in zip(fleet.vehicle_ids, fleet.latitude.tolist(), fleet.longitude.tolist()):
+        index.update(car_id, lat, lon)
+    latitudes, longitudes, headings = paths
+    inside = {}
+    deltas = 0
+    elapsed = 0.0
+    for tick in range(TICKS):
+        for car_id, lat, lon in car_moves[tick]:
+            index.update(car_id, lat, lon)
+        start = time.perf_counter()
+        for a in range(AMBULANCES):
+            region = MovingRegion(latitudes[tick, a], longitudes[tick, a], AMBULANCE_RADIUS, headings[a])
+            found = list(index.candidates(region.latitude, region.longitude, region.reach))
+            current = set()
+            if found:
+                ids, lats, lons = zip(*found)
+                mask = region.contains(np.array(lats), np.array(lons))
+                current = {ids[i] for i in np.flatnonzero(mask).tolist()}
+            previous = inside.get(a, set())
+            deltas += len(current - previous) + len(previous - current)
+            inside[a] = current
+        elapsed += time.perf_counter() - start
+    return elapsed / (TICKS * AMBULANCES) * 1e6, deltas
+
+
+def incremental(fleet, paths, car_moves):
+    queries = ContinuousQueries(AMBULANCE_RADIUS)
+    for car_id, lat, lon in zip(fleet.vehicle_ids, fleet.latitude.tolist(), fleet.longitude.tolist()):
+        queries.update_car(car_id, lat, lon)
+    latitudes, longitudes, headings = paths
+    deltas = car_deltas = 0
+    elapsed = car_elapsed = 0.0
+    for tick in range(TICKS):
+        start = time.perf_counter()
+        for car_id, lat, lon in car_moves[tick]:
+            car_deltas += len(queries.update_car(car_id, lat, lon))
+        car_elapsed += time.perf_counter() - start
+        start = time.perf_counter()
+        for a in range(AMBULANCES):
+            deltas += len(queries.update_query(a, latitudes[tick, a], longitudes[tick, a], headings[a]))
+        elapsed += time.perf_counter() - start
+    inside = sum(len(members) for members in queries.members.values()) / AMBULANCES
+    return (elapsed / (TICKS * AMBULANCES) * 1e6, deltas, car_elapsed / (TICKS * CAR_UPDATES_PER_TICK) * 1e6,
+            car_deltas, inside)
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for vehicles in sizes:
+        fleet = FleetSimulator(vehicles, seed=9)
+        paths = ambulance_paths(fleet)
+        rng = np.random.default_rng(5)
+        car_moves = []
+        for _ in range(TICKS):
+            fleet.step(1.0)
+            moved = rng.choice(vehicles, min(CAR_UPDATES_PER_TICK, vehicles), replace=False)
+            car_moves.append([(fleet.vehicle_ids[i], float(fleet.latitude[i]), float(fleet.longitude[i]))
+                              for i in moved.tolist()])
+        fleet = FleetSimulator(vehicles, seed=9)
+        scratch_us, scratch_deltas = scratch(fleet, paths, car_moves)
+        query_us, query_deltas, car_us, car_deltas, inside = incremental(fleet, paths, car_moves)
+        print(f"{vehicles:8} vehicles | {inside:6.1f} cars per region | ambulance update: scratch {scratch_us:8.1f} us, "
+              f"incremental {query_us:8.1f} us | car update {car_us:5.1f} us | deltas: scratch {scratch_deltas}, "
+              f"incremental {query_deltas} + {car_deltas} from car updates")
+
+
+if __name__ == "__main__":
+    main()
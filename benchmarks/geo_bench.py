@@ -0,0 +1,75 @@
+# Distance kernels: per-pair geopy geodesic vs the batched geo tiers
+#
+# For each fleet size, times one point against every car (the ambulance and
+# nearby-car scans) and reports each tier's worst error against geopy.
+#
+# Run from the repository root:
+#     python -m benchmarks.geo_bench [car counts...]
+import sys
+import time
+import numpy as np
+from geopy.distance import geodesic
+import geo
+
+CENTER_LAT = 12.9716
+CENTER_LON = 77.5946
+SPREAD = 0.09
+RADIUS = 50
+# geopy is timed on at most this many pairs and extrapolated
+GEOPY_SAMPLE = 20000
+# Side of the many-to-many matrix benchmark
+MATRIX_SIZE = 2000
+
+
+def timed(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(count, rng):
+    lats = CENTER_LAT + rng.uniform(-SPREAD, SPREAD, count)
+    lons = CENTER_LON + rng.uniform(-SPREAD, SPREAD, count)
+
+    sample = min(count, GEOPY_SAMPLE)
+    start = time.perf_counter()
+    reference = np.array([geodesic((CENTER_LAT, CENTER_LON), (lat, lon)).meters
+                          for lat, lon in zip(lats[:sample].tolist(), lons[:sample].tolist())])
+    geopy_time = (time.perf_counter() - start) * count / sample
+    note = " (extrapolated)" if sample < count else ""
+    print(f"{count:>9} pairs | geopy per pair  {geopy_time * 1e3:10.2f} ms{note}")
+
+    for method in geo.METHODS:
+        elapsed, meters = timed(lambda: geo.distance(CENTER_LAT, CENTER_LON, lats, lons, method))
+        error = np.abs(meters[:sample] - reference).max()
+        print(f"{'':>15} | {method:<15} {elapsed * 1e3:10.2f} ms | speedup {geopy_time / elapsed:8.1f}x | "
+              f"max error {error:.6f} m")
+
+    elapsed, mask = timed(lambda: geo.within_radius(CENTER_LAT, CENTER_LON, lats, lons, RADIUS, "ellipsoidal"))
+    assert (mask[:sample] == (reference <= RADIUS)).all(), "within_radius disagrees with geopy"
+    print(f"{'':>15} | within {RADIUS} m (ellipsoidal) {elapsed * 1e3:7.2f} ms | {int(mask.sum())} inside")
+
+
+def run_matrix(rng):
+    lats = CENTER_LAT + rng.uniform(-SPREAD, SPREAD, MATRIX_SIZE)
+    lons = CENTER_LON + rng.uniform(-SPREAD, SPREAD, MATRIX_SIZE)
+    pairs = MATRIX_SIZE * MATRIX_SIZE
+    for method in geo.METHODS:
+        elapsed, _ = timed(lambda: geo.distance_matrix(lats, lons, lats, lons, method), repeat=1)
+        print(f"{MATRIX_SIZE}x{MATRIX_SIZE} matrix | {method:<15} {elapsed * 1e3:10.2f} ms | "
+              f"{pairs / elapsed / 1e6:8.1f} M pairs/s")
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 100000, 1000000]
+    rng = np.random.default_rng(42)
+    for count in counts:
+        run(count, rng)
+    run_matrix(rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Map matching throughput: searching every point vs incremental MapMatcher
+#
+# A synthetic city (a square street grid, 100 m blocks, a node every 50 m)
+# is written as an OSM XML extract and loaded with load_osm. Vehicles
+# drive along the streets at 8-20 m/s, turning at some intersections, and
+# report once per second with GPS noise. The "search" run forgets each
+# vehicle's previous match, so every point goes through the segment grid;
+# the incremental run keeps it. Accuracy counts points snapped to the
+# street the vehicle is actually on.
+#
+# Run from the repository root:
+#     python -m benchmarks.mapmatch_bench [streets per side] [vehicles] [ticks]
+import os
+import sys
+import math
+import time
+import tempfile
+import numpy as np
+from mapmatch import load_osm, MapMatcher
+from spatialindex import METERS_PER_DEGREE
+
+ORIGIN = (12.90, 77.50)
+BLOCK = 100  # meters between parallel streets
+NODE_SPACING = 50
+GPS_NOISE = 4  # meters, standard deviation per axis
+TURN_PROBABILITY = 0.3
+LON_SCALE = METERS_PER_DEGREE * math.cos(math.radians(ORIGIN[0]))
+
+
+def to_lat_lon(x, y):
+    return ORIGIN[0] + y / METERS_PER_DEGREE, ORIGIN[1] + x / LON_SCALE
+
+
+def node_id(i, j):
+    return i * 1000000 + j + 1
+
+
+def write_grid_osm(path, streets):
+    """Streets 1..streets run east-west, streets+1..2*streets north-south"""
+    steps = (streets - 1) * BLOCK // NODE_SPACING
+    per_block = BLOCK // NODE_SPACING
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6">\n')
+        for i in range(steps + 1):
+            for j in range(steps + 1):
+                if i % per_block and j % per_block:
+                    continue
+                lat, lon = to_lat_lon(i * NODE_SPACING, j * NODE_SPACING)
+                f.write(f'  <node id="{node_id(i, j)}" lat="{lat:.7f}" lon="{lon:.7f}"/>\n')
+        for axis in range(2):
+            for k in range(streets):
+                refs = [node_id(step, k * per_block) if axis == 0 else node_id(k * per_block, step)
+                        for step in range(steps + 1)]
+                highway, speed = ("primary", 60) if k % 5 == 0 else ("residential", 30)
+                f.write(f'  <way id="{axis * streets + k + 1}">\n')
+                f.write("".join(f'    <nd ref="{ref}"/>\n' for ref in refs))
+                f.write(f'    <tag k="highway" v="{highway}"/>\n    <tag k="maxspeed" v="{speed}"/>\n  </way>\n')
+        f.write("</osm>\n")
+
+
+def drive(streets, vehicles, ticks, seed=8):
+    """(ticks, vehicles) arrays of noisy latitudes, longitudes and the true way ids"""
+    rng = np.random.default_rng(seed)
+    length = (streets - 1) * BLOCK
+    axis = rng.integers(0, 2, vehicles)
+    line = rng.integers(0, streets, vehicles)
+    position = rng.uniform(0, length, vehicles)
+    direction = rng.choice([-1.0, 1.0], vehicles)
+    speed = rng.uniform(8, 20, vehicles)
+    latitudes = np.empty((ticks, vehicles))
+    longitudes = np.empty((ticks, vehicles))
+    ways = np.empty((ticks, vehicles), dtype=np.int64)
+    for tick in range(ticks):
+        moved = position + direction * speed
+        crossed = np.floor(moved / BLOCK) != np.floor(position / BLOCK)
+        turn = crossed & (rng.random(vehicles) < TURN_PROBABILITY)
+        corner = np.clip(np.round(moved / BLOCK), 0, streets - 1)
+        position = np.where(turn, line * BLOCK, moved)
+        line = np.where(turn, corner, line).astype(np.int64)
+        axis = np.where(turn, 1 - axis, axis)
+        direction = np.where(turn, rng.choice([-1.0, 1.0], vehicles), direction)
+        bounced = (position < 0) | (position > length)
+        position = np.clip(position, 0, length)
+        direction = np.where(bounced, -direction, direction)
+        x = np.where(axis == 0, position, line * BLOCK) + rng.normal(0, GPS_NOISE, vehicles)
+        y = np.where(axis == 0, line * BLOCK, position) + rng.normal(0, GPS_NOISE, vehicles)
+        latitudes[tick], longitudes[tick] = to_lat_lon(x, y)
+        ways[tick] = axis * streets + line + 1
+    return latitudes, longitudes, ways
+
+
+def run(network, latitudes, longitudes, ways, incremental):
+    matcher = MapMatcher(network)
+    ticks, vehicles = latitudes.shape
+    vehicle_ids = [f"car{i}" for i in range(vehicles)]
+    way_ids = np.array(network.way_ids)
+    correct = 0
+    start = time.perf_counter()
+    for tick in range(ticks):
+        row_lat, row_lon, row_way = latitudes[tick].tolist(), longitudes[tick].tolist(), ways[tick].tolist()
+        for vehicle_id, lat, lon, way in zip(vehicle_ids, row_lat, row_lon, row_way):
+            if not incremental:
+                matcher.forget(vehicle_id)
+            segment = matcher.match(vehicle_id, lat, lon)
+            correct += segment is not None and way_ids[network.way[segment]] == way
+    elapsed = time.perf_counter() - start
+    points = ticks * vehicles
+    return points / elapsed, correct / points, matcher.sticky / points
+
+
+def main():
+    streets = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    vehicles = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+    directory = tempfile.mkdtemp(prefix="mapmatch-bench-")
+    path = os.path.join(directory, "grid.osm")
+    try:
+        write_grid_osm(path, streets)
+        start = time.perf_counter()
+        network = load_osm(path)
+        print(f"load_osm  : {len(network)} segments, {len(network.way_ids)} ways, "
+              f"{os.path.getsize(path) / 1e6:.1f} MB in {time.perf_counter() - start:.2f} s")
+    finally:
+        os.remove(path)
+        os.rmdir(directory)
+    latitudes, longitudes, ways = drive(streets, vehicles, ticks)
+    for label, incremental in (("search", False), ("incremental", True)):
+        rate, accuracy, sticky = run(network, latitudes, longitudes, ways, incremental)
+        print(f"{label:<11} : {rate:9.0f} points/s | {accuracy:6.1%} on the true street | "
+              f"{sticky:6.1%} kept the previous segment")
+
+
+if __name__ == "__main__":
+    main()
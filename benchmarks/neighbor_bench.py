@@ -0,0 +1,75 @@
+# Nearby-speeder lookup in comb5: full fleet scan vs VehicleRegistry.neighbors
+#
+# The fleet is loaded into both structures, then a burst of speeding events
+# asks for the cars within the alert distance of each speeder. The scan is
+# the previous comb5 code path (one batched haversine over every car); the
+# gridded registry only looks at the surrounding cells and reuses cached
+# lists while the neighborhood has not moved.
+#
+# Run from the repository root:
+#     python -m benchmarks.neighbor_bench [car counts...]
+import sys
+import time
+import numpy as np
+from fleetsim import FleetSimulator
+from geo import within_radius
+from registry import VehicleRegistry
+
+RADIUS = 50
+EVENTS = 2000
+# Above this fleet size the scan is timed on fewer events and extrapolated
+SCAN_SAMPLE = 100000
+
+
+def full_scan(car_locations, vehicle_id):
+    latitude, longitude = car_locations[vehicle_id]
+    other_ids = list(car_locations)
+    coords = np.array(list(car_locations.values()), dtype=np.float64)
+    nearby = within_radius(latitude, longitude, coords[:, 0], coords[:, 1], RADIUS)
+    return [other_ids[i] for i in np.flatnonzero(nearby).tolist() if other_ids[i] != vehicle_id]
+
+
+def run(count, rng):
+    fleet = FleetSimulator(count, seed=int(rng.integers(1 << 31)))
+    car_locations = dict(zip(fleet.vehicle_ids, zip(fleet.latitude.tolist(), fleet.longitude.tolist())))
+    index = VehicleRegistry(cell_size=RADIUS)
+    start = time.perf_counter()
+    for vehicle_id, (lat, lon) in car_locations.items():
+        index.update(vehicle_id, lat, lon)
+    build = time.perf_counter() - start
+    speeders = [fleet.vehicle_ids[i] for i in rng.integers(0, count, EVENTS).tolist()]
+
+    start = time.perf_counter()
+    cold = [sorted(index.neighbors(vehicle_id, RADIUS)) for vehicle_id in speeders]
+    cold_time = (time.perf_counter() - start) / EVENTS
+
+    # Speeders keep reporting while only a few cars around them move
+    movers = rng.integers(0, count, EVENTS // 10).tolist()
+    for i in movers:
+        index.update(fleet.vehicle_ids[i], fleet.latitude[i] + 1e-5, fleet.longitude[i])
+        car_locations[fleet.vehicle_ids[i]] = (fleet.latitude[i] + 1e-5, fleet.longitude[i])
+    start = time.perf_counter()
+    warm = [sorted(index.neighbors(vehicle_id, RADIUS)) for vehicle_id in speeders]
+    warm_time = (time.perf_counter() - start) / EVENTS
+
+    scanned = max(1, min(EVENTS, SCAN_SAMPLE * 10 // count))
+    start = time.perf_counter()
+    expected = [sorted(full_scan(car_locations, vehicle_id)) for vehicle_id in speeders[:scanned]]
+    scan_time = (time.perf_counter() - start) / scanned
+    assert expected == warm[:scanned], "index and full scan disagree"
+
+    neighbors = sum(len(found) for found in cold) / EVENTS
+    print(f"{count:>9} cars | build {build:7.2f} s | scan {scan_time * 1e3:9.3f} ms/event | "
+          f"index cold {cold_time * 1e6:7.1f} us | warm {warm_time * 1e6:7.1f} us | "
+          f"speedup {scan_time / warm_time:9.1f}x | {neighbors:.1f} neighbors/event")
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    rng = np.random.default_rng(42)
+    for count in counts:
+        run(count, rng)
+
+
+if __name__ == "__main__":
+    main()
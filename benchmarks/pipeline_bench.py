@@ -0,0 +1,189 @@
+# End-to-end pipeline benchmark driven by the fleet simulator
+#
+# Every stage runs on an in-process LoopbackBroker: the simulator publishes,
+# the component's real on_message handles the message, and latency is taken
+# from just before publish to the handler returning. Memory is the growth in
+# peak RSS while the stage runs.
+#
+# Run from the repository root, e.g.:
+#     python -m benchmarks.pipeline_bench --vehicles 100000 --ticks 3
+#     python -m benchmarks.pipeline_bench --vehicles 1000000 --ticks 1 --stages edge
+import os
+import io
+import json
+import time
+import argparse
+import resource
+import contextlib
+import numpy as np
+# Components create their module-level clients at import; keep them offline
+os.environ.setdefault("MQTT_TRANSPORT", "loopback")
+
+from codec import encode_binary
+from fleetsim import FleetSimulator, json_frame
+from telemetry import TOPIC_VEHICLE_STATUS_FRAME
+from transport import LoopbackBroker, LoopbackClient
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class LatencyRecorder:
+    """Wraps an on_message handler and records publish-to-done latency"""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.sent_at = 0.0
+        self.latencies = []
+
+    def on_message(self, client, userdata, msg):
+        self.handler(client, userdata, msg)
+        self.latencies.append(time.perf_counter() - self.sent_at)
+
+    def publish(self, client, topic, payload):
+        self.sent_at = time.perf_counter()
+        client.publish(topic, payload)
+
+
+def report(stage, readings, elapsed, latencies, rss_before, extra=""):
+    latencies = np.asarray(latencies) * 1e3
+    p50, p99 = np.percentile(latencies, [50, 99]) if len(latencies) else (0, 0)
+    print(f"{stage:<10} {readings / elapsed:12.0f} readings/s | p50 {p50:8.3f} ms | p99 {p99:8.3f} ms | "
+          f"+{peak_rss_mb() - rss_before:7.1f} MB peak RSS{extra}")
+
+
+def encode_frames(fleet, batch_size, binary):
+    if binary:
+        return [encode_binary(frame, delta=True) for frame in fleet.frames(batch_size)]
+    return [json.dumps(json_frame(frame)).encode() for frame in fleet.frames(batch_size)]
+
+
+def bench_edge(fleet, args):
+    try:
+        import edgeserver
+    except ImportError as e:
+        print(f"edge       skipped: {e}")
+        return
+    broker = LoopbackBroker()
+    recorder = LatencyRecorder(edgeserver.on_message)
+    edge = LoopbackClient("edge", broker)
+    edge.on_connect = edgeserver.on_connect
+    edge.on_message = recorder.on_message
+    publisher = LoopbackClient("fleet", broker)
+
+    rss_before = peak_rss_mb()
+    elapsed = 0.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        edge.connect()
+        for _ in range(args.ticks):
+            fleet.step(1.0)
+            payloads = encode_frames(fleet, args.batch, args.binary)
+            start = time.perf_counter()
+            for payload in payloads:
+                recorder.publish(publisher, TOPIC_VEHICLE_STATUS_FRAME, payload)
+            elapsed += time.perf_counter() - start
+    memory = edgeserver.trajectories.memory_report()
+    report("edge", fleet.count * args.ticks, elapsed, recorder.latencies, rss_before,
+           f" | {memory['vehicles']} vehicles tracked, {memory['bytes_per_vehicle']:.0f} B/vehicle, "
+           f"{memory['kept_ratio']:.1%} of readings kept")
+
+
+def bench_comb5(fleet, args):
+    import comb5
+    broker = LoopbackBroker()
+    recorder = LatencyRecorder(comb5.on_message)
+    alerts = [0]
+
+    def count_alert(client, userdata, msg):
+        alerts[0] += 1
+
+    node = LoopbackClient("comb5", broker)
+    node.on_connect = comb5.on_connect
+    node.on_message = recorder.on_message
+    watcher = LoopbackClient("alerts", broker)
+    watcher.on_message = count_alert
+    watcher.subscribe("alert/#")
+    publisher = LoopbackClient("fleet", broker)
+    comb5.window_store.log_path = None
+
+    # comb5 handles one reading per message, so it gets a slice of the fleet
+    vehicles = min(fleet.count, args.comb5_vehicles)
+    rss_before = peak_rss_mb()
+    elapsed = 0.0
+    with contextlib.redirect_stdout(io.StringIO()):
+        node.connect()
+        comb5.alert_scheduler.start()
+        for _ in range(args.ticks):
+            fleet.step(1.0)
+            payloads = [json.dumps(reading).encode() for reading in fleet.readings(0, vehicles)]
+            start = time.perf_counter()
+            for payload in payloads:
+                recorder.publish(publisher, comb5.topics[0], payload)
+            elapsed += time.perf_counter() - start
+        comb5.alert_scheduler.stop()
+    report("comb5", vehicles * args.ticks, elapsed, recorder.latencies, rss_before,
+           f" | {alerts[0]} alerts published")
+
+
+def bench_mainserver(fleet, args):
+    import mainserver
+    broker = LoopbackBroker()
+    recorder = LatencyRecorder(mainserver.on_message)
+    server = LoopbackClient("main", broker)
+    server.on_connect = mainserver.on_connect
+    server.on_message = recorder.on_message
+    publisher = LoopbackClient("fleet", broker)
+
+    events = min(fleet.count, args.events)
+    rss_before = peak_rss_mb()
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.connect()
+        payloads = [json.dumps(reading).encode() for reading in fleet.readings(0, events)]
+        start = time.perf_counter()
+        for payload in payloads:
+            recorder.publish(publisher, "traffic", payload)
+        elapsed = time.perf_counter() - start
+    report("main ingest", events, elapsed, recorder.latencies, rss_before)
+
+    # Query latency: newest page, a time range, and cursor paging
+    http = mainserver.app.test_client()
+    now = time.time()
+    queries = ["/get_data/traffic?limit=100", f"/get_data/traffic?since={now - 1}&limit=100"]
+    queries += [f"/get_data/traffic?cursor={cursor}&limit=100" for cursor in range(0, events, max(1, events // 200))]
+    latencies = []
+    for url in queries * 5:
+        start = time.perf_counter()
+        response = http.get(url)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.data
+    latencies = np.asarray(latencies) * 1e3
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"main query {len(latencies) / (latencies.sum() / 1e3):12.0f} queries/s  | "
+          f"p50 {p50:8.3f} ms | p99 {p99:8.3f} ms")
+
+
+STAGES = {"edge": bench_edge, "comb5": bench_comb5, "main": bench_mainserver}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark")
+    parser.add_argument("--vehicles", type=int, default=100000, help="fleet size")
+    parser.add_argument("--ticks", type=int, default=3, help="simulated seconds per stage")
+    parser.add_argument("--batch", type=int, default=1000, help="readings per frame for the edge stage")
+    parser.add_argument("--binary", action="store_true", help="publish binary frames instead of JSON")
+    parser.add_argument("--comb5-vehicles", type=int, default=20000, help="fleet slice sent to comb5")
+    parser.add_argument("--events", type=int, default=100000, help="traffic events ingested by mainserver")
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    fleet = FleetSimulator(args.vehicles, seed=args.seed)
+    print(f"simulated {args.vehicles} vehicles in {time.perf_counter() - start:.2f} s")
+    for stage in args.stages:
+        STAGES[stage](fleet, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Emergency latency under rising telemetry load: one on_message thread vs priority lanes
+#
+# A publisher thread floods telemetry at a fixed rate while an accident is
+# sent every few milliseconds. Telemetry messages are 200-reading frames. The "single" run is the old setup: paho's
+# network thread runs on_message for every message in arrival order. The
+# "lanes" run puts PriorityDispatcher in front of the same handler. Both the
+# edge server (myvehiclestatus/frame) and the main server (myvehiclestatus)
+# are measured. Latency is publish -> accident handled.
+#
+# Run from the repository root:
+#     python -m benchmarks.priority_bench [messages/s ...]
+import os
+import io
+import sys
+import json
+import time
+import contextlib
+import numpy as np
+os.environ.setdefault("MQTT_TRANSPORT", "loopback")
+
+from fleetsim import FleetSimulator, json_frame
+from telemetry import TOPIC_VEHICLE_STATUS_FRAME
+from transport import LoopbackBroker, LoopbackClient
+from priority import PriorityDispatcher
+import edgeserver
+import mainserver
+
+DURATION = 2.0  # seconds of load per run
+FRAME_SIZE = 200  # readings per edge telemetry frame
+ACCIDENT_INTERVAL = 0.005  # seconds between accident events
+ACCIDENT = "accident"
+
+
+def build_frames():
+    fleet = FleetSimulator(FRAME_SIZE * 50, seed=1)
+    return [json.dumps(json_frame(frame)).encode() for frame in fleet.frames(FRAME_SIZE)]
+
+
+# Handler, priorities and telemetry topic per server; both get the same frames
+SERVERS = {
+    "edge": (edgeserver.on_connect, edgeserver.on_message, edgeserver.TOPIC_PRIORITIES, TOPIC_VEHICLE_STATUS_FRAME),
+    "main": (mainserver.on_connect, mainserver.on_message, mainserver.TOPIC_PRIORITIES, "myvehiclestatus"),
+}
+
+
+def publish_load(publisher, rate, topic, payloads):
+    """Publish payloads at rate per second and an accident every ACCIDENT_INTERVAL"""
+    start = time.perf_counter()
+    next_accident = start
+    sent = accidents = 0
+    while True:
+        now = time.perf_counter()
+        if now - start >= DURATION:
+            break
+        if now >= next_accident:
+            publisher.publish(ACCIDENT, json.dumps({"sent": now, "message": "Accident reported"}))
+            next_accident += ACCIDENT_INTERVAL
+            accidents += 1
+        due = int((now - start) * rate)
+        while sent < due:
+            publisher.publish(topic, payloads[sent % len(payloads)])
+            sent += 1
+        time.sleep(0.0002)
+    return sent, accidents
+
+
+def run(server, rate, lanes, payloads):
+    on_connect, on_message, priorities, topic = SERVERS[server]
+    latencies = []
+
+    def handle(client, userdata, msg):
+        on_message(client, userdata, msg)
+        if msg.topic == ACCIDENT:
+            latencies.append(time.perf_counter() - json.loads(msg.payload)["sent"])
+
+    broker = LoopbackBroker()
+    client = LoopbackClient(server, broker, threaded=True)
+    client.on_connect = on_connect
+    dispatcher = None
+    if lanes:
+        dispatcher = PriorityDispatcher(handle, priorities, component=f"bench_{server}")
+        dispatcher.start()
+        client.on_message = dispatcher.on_message
+    else:
+        client.on_message = handle
+    client.connect()
+    client.loop_start()
+    publisher = LoopbackClient("load", broker)
+    publisher.connect()
+    sent, accidents = publish_load(publisher, rate, topic, payloads)
+    # Wait for what is left so accidents stuck behind the flood are measured
+    while client.inbox.qsize() or (dispatcher is not None and len(dispatcher)):
+        time.sleep(0.01)
+    client.loop_stop()
+    dropped = 0
+    if dispatcher is not None:
+        dispatcher.stop()
+        dropped = sum(dispatcher.lanes.dropped.values())
+    return latencies, accidents, sent, dropped
+
+
+def report(server, label, rate, result):
+    latencies, accidents, sent, dropped = result
+    latencies = np.asarray(latencies) * 1e3
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"{server:<5} {label:<6} {rate:6} msg/s | accident p50 {p50:9.2f} ms | p99 {p99:9.2f} ms | "
+          f"{len(latencies):4}/{accidents} accidents handled | {sent:6} telemetry | dropped {dropped:6}")
+
+
+def main():
+    rates = [int(arg) for arg in sys.argv[1:]] or [100, 500, 2000, 5000]
+    payloads = build_frames()
+    for server in SERVERS:
+        for rate in rates:
+            with contextlib.redirect_stdout(io.StringIO()):
+                single = run(server, rate, False, payloads)
+                lanes = run(server, rate, True, payloads)
+            report(server, "single", rate, single)
+            report(server, "lanes", rate, lanes)
+
+
+if __name__ == "__main__":
+    main()
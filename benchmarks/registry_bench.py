@@ -0,0 +1,109 @@
+# Vehicle state: per-module dicts and a grid index vs one gridded VehicleRegistry
+#
+# Memory (tracemalloc) of the latest state for N vehicles in two layouts:
+# comb5's old car_locations (id -> (lat, lon)) and car_speeds (id -> speed)
+# dicts plus the grid index over the same positions (GridIndex, which
+# NeighborIndex extended), against one VehicleRegistry with a 50 m grid
+# holding position, speed, heading and last_seen. Vehicle id strings exist
+# before measuring, so only what each layout adds is counted. Then update
+# cost per reading and two fleet-wide scans: vehicles within 500 m of a
+# point and the mean speed.
+#
+# Run from the repository root:
+#     python -m benchmarks.registry_bench [vehicles]
+import sys
+import time
+import tracemalloc
+import numpy as np
+from fleetsim import FleetSimulator
+from geo import within_radius
+from registry import VehicleRegistry
+from spatialindex import GridIndex
+
+CELL_SIZE = 50
+SCAN_RADIUS = 500
+SCANS = 20
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return result, used
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    fleet = FleetSimulator(count, seed=12)
+    ids = fleet.vehicle_ids
+    now = time.time()
+
+    def dicts_and_index():
+        locations = dict(zip(ids, zip(fleet.latitude.tolist(), fleet.longitude.tolist())))
+        speeds = dict(zip(ids, fleet.speed.tolist()))
+        index = GridIndex(CELL_SIZE)
+        for vehicle_id, (lat, lon) in locations.items():
+            index.update(vehicle_id, lat, lon)
+        return locations, speeds, index
+
+    def registry():
+        vehicles = VehicleRegistry(cell_size=CELL_SIZE)
+        vehicles.update_many(ids, fleet.latitude, fleet.longitude, fleet.speed, np.degrees(fleet.heading), now)
+        return vehicles
+
+    (locations, speeds, index), dict_bytes = measure(dicts_and_index)
+    vehicles, registry_bytes = measure(registry)
+    print(f"memory    : location+speed dicts and grid index {dict_bytes / count:6.1f} B/vehicle | "
+          f"gridded registry (5 fields) {registry_bytes / count:6.1f} B/vehicle "
+          f"({vehicles.nbytes() / count:.0f} B of columns)")
+
+    rows = np.arange(min(count, 100000))
+    moved = fleet.latitude[rows] + 2e-4  # ~22 m north, so some readings change cell
+    sample = list(zip([ids[i] for i in rows.tolist()], moved.tolist(), fleet.longitude[rows].tolist(),
+                      fleet.speed[rows].tolist()))
+    start = time.perf_counter()
+    for vehicle_id, lat, lon, speed in sample:
+        speeds[vehicle_id] = speed
+        locations[vehicle_id] = (lat, lon)
+        index.update(vehicle_id, lat, lon)
+    dict_update = (time.perf_counter() - start) / len(sample) * 1e6
+    start = time.perf_counter()
+    for vehicle_id, lat, lon, speed in sample:
+        vehicles.update(vehicle_id, lat, lon, speed, timestamp=now)
+    registry_update = (time.perf_counter() - start) / len(sample) * 1e6
+    print(f"update    : dicts and index {dict_update:5.2f} us/reading | registry {registry_update:5.2f} us/reading")
+
+    center = fleet.center
+    start = time.perf_counter()
+    for _ in range(SCANS):
+        coords = np.array(list(locations.values()))
+        mask = within_radius(center[0], center[1], coords[:, 0], coords[:, 1], SCAN_RADIUS)
+        near_dicts = [vehicle_id for vehicle_id, inside in zip(locations, mask.tolist()) if inside]
+    dict_scan = (time.perf_counter() - start) / SCANS * 1e3
+    start = time.perf_counter()
+    for _ in range(SCANS):
+        near_index = index.query_radius(center[0], center[1], SCAN_RADIUS, exact=False)
+    index_scan = (time.perf_counter() - start) / SCANS * 1e3
+    start = time.perf_counter()
+    for _ in range(SCANS):
+        near_registry = vehicles.within_radius(center[0], center[1], SCAN_RADIUS)
+    registry_scan = (time.perf_counter() - start) / SCANS * 1e3
+    assert sorted(near_dicts) == sorted(near_registry)
+
+    start = time.perf_counter()
+    for _ in range(SCANS):
+        sum(speeds.values()) / len(speeds)
+    dict_mean = (time.perf_counter() - start) / SCANS * 1e3
+    start = time.perf_counter()
+    for _ in range(SCANS):
+        vehicles.mean("speed")
+    registry_mean = (time.perf_counter() - start) / SCANS * 1e3
+    print(f"within {SCAN_RADIUS} m: dict scan {dict_scan:7.1f} ms, grid index {index_scan:6.1f} ms, "
+          f"registry {registry_scan:6.1f} ms ({len(near_registry)} vehicles, {len(near_index)} from the index)")
+    print(f"mean speed: dicts {dict_mean:6.1f} ms, registry {registry_mean:5.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
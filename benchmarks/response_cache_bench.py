@@ -0,0 +1,99 @@
+# Dashboard polling of mainserver /get_data with and without the response cache
+#
+# Many clients poll the same page of a topic while new events trickle in
+# (one event per POLLS_PER_EVENT requests). Runs: cache disabled, cache
+# with plain requests, cache with clients revalidating by ETag
+# (If-None-Match -> 304) and cache with gzip accepted. Requests go through
+# Flask's test client, so the numbers include routing and header handling.
+# Finally checks that rows past max_age are never served from the cache.
+#
+# Run from the repository root:
+#     python -m benchmarks.response_cache_bench [requests] [page size]
+import os
+import io
+import sys
+import json
+import time
+import contextlib
+os.environ.setdefault("MQTT_TRANSPORT", "loopback")
+
+from fleetsim import FleetSimulator
+from transport import LoopbackMessage
+import mainserver
+
+TOPIC = "traffic"
+ROWS = 20000
+POLLS_PER_EVENT = 50
+
+
+def build_events(count):
+    fleet = FleetSimulator(count, seed=4)
+    return [json.dumps({"vehicle_id": reading["vehicle_id"], "latitude": reading["latitude"],
+                        "longitude": reading["longitude"], "speed": reading["speed"]}).encode()
+            for reading in fleet.readings()]
+
+
+def run(http, events, requests, query, max_entries, revalidate=False, gzip=False):
+    mainserver.response_cache.max_entries = max_entries
+    etag = None
+    sent = 0
+    not_modified = 0
+    headers = {"Accept-Encoding": "gzip"} if gzip else {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for i in range(requests):
+            if i % POLLS_PER_EVENT == 0:
+                mainserver.on_message(None, None, LoopbackMessage(TOPIC, events[i % len(events)], 0, False))
+            if revalidate and etag is not None:
+                headers["If-None-Match"] = etag
+            response = http.get(query, headers=headers)
+            etag = response.headers.get("ETag")
+            not_modified += response.status_code == 304
+            sent += len(response.data)
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, sent / requests, not_modified / requests
+
+
+def check_expiry(http, topic="roadcondition", max_age=1):
+    """A cached body must not outlive the rows in it: expiry bumps the topic's version"""
+    store = mainserver.data_store[topic]
+    saved, store.max_age = store.max_age, max_age
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            mainserver.on_message(None, None, LoopbackMessage(topic, b'{"a": 1}', 0, False))
+        cursor = store.first_seq
+        queries = [f"/get_data/{topic}", f"/get_data/{topic}?cursor={cursor}"]
+        for query in queries:
+            assert http.get(query).get_json() == [{"a": 1}], query
+        time.sleep(max_age * 1.5)
+        for query in queries:
+            assert http.get(query).get_json() == [], query
+    finally:
+        store.max_age = saved
+    print("expired rows are not served from the cache")
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    page = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    events = build_events(ROWS)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for payload in events:
+            mainserver.on_message(None, None, LoopbackMessage(TOPIC, payload, 0, False))
+    http = mainserver.app.test_client()
+    now = time.time()
+    queries = {"time range": f"/get_data/{TOPIC}?since={now - 3600}&limit={page}",
+               "cursor page": f"/get_data/{TOPIC}?cursor={ROWS // 2}&limit={page}"}
+    runs = [("no cache", 0, False, False), ("cache", mainserver.response_cache.max_entries, False, False),
+            ("cache+etag", mainserver.response_cache.max_entries, True, False),
+            ("cache+gzip", mainserver.response_cache.max_entries, False, True)]
+    for name, query in queries.items():
+        for label, max_entries, revalidate, gzip in runs:
+            rate, size, not_modified = run(http, events, requests, query, max_entries, revalidate, gzip)
+            print(f"{name:<11} {label:<10} : {rate:8.0f} requests/s | {size / 1024:7.1f} KiB/response | "
+                  f"{not_modified:6.1%} 304")
+    check_expiry(http)
+
+
+if __name__ == "__main__":
+    main()
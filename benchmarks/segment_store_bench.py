@@ -0,0 +1,106 @@
+# mainserver storage: in-memory TopicStore vs on-disk SegmentStore
+#
+# Ingests traffic-style events into both stores, then times get_data-style
+# range queries. The in-memory path is query + json.dumps of the page (what
+# jsonify did); the segment path joins the stored JSON bytes sliced from the
+# mapped files. Restart compares opening the segment directory plus the
+# first query against replaying a JSONL log of the same events into memory.
+#
+# Run from the repository root:
+#     python -m benchmarks.segment_store_bench [events] [page size]
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import numpy as np
+from fleetsim import FleetSimulator
+from topicstore import TopicStore
+from segmentstore import SegmentStore
+
+QUERIES = 200
+
+
+def build_events(count):
+    fleet = FleetSimulator(count, seed=5)
+    return [{"vehicle_id": reading["vehicle_id"], "latitude": reading["latitude"], "longitude": reading["longitude"],
+             "speed": reading["speed"], "congestion": "high" if reading["speed"] < 20 else "low"}
+            for reading in fleet.readings()]
+
+
+def ingest(store, events, timestamps):
+    start = time.perf_counter()
+    for event, timestamp in zip(events, timestamps.tolist()):
+        store.append(event, timestamp)
+    return len(events) / (time.perf_counter() - start)
+
+
+def time_queries(windows, run):
+    start = time.perf_counter()
+    for since, until in windows:
+        run(since, until)
+    return (time.perf_counter() - start) / len(windows) * 1e6
+
+
+def disk_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    page = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    events = build_events(count)
+    now = time.time()
+    timestamps = now - count * 0.01 + np.arange(count) * 0.01  # 100 events/s ending now
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(timestamps[0], timestamps[-1], QUERIES)
+    windows = [(float(since), float(since) + page * 0.01) for since in starts]
+    directory = tempfile.mkdtemp(prefix="segment-bench-")
+    log_path = os.path.join(directory, "replay.jsonl")
+    store_dir = os.path.join(directory, "traffic")
+    try:
+        memory = TopicStore(count, None)
+        disk = SegmentStore(store_dir, count, None)
+        print(f"ingest    : memory {ingest(memory, events, timestamps):9.0f} rows/s | "
+              f"segments {ingest(disk, events, timestamps):9.0f} rows/s | "
+              f"{disk_bytes(store_dir) / count:.0f} B/row on disk in {len(disk.segments)} segments")
+
+        def memory_page(since, until):
+            rows, _ = memory.query(since, until, None, page)
+            return json.dumps(rows).encode()
+
+        def disk_page(since, until):
+            rows, _ = disk.query_raw(since, until, None, page)
+            return b"[" + b",".join(rows) + b"]"
+
+        assert json.loads(memory_page(*windows[0])) == json.loads(disk_page(*windows[0]))
+        print(f"get_data  : memory {time_queries(windows, memory_page):9.0f} us/page | "
+              f"segments {time_queries(windows, disk_page):9.0f} us/page | {page} rows per page")
+        disk.close()
+
+        with open(log_path, "w") as f:
+            for event, timestamp in zip(events, timestamps.tolist()):
+                f.write(json.dumps({"t": timestamp, "data": event}) + "\n")
+        start = time.perf_counter()
+        replayed = TopicStore(count, None)
+        with open(log_path) as f:
+            for line in f:
+                record = json.loads(line)
+                replayed.append(record["data"], record["t"])
+        memory_page(*windows[0])
+        replay_time = time.perf_counter() - start
+        start = time.perf_counter()
+        reopened = SegmentStore(store_dir, count, None)
+        rows, _ = reopened.query_raw(*windows[0], None, page)
+        open_time = time.perf_counter() - start
+        mapped = sum(segment.maps is not None for segment in reopened.segments)
+        print(f"restart   : replay log {replay_time * 1e3:9.1f} ms | open segments {open_time * 1e3:9.1f} ms "
+              f"({mapped} of {len(reopened.segments)} segments mapped by the first query)")
+        reopened.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Edge vehicle-status ingestion: one in-process EdgeState vs ShardedEdge workers
+#
+# The router is fed raw payloads directly, standing in for the broker.
+#
+# Run from the repository root:
+#     python -m benchmarks.sharded_edge_bench [messages] [vehicles] [shard counts...]
+import os
+import io
+import sys
+import json
+import time
+import random
+import contextlib
+from codec import decode
+from edgestate import EdgeState
+from shardededge import ShardedEdge
+
+
+def build_payloads(messages, vehicles):
+    payloads = []
+    for i in range(messages):
+        payloads.append(json.dumps({
+            "vehicle_id": f"car{i % vehicles}",
+            "latitude": 12.9716 + random.uniform(-0.05, 0.05),
+            "longitude": 77.5946 + random.uniform(-0.05, 0.05),
+            "speed": random.uniform(0, 150),
+        }).encode())
+    return payloads
+
+
+def run_single(payloads):
+    state = EdgeState()
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for payload in payloads:
+            state.handle_vehicle_status(decode(payload), time.time())
+        return time.perf_counter() - start
+
+
+def run_sharded(payloads, shards):
+    edge = ShardedEdge(shards, quiet=True)
+    edge.start()
+    edge.stats()  # Wait until every worker is up
+    start = time.perf_counter()
+    for payload in payloads:
+        edge.submit_status(payload, time.time())
+    totals = edge.stats()
+    elapsed = time.perf_counter() - start
+    edge.stop()
+    return elapsed, totals
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    vehicles = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    shard_counts = [int(arg) for arg in sys.argv[3:]] or sorted({1, 2, os.cpu_count() or 1})
+    random.seed(42)
+    payloads = build_payloads(messages, vehicles)
+
+    elapsed = run_single(payloads)
+    print(f"in-process  : {messages / elapsed:10.0f} msg/s")
+    for shards in shard_counts:
+        elapsed, totals = run_sharded(payloads, shards)
+        print(f"{shards:2} shard(s) : {messages / elapsed:10.0f} msg/s ({totals['vehicles']} vehicles tracked)")
+    print(f"({os.cpu_count()} CPU cores available)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Ambulance proximity lookup: GridIndex vs the old linear geodesic scan
+#
+# Run from the repository root:
+#     python -m benchmarks.spatialindex_bench [car counts...]
+import sys
+import time
+import random
+from geopy.distance import geodesic
+from spatialindex import GridIndex
+
+# Cars are spread over a square of roughly 20 km around Bangalore
+CENTER_LAT = 12.9716
+CENTER_LON = 77.5946
+SPREAD = 0.09
+RADIUS = 50
+QUERIES = 100
+# Above this fleet size the linear scan is timed on a sample and extrapolated
+LINEAR_SAMPLE = 100000
+
+
+def generate_cars(count):
+    return {
+        f"car{i}": (CENTER_LAT + random.uniform(-SPREAD, SPREAD), CENTER_LON + random.uniform(-SPREAD, SPREAD))
+        for i in range(count)
+    }
+
+
+# The original edgeserver TOPIC_AMBLOC loop
+def linear_scan(car_locations, ambulance_coords):
+    cars_within_radius = []
+    for car_id, car_coords in car_locations.items():
+        if geodesic(ambulance_coords, car_coords).meters <= RADIUS:
+            cars_within_radius.append(car_id)
+    return cars_within_radius
+
+
+def run(count):
+    car_locations = generate_cars(count)
+    ambulances = [(CENTER_LAT + random.uniform(-SPREAD, SPREAD), CENTER_LON + random.uniform(-SPREAD, SPREAD))
+                  for _ in range(QUERIES)]
+
+    start = time.perf_counter()
+    index = GridIndex()
+    for car_id, (lat, lon) in car_locations.items():
+        index.update(car_id, lat, lon)
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    grid_results = [sorted(index.query_radius(lat, lon, RADIUS)) for lat, lon in ambulances]
+    grid = (time.perf_counter() - start) / QUERIES
+
+    # The linear scan is far too slow to repeat at 1M cars, so time fewer queries
+    linear_queries = max(1, min(QUERIES, LINEAR_SAMPLE // count))
+    scanned = car_locations
+    if count > LINEAR_SAMPLE:
+        scanned = dict(list(car_locations.items())[:LINEAR_SAMPLE])
+    start = time.perf_counter()
+    linear_results = [sorted(linear_scan(scanned, ambulances[i])) for i in range(linear_queries)]
+    linear = (time.perf_counter() - start) / linear_queries * (count / len(scanned))
+
+    if scanned is car_locations:
+        assert linear_results == grid_results[:linear_queries], "grid and linear scan disagree"
+    note = " (extrapolated)" if scanned is not car_locations else ""
+    print(f"{count:>9} cars | build {build:8.3f} s | grid {grid * 1e3:9.3f} ms/query | "
+          f"linear {linear * 1e3:11.3f} ms/query{note} | speedup {linear / grid:10.1f}x")
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 100000, 1000000]
+    random.seed(42)
+    for count in counts:
+        run(count)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Map heatmap refresh: client-side aggregation of raw events vs precomputed tiles
+#
+# Traffic events from the simulated fleet accumulate over a growing
+# history. The raw run is what the Leaflet page would have to do without
+# tiles: page through /get_data for the last half hour (read_raw pages of
+# MAX_QUERY_LIMIT rows, JSON-decoded as a browser would), then bin every
+# event into the viewport's cells. The tile run fetches the viewport's
+# tiles from a TileAggregator fed the same events. Both cover a
+# 1280 x 768 viewport at zoom 13 (6 x 4 tiles).
+#
+# Run from the repository root:
+#     python -m benchmarks.tile_bench [events ...]
+import sys
+import json
+import time
+from fleetsim import FleetSimulator
+from topicstore import TopicStore
+from tiles import TileAggregator, tile_coordinates, DETAIL_LEVELS, MAX_ZOOM
+
+ZOOM = 13
+VIEWPORT = (6, 4)  # tiles across, tiles down
+HISTORY_SECONDS = 3600
+WINDOW_SECONDS = 1800
+PAGE = 10000
+REFRESHES = 5
+
+
+def viewport_tiles(fleet):
+    x, y = tile_coordinates(*fleet.center, ZOOM)
+    columns, rows = VIEWPORT
+    return [(x + dx - columns // 2, y + dy - rows // 2) for dx in range(columns) for dy in range(rows)]
+
+
+def raw_refresh(store, since, tiles):
+    wanted = set(tiles)
+    shift = MAX_ZOOM - ZOOM - DETAIL_LEVELS
+    cells = {}
+    cursor = None
+    while True:
+        rows, cursor = store.query_raw(since, None, cursor, PAGE)
+        for event in json.loads(b"[" + b",".join(rows) + b"]"):
+            x, y = tile_coordinates(event["latitude"], event["longitude"])
+            if (x >> (MAX_ZOOM - ZOOM), y >> (MAX_ZOOM - ZOOM)) in wanted:
+                cell = cells.setdefault((x >> shift, y >> shift), [0, 0.0])
+                cell[0] += 1
+                cell[1] += event["speed"]
+        if cursor is None:
+            return cells
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000]
+    for count in sizes:
+        fleet = FleetSimulator(min(count, 50000), seed=6)
+        events = []
+        while len(events) < count:
+            events.extend({"vehicle_id": reading["vehicle_id"], "latitude": reading["latitude"],
+                           "longitude": reading["longitude"], "speed": reading["speed"]}
+                          for reading in fleet.readings())
+            fleet.step(5.0)
+        events = events[:count]
+        now = time.time()
+        timestamps = [now - HISTORY_SECONDS + HISTORY_SECONDS * i / count for i in range(count)]
+        tiles = viewport_tiles(fleet)
+
+        store = TopicStore(count, None)
+        aggregator = TileAggregator(["traffic"])
+        for event, timestamp in zip(events, timestamps):
+            store.append(event, timestamp)
+        start = time.perf_counter()
+        for event, timestamp in zip(events, timestamps):
+            aggregator.add("traffic", event, timestamp)
+        ingest_us = (time.perf_counter() - start) / count * 1e6
+
+        start = time.perf_counter()
+        for _ in range(REFRESHES):
+            raw_refresh(store, now - WINDOW_SECONDS, tiles)
+        raw_ms = (time.perf_counter() - start) / REFRESHES * 1e3
+        start = time.perf_counter()
+        for _ in range(REFRESHES):
+            cells = sum(len(aggregator.tile(ZOOM, x, y, now)[1]["traffic"]) for x, y in tiles)
+        tile_ms = (time.perf_counter() - start) / REFRESHES * 1e3
+        print(f"{count:8} events | tile ingest {ingest_us:5.1f} us/event | viewport refresh: raw rows {raw_ms:9.1f} ms, "
+              f"tiles {tile_ms:6.2f} ms ({cells} cells)")
+
+
+if __name__ == "__main__":
+    main()
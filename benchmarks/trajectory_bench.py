@@ -0,0 +1,84 @@
+# Edge trajectory storage: the old dict-per-point list vs TrajectoryStore
+#
+# The fleet simulator drives both for the same ticks. The old scheme keeps a
+# dict whenever a car is 5 m from its last stored point. Reconstruction error
+# is the worst distance between a raw reading and the track rebuilt from the
+# kept points, for a sample of vehicles.
+#
+# Run from the repository root:
+#     python -m benchmarks.trajectory_bench [vehicles] [ticks]
+import sys
+import time
+import tracemalloc
+import numpy as np
+from fleetsim import FleetSimulator
+from geo import haversine, haversine_distance
+from trajectory import TrajectoryStore
+
+TOLERANCE = 5
+SAMPLED_VEHICLES = 200
+
+
+def old_scheme(fleet, ticks):
+    records = []
+    last_location = {}
+    for _ in range(ticks):
+        fleet.step(1.0)
+        for vehicle_id, lat, lon in zip(fleet.vehicle_ids, fleet.latitude.tolist(), fleet.longitude.tolist()):
+            previous = last_location.get(vehicle_id)
+            if previous is None or haversine_distance(previous[0], previous[1], lat, lon) >= TOLERANCE:
+                last_location[vehicle_id] = (lat, lon)
+                records.append({"id": vehicle_id, "latitude": lat, "longitude": lon, "timestamp": fleet.timestamp})
+    return records, last_location
+
+
+def new_scheme(fleet, ticks, raw):
+    store = TrajectoryStore(TOLERANCE, max_points=1 << 20)
+    for _ in range(ticks):
+        fleet.step(1.0)
+        frame = fleet.frame()
+        store.add_many(frame["vehicle_id"], frame["timestamp"], frame["latitude"], frame["longitude"], frame["speed"])
+        raw.append((fleet.timestamp, fleet.latitude[:SAMPLED_VEHICLES].copy(), fleet.longitude[:SAMPLED_VEHICLES].copy()))
+    return store
+
+
+def reconstruction_error(store, fleet, raw):
+    times = np.array([ts for ts, _, _ in raw])
+    worst = 0.0
+    for i in range(min(SAMPLED_VEHICLES, fleet.count)):
+        track = store.get(fleet.vehicle_ids[i])
+        lats, lons = track.positions_at(times)
+        actual_lat = np.array([lat[i] for _, lat, _ in raw])
+        actual_lon = np.array([lon[i] for _, _, lon in raw])
+        worst = max(worst, float(haversine(lats, lons, actual_lat, actual_lon).max()))
+    return worst
+
+
+def main():
+    vehicles = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 120
+    readings = vehicles * ticks
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    records, last_location = old_scheme(FleetSimulator(vehicles, seed=7), ticks)
+    elapsed = time.perf_counter() - start
+    old_bytes = tracemalloc.get_traced_memory()[0]
+    print(f"old dict list  : {readings / elapsed:10.0f} readings/s | {len(records) / readings:6.1%} kept | "
+          f"{old_bytes / vehicles:8.0f} B/vehicle")
+    del records, last_location
+    tracemalloc.stop()
+
+    raw = []
+    fleet = FleetSimulator(vehicles, seed=7)
+    start = time.perf_counter()
+    store = new_scheme(fleet, ticks, raw)
+    elapsed = time.perf_counter() - start
+    report = store.memory_report()
+    print(f"trajectories   : {readings / elapsed:10.0f} readings/s | {report['kept_ratio']:6.1%} kept | "
+          f"{report['bytes_per_vehicle']:8.0f} B/vehicle | "
+          f"max reconstruction error {reconstruction_error(store, fleet, raw):.2f} m")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+# Raw LoopbackBroker throughput: publish -> on_message for a no-op handler
+#
+# Run from the repository root:
+#     python -m benchmarks.transport_bench [messages]
+import sys
+import time
+from transport import LoopbackBroker, LoopbackClient
+
+
+def run(label, subscriptions, topics, messages, threaded=False):
+    broker = LoopbackBroker()
+    received = [0]
+
+    def on_message(client, userdata, msg):
+        received[0] += 1
+
+    subscriber = LoopbackClient("subscriber", broker, threaded=threaded)
+    subscriber.on_message = on_message
+    subscriber.connect()
+    subscriber.subscribe([(topic_filter, 0) for topic_filter in subscriptions])
+    subscriber.loop_start()
+    publisher = LoopbackClient("publisher", broker)
+    payload = b'{"vehicle_id": "car1", "latitude": 12.97, "longitude": 77.59, "speed": 42}'
+
+    start = time.perf_counter()
+    for i in range(messages):
+        publisher.publish(topics[i % len(topics)], payload)
+    while received[0] < messages:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    subscriber.loop_stop()
+    print(f"{label:<36} {messages / elapsed:12.0f} msg/s")
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    topics = [f"myvehiclestatus/car{i}" for i in range(1, 4)]
+    run("exact topics, synchronous", topics, topics, messages)
+    run("wildcard myvehiclestatus/+, sync", ["myvehiclestatus/+"], topics, messages)
+    run("wildcard #, synchronous", ["#"], topics, messages)
+    run("exact topics, threaded delivery", topics, topics, messages // 4, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
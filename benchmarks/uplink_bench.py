@@ -0,0 +1,156 @@
+# Edge -> main uplink: one publish per event vs compressed batches, plus a stall
+#
+# Events are traffic-style dicts from the fleet simulator delivered through a
+# LoopbackBroker into mainserver's real on_message. The stall run takes the
+# link down mid-stream and then leaves batches unacknowledged, so batches are
+# spooled and replayed (some twice). Each event must still be stored
+# exactly once.
+#
+# Run from the repository root:
+#     python -m benchmarks.uplink_bench [events]
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import tempfile
+import contextlib
+os.environ.setdefault("MQTT_TRANSPORT", "loopback")
+
+from fleetsim import FleetSimulator
+from transport import LoopbackBroker, LoopbackClient
+from uplink import Uplink
+from topicstore import TopicStore
+import mainserver
+
+
+class Info:
+    def __init__(self, rc, published):
+        self.rc = rc
+        self.published = published
+
+    def is_published(self):
+        return self.published
+
+
+class FlakyClient(LoopbackClient):
+    """Loopback client whose link can go down or stop acknowledging"""
+
+    def __init__(self, broker):
+        super().__init__("edge", broker)
+        self.down = False
+        self.acking = True
+
+    def is_connected(self):
+        return not self.down
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        if self.down:
+            return Info(4, False)
+        super().publish(topic, payload, qos, retain)
+        return Info(0, self.acking)
+
+
+def build_events(count):
+    fleet = FleetSimulator(count, seed=3)
+    return [{"vehicle_id": reading["vehicle_id"], "latitude": reading["latitude"], "longitude": reading["longitude"],
+             "speed": reading["speed"], "congestion": "high" if reading["speed"] < 20 else "low"}
+            for reading in fleet.readings()]
+
+
+def main_server(broker):
+    server = LoopbackClient("main", broker)
+    server.on_connect = mainserver.on_connect
+    server.on_message = mainserver.on_message
+    server.connect()
+    # Fresh store per run; the real one is capped at MAX_ROWS_PER_TOPIC
+    store = mainserver.data_store["traffic"] = TopicStore(1 << 24, mainserver.MAX_AGE_SECONDS)
+    return store
+
+
+def per_event(events):
+    broker = LoopbackBroker()
+    store = main_server(broker)
+    edge = LoopbackClient("edge", broker)
+    edge.connect()
+    sent = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for event in events:
+            payload = json.dumps(event)
+            sent += len(payload)
+            edge.publish("traffic", payload)
+        elapsed = time.perf_counter() - start
+    print(f"per-event publish : {len(events) / elapsed:10.0f} events/s | {len(events):7} messages | "
+          f"{sent / 1e6:7.2f} MB on the wire | {len(store)} stored")
+
+
+def batched(events, compression, spool_dir):
+    broker = LoopbackBroker()
+    store = main_server(broker)
+    edge = LoopbackClient("edge", broker)
+    edge.connect()
+    uplink = Uplink(edge, compression=compression, spool_dir=spool_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for event in events:
+            uplink.send("traffic", event)
+        uplink.flush()
+        elapsed = time.perf_counter() - start
+    stats = uplink.stats
+    print(f"batched ({compression:<4})    : {len(events) / elapsed:10.0f} events/s | {stats['batches']:7} messages | "
+          f"{stats['sent_bytes'] / 1e6:7.2f} MB on the wire | {len(store)} stored "
+          f"({stats['raw_bytes'] / max(stats['sent_bytes'], 1):.1f}x compression)")
+
+
+def stalled(events, spool_dir):
+    broker = LoopbackBroker()
+    store = main_server(broker)
+    client = FlakyClient(broker)
+    client.connect()
+    uplink = Uplink(client, spool_dir=spool_dir, ack_timeout=0)
+    third = len(events) // 3
+    with contextlib.redirect_stdout(io.StringIO()):
+        for event in events[:third]:
+            uplink.send("traffic", event)
+        client.down = True  # Main server unreachable: batches go to disk
+        for event in events[third:2 * third]:
+            uplink.send("traffic", event)
+        uplink.flush()
+        spooled = len(uplink.spooled())
+        client.down = False
+        client.acking = False  # Delivered but never acknowledged: replayed again
+        for event in events[2 * third:]:
+            uplink.send("traffic", event)
+        uplink.flush()
+        uplink.replay()
+        client.acking = True
+        while uplink.replay():
+            pass
+    duplicates = mainserver.metrics.registry.counters.get(("uplink_duplicate_batches_total", ()), 0)
+    stored = len(store)
+    print(f"stall and replay  : {spooled} batches spooled during the outage, {uplink.stats['replayed']} replays, "
+          f"{duplicates} duplicate batches dropped | {stored} of {len(events)} events stored once "
+          f"({'ok' if stored == len(events) else 'MISMATCH'})")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    events = build_events(count)
+    spool_dir = tempfile.mkdtemp(prefix="uplink-bench-")
+    try:
+        per_event(events)
+        batched(events, "none", spool_dir)
+        batched(events, "zlib", spool_dir)
+        try:
+            batched(events, "zstd", spool_dir)
+        except ImportError:
+            print("batched (zstd)    : skipped, zstandard is not installed")
+        stalled(events, spool_dir)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
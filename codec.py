@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import struct
+import numpy as np
+from telemetry import FRAME_VERSION, is_frame
+
+# Compact binary telemetry encoding, used next to JSON.
+#
+# A binary payload starts with an 8 byte header (magic, version, flags,
+# padding, record count) followed by fixed-width little-endian records, so a
+# decoder can view the columns in place with np.frombuffer. With the delta
+# flag the header also carries a base latitude/longitude and each record
+# stores its coordinates as int32 offsets in 1e-7 degree units (~1 cm).
+#
+# JSON payloads always start with "{", "[" or a bare literal, never with the
+# magic byte, so decode() can tell the two apart on any topic. Publishers pick
+# binary per topic through BINARY_TOPICS.
+MAGIC = 0xB7
+VERSION = 1
+FLAG_DELTA = 0x01
+HEADER = struct.Struct("<BBBxI")
+DELTA_BASE = struct.Struct("<dd")
+COORD_SCALE = 1e7
+VEHICLE_ID_BYTES = 16
+
+RECORD_DTYPE = np.dtype([
+    ("vehicle_id", f"S{VEHICLE_ID_BYTES}"),
+    ("latitude", "<f8"),
+    ("longitude", "<f8"),
+    ("speed", "<f4"),
+    ("timestamp", "<f8"),
+])
+# struct equivalent of RECORD_DTYPE, used to encode single readings cheaply
+RECORD = struct.Struct(f"<{VEHICLE_ID_BYTES}sddfd")
+DELTA_RECORD_DTYPE = np.dtype([
+    ("vehicle_id", f"S{VEHICLE_ID_BYTES}"),
+    ("latitude", "<i4"),
+    ("longitude", "<i4"),
+    ("speed", "<f4"),
+    ("timestamp", "<f8"),
+])
+
+# Topics published in binary, e.g. TELEMETRY_BINARY_TOPICS="myvehiclestatus/frame,myvehiclestatus/car1"
+BINARY_TOPICS = set(filter(None, os.environ.get("TELEMETRY_BINARY_TOPICS", "").split(",")))
+
+
+def is_binary(payload):
+    return len(payload) >= HEADER.size and payload[0] == MAGIC
+
+
+def encode_binary(data, delta=False):
+    """Encode a single reading dict or a telemetry frame into the binary layout"""
+    if is_frame(data):
+        columns = data
+    elif not delta:
+        vehicle_id = str(data["vehicle_id"]).encode()
+        if len(vehicle_id) > VEHICLE_ID_BYTES:
+            raise ValueError(f"vehicle_id longer than {VEHICLE_ID_BYTES} bytes cannot be encoded")
+        return HEADER.pack(MAGIC, VERSION, 0, 1) + RECORD.pack(
+            vehicle_id, data["latitude"], data["longitude"], data.get("speed", 0), data.get("timestamp", time.time()))
+    else:
+        columns = {
+            "vehicle_id": [data["vehicle_id"]],
+            "latitude": [data["latitude"]],
+            "longitude": [data["longitude"]],
+            "speed": [data.get("speed", 0)],
+            "timestamp": [data.get("timestamp", time.time())],
+        }
+    vehicle_ids = [str(vehicle_id).encode() for vehicle_id in columns["vehicle_id"]]
+    if any(len(vehicle_id) > VEHICLE_ID_BYTES for vehicle_id in vehicle_ids):
+        raise ValueError(f"vehicle_id longer than {VEHICLE_ID_BYTES} bytes cannot be encoded")
+    count = len(vehicle_ids)
+    latitudes = np.asarray(columns["latitude"], dtype=np.float64)
+    longitudes = np.asarray(columns["longitude"], dtype=np.float64)
+
+    records = np.empty(count, dtype=DELTA_RECORD_DTYPE if delta else RECORD_DTYPE)
+    records["vehicle_id"] = vehicle_ids
+    records["speed"] = columns["speed"]
+    records["timestamp"] = columns["timestamp"]
+    if delta:
+        base_lat = float(latitudes[0]) if count else 0.0
+        base_lon = float(longitudes[0]) if count else 0.0
+        records["latitude"] = np.rint((latitudes - base_lat) * COORD_SCALE)
+        records["longitude"] = np.rint((longitudes - base_lon) * COORD_SCALE)
+        header = HEADER.pack(MAGIC, VERSION, FLAG_DELTA, count) + DELTA_BASE.pack(base_lat, base_lon)
+    else:
+        records["latitude"] = latitudes
+        records["longitude"] = longitudes
+        header = HEADER.pack(MAGIC, VERSION, 0, count)
+    return header + records.tobytes()
+
+
+def decode_binary(payload):
+    """Decode a binary payload into a frame whose numeric columns are NumPy arrays.
+
+    Without delta coding the columns are read-only views into payload; no
+    bytes are copied apart from the vehicle ids, which become str.
+    """
+    magic, version, flags, count = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported binary telemetry version {version}")
+    offset = HEADER.size
+    if flags & FLAG_DELTA:
+        base_lat, base_lon = DELTA_BASE.unpack_from(payload, offset)
+        offset += DELTA_BASE.size
+        records = np.frombuffer(payload, dtype=DELTA_RECORD_DTYPE, count=count, offset=offset)
+        latitudes = base_lat + records["latitude"] / COORD_SCALE
+        longitudes = base_lon + records["longitude"] / COORD_SCALE
+    else:
+        records = np.frombuffer(payload, dtype=RECORD_DTYPE, count=count, offset=offset)
+        latitudes = records["latitude"]
+        longitudes = records["longitude"]
+    return {
+        "frame": FRAME_VERSION,
+        "vehicle_id": [vehicle_id.decode() for vehicle_id in records["vehicle_id"].tolist()],
+        "latitude": latitudes,
+        "longitude": longitudes,
+        "speed": records["speed"],
+        "timestamp": records["timestamp"],
+    }
+
+
+def encode(data, binary=False, delta=False):
+    if binary:
+        return encode_binary(data, delta)
+    return json.dumps(data)
+
+
+def encode_for_topic(topic, data, delta=False):
+    """Encode data in the format negotiated for topic"""
+    return encode(data, binary=topic in BINARY_TOPICS, delta=delta)
+
+
+def decode(payload, as_lists=False):
+    """Decode a JSON or binary payload, detected from the header byte.
+
+    Binary payloads decode to a telemetry frame; pass as_lists to get plain
+    Python lists instead of NumPy columns, e.g. to hand on to jsonify.
+    """
+    if isinstance(payload, str):
+        return json.loads(payload)
+    if not is_binary(payload):
+        return json.loads(payload.decode())
+    frame = decode_binary(payload)
+    if as_lists:
+        for name in ("latitude", "longitude", "speed", "timestamp"):
+            frame[name] = frame[name].tolist()
+    return frame
@@ -1,55 +1,67 @@
 import json
-import math
 import time
-import random
-import paho.mqtt.client as mqtt
+import threading
+from windowstore import WindowStore
+from alertscheduler import AlertScheduler
+from trafficstats import TrafficStats
+from registry import VehicleRegistry
+from mapmatch import MapMatcher, network_from_env
+from telemetry import is_frame, frame_readings
+from codec import decode
+from transport import BROKER, PORT, create_client
+import metrics
 
 # MQTT broker details
-broker = "broker.emqx.io"
-port = 1883
+broker = BROKER
+port = PORT
 topics = ["myvehiclestatus/car1", "myvehiclestatus/car2", "myvehiclestatus/car3"]
 
-car_locations = {}
-car_speeds = {}
 alert_distance_threshold = 50
-
-def classify_density(vehicle_count):
-    return random.choice(["low", "medium", "high"])
-
-def calculate_average_speed(data):
-    if len(data) == 0:
-        return 0
-    total_speed = sum(item.get('speed', 0) for item in data)
-    return total_speed / len(data)
-
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371 * 1000
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+# Latest position, speed and heading of every car, in NumPy columns, with a grid
+# over the positions that keeps cached per-car lists of cars within the alert distance
+vehicles = VehicleRegistry(cell_size=alert_distance_threshold)
+# Cars silent for this many seconds are dropped from the registry and the road matcher
+vehicle_timeout = 300
+
+# Recent vehicle status records, flushed to an append-only log in the background
+window_size = 10000
+data_log = "data.jsonl"
+window_store = WindowStore(window_size, log_path=data_log)
+
+# Repeated speed alerts are sent from a timer thread, never from on_message
+alert_count = 3
+alert_interval = 1
+alert_scheduler = AlertScheduler(alert_count, alert_interval)
+
+# Rolling per-segment speed and density statistics that drive the dynamic speed cap.
+# With ROAD_NETWORK set, readings are snapped to road segments and filed per
+# segment; otherwise (or off-road) they fall back to grid cells.
+traffic_stats = TrafficStats()
+road_network = network_from_env()
+road_matcher = MapMatcher(road_network) if road_network is not None else None
+# MapMatcher is not thread-safe; matches run on the MQTT thread, expiry on the main loop
+road_matcher_lock = threading.Lock()
+
+metrics.gauge("comb5_car_locations", lambda: len(vehicles), "Cars with a known location")
+metrics.gauge("comb5_window_readings", lambda: len(window_store), "Readings in the rolling speed window")
+metrics.gauge("comb5_alerts_pending", lambda: len(alert_scheduler), "Speed alerts waiting to be sent")
+if road_matcher is not None:
+    metrics.gauge("comb5_matched_vehicles", lambda: len(road_matcher), "Vehicles currently snapped to a road segment")
 
 def process_data(client):
     while True:
-        with open("data.json", "r") as f:
-            data = json.load(f)
-
-        avg_speed = calculate_average_speed(data)
-        density = classify_density(len(data))
-
-        if density == "high":
-            threshold = avg_speed * 1.25
-        elif density == "low":
-            threshold = avg_speed * 1.75
-        else:
-            threshold = avg_speed * 1.5
-
-        client.publish("client_process", json.dumps({"threshold": threshold}))
-
-        with open("data.json", "w") as f:
-            json.dump([], f)
+        now = time.time()
+        traffic_stats.prune(now)
+        expired = vehicles.expire(now - vehicle_timeout)
+        if road_matcher is not None and expired:
+            with road_matcher_lock:
+                for vehicle_id in expired:
+                    road_matcher.forget(vehicle_id)
+        threshold = traffic_stats.overall_speed_cap()
+        segments = {segment if isinstance(segment, str) else f"{segment[0]}:{segment[1]}": cap
+                    for segment, cap in traffic_stats.segment_speed_caps().items()}
+
+        client.publish("client_process", json.dumps({"threshold": threshold, "segments": segments}))
 
         time.sleep(10)
 
@@ -62,68 +74,66 @@ def on_connect(client, userdata, flags, rc):
     else:
         print(f"Failed to connect, return code {rc}")
 
+def handle_status(client, data):
+    vehicle_id = data["vehicle_id"]
+    latitude = data["latitude"]
+    longitude = data["longitude"]
+    speed = data["speed"]
+    
+    vehicles.update(vehicle_id, latitude, longitude, speed, data.get("heading"))
+    
+    print(f"Location updated for car {vehicle_id}: ({latitude}, {longitude})")
+    print(f"Speed received: {speed} km/h for car {vehicle_id}")
+
+    window_store.append(data)
+
+    # Road segment the car is on, and that road's speed limit
+    road_segment = None
+    if road_matcher is not None:
+        with road_matcher_lock:
+            road_segment = road_matcher.match(vehicle_id, latitude, longitude, data.get("heading"))
+    road_limit = None
+    segment = None
+    if road_segment is not None:
+        segment = road_network.segment_key(road_segment)
+        road_limit = road_network.max_speed(road_segment)
+
+    # Calculate dynamic speed cap based on the density around this car
+    segment = traffic_stats.update(vehicle_id, latitude, longitude, speed, time.time(), segment)
+    speed_cap = traffic_stats.speed_cap(segment)
+
+    # Set the alert threshold as the minimum of the road's limit (60 km/h if unknown) and calculated speed cap
+    alert_threshold = min(road_limit or 60, speed_cap)
+
+    if speed > alert_threshold:
+        print(f"Speed alert for car {vehicle_id}. Sending alerts...")
+        alert_message = f"Speed alert! Current speed: {speed} km/h. Please slow down!"
+        alert_scheduler.schedule(client, vehicle_id, f"alert/{vehicle_id}", alert_message)
+
+        # Only the cars in the surrounding grid cells are checked
+        for other_vehicle_id in vehicles.neighbors(vehicle_id, alert_distance_threshold):
+            client.publish(f"alert/{other_vehicle_id}", "Please be aware of a speeding car nearby!")
+            print(f"Alert sent to {other_vehicle_id}: Speeding car nearby!")
+
+@metrics.instrument("comb5")
 def on_message(client, userdata, msg):
-    global car_locations, car_speeds
-
-    topic = msg.topic
-    payload = msg.payload.decode()
-
     try:
-        data = json.loads(payload)
-        vehicle_id = data["vehicle_id"]
-        latitude = data["latitude"]
-        longitude = data["longitude"]
-        speed = data["speed"]
-        
-        car_speeds[vehicle_id] = speed
-        car_locations[vehicle_id] = (latitude, longitude)
-        
-        print(f"Location updated for car {vehicle_id}: ({latitude}, {longitude})")
-        print(f"Speed received: {speed} km/h for car {vehicle_id}")
-
-        with open("data.json", "r") as f:
-            existing_data = json.load(f)
-        
-        existing_data.append(data)
-        
-        with open("data.json", "w") as f:
-            json.dump(existing_data, f)
-
-        # Calculate dynamic speed cap based on density
-        avg_speed = calculate_average_speed(existing_data)
-        density = classify_density(len(existing_data))
-
-        if density == "high":
-            speed_cap = avg_speed * 1.25
-        elif density == "low":
-            speed_cap = avg_speed * 1.75
-        else:
-            speed_cap = avg_speed * 1.5
-
-        # Set the alert threshold as the minimum of 60 km/h and calculated speed cap
-        alert_threshold = min(60, speed_cap)
-
-        if speed > alert_threshold:
-            print(f"Speed alert for car {vehicle_id}. Sending alerts...")
-            alert_message = f"Speed alert! Current speed: {speed} km/h. Please slow down!"
-            for _ in range(3):
-                client.publish(f"alert/{vehicle_id}", alert_message)
-                print(f"Alert sent to {vehicle_id}: {alert_message}")
-                time.sleep(1)
-
-            lat1, lon1 = car_locations[vehicle_id]
-            for other_vehicle_id, (lat2, lon2) in car_locations.items():
-                if other_vehicle_id != vehicle_id:
-                    distance = calculate_distance(lat1, lon1, lat2, lon2)
-                    if distance <= alert_distance_threshold:
-                        client.publish(f"alert/{other_vehicle_id}", "Please be aware of a speeding car nearby!")
-                        print(f"Alert sent to {other_vehicle_id}: Speeding car nearby!")
+        data = decode(msg.payload)
+    except ValueError as e:
+        metrics.record_error("comb5", msg.topic, "decode")
+        print(f"Failed to decode message: {e}")
+        return
+    try:
+        # Batched frames carry many readings; handle each like a single message
+        for reading in frame_readings(data) if is_frame(data) else [data]:
+            handle_status(client, reading)
     except Exception as e:
+        metrics.record_error("comb5", msg.topic, "handler")
         print(f"Error processing message: {e}")
 
 
 def main():
-    client = mqtt.Client()
+    client = create_client()
     client.on_connect = on_connect
     client.on_message = on_message
 
@@ -134,8 +144,15 @@ def main():
         return
 
     client.loop_start()
-    process_data(client)
-    client.loop_stop()
+    metrics.serve()
+    window_store.start_flusher()
+    alert_scheduler.start()
+    try:
+        process_data(client)
+    finally:
+        alert_scheduler.stop()
+        window_store.stop_flusher()
+        client.loop_stop()
 
 if __name__ == "__main__":
     main()
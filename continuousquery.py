@@ -0,0 +1,264 @@
+import math
+import threading
+import numpy as np
+from spatialindex import grid_cell, METERS_PER_DEGREE, DEFAULT_CELL_SIZE
+from registry import VehicleRegistry
+
+# Forward corridor ahead of a moving ambulance, when its heading is known
+DEFAULT_CORRIDOR_LENGTH = 300  # meters ahead
+DEFAULT_CORRIDOR_WIDTH = 30  # meters across, centred on the heading
+# Queries not moved for this many seconds are dropped (ambulance went quiet)
+QUERY_TTL = 120
+
+ENTER = "enter"
+LEAVE = "leave"
+
+
+class MovingRegion:
+    """Circle around a point, plus an optional corridor along a heading.
+
+    Positions are projected onto a local east/north plane in meters around
+    the centre, which is accurate to well under a meter at these ranges.
+    """
+
+    def __init__(self, latitude, longitude, radius, heading=None,
+                 corridor_length=DEFAULT_CORRIDOR_LENGTH, corridor_width=DEFAULT_CORRIDOR_WIDTH):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.radius = radius
+        self.heading = heading
+        self.corridor_length = corridor_length if heading is not None else 0
+        self.half_width = corridor_width / 2
+        self.lon_scale = max(math.cos(math.radians(latitude)), 1e-6) * METERS_PER_DEGREE
+        if heading is not None:
+            self.sin = math.sin(math.radians(heading))
+            self.cos = math.cos(math.radians(heading))
+        self.reach = max(radius, math.hypot(self.corridor_length, self.half_width))
+
+    def _project(self, latitudes, longitudes):
+        return (longitudes - self.longitude) * self.lon_scale, (latitudes - self.latitude) * METERS_PER_DEGREE
+
+    def _in_circle(self, east, north):
+        return east * east + north * north <= self.radius * self.radius
+
+    def _in_corridor(self, east, north):
+        along = east * self.sin + north * self.cos
+        across = east * self.cos - north * self.sin
+        return (along >= 0) & (along <= self.corridor_length) & (abs(across) <= self.half_width)
+
+    def contains(self, latitudes, longitudes):
+        """Boolean mask (or bool for scalars) of points inside the region"""
+        east, north = self._project(latitudes, longitudes)
+        inside = self._in_circle(east, north)
+        if self.corridor_length:
+            inside = inside | self._in_corridor(east, north)
+        return inside
+
+    def cover(self, cell_degrees):
+        """{cell: wholly inside} for the grid cells the region may touch.
+
+        Works on the projected cell edges of the bounding box, so every test
+        is a few operations on 1-D arrays and one outer sum. A cell touches
+        the circle if its nearest point is within the radius and is wholly
+        inside it if its farthest corner is. Against the corridor, the
+        cell's corners are projected onto the heading and across it:
+        overlapping both extents counts as touching (conservative), all four
+        corners inside as wholly inside. Both parts are convex, so corners
+        decide containment.
+        """
+        lat_span = self.reach / METERS_PER_DEGREE
+        lon_span = self.reach / self.lon_scale
+        row_min = math.floor((self.latitude - lat_span) / cell_degrees)
+        col_min = math.floor((self.longitude - lon_span) / cell_degrees)
+        rows = math.floor((self.latitude + lat_span) / cell_degrees) - row_min + 1
+        cols = math.floor((self.longitude + lon_span) / cell_degrees) - col_min + 1
+        north = ((row_min + np.arange(rows + 1)) * cell_degrees - self.latitude) * METERS_PER_DEGREE
+        east = ((col_min + np.arange(cols + 1)) * cell_degrees - self.longitude) * self.lon_scale
+
+        def low(edges):
+            return np.minimum(edges[:-1], edges[1:])
+
+        def high(edges):
+            return np.maximum(edges[:-1], edges[1:])
+
+        # Nearest and farthest offsets of each cell from the centre along one axis
+        near_north = np.where((north[:-1] <= 0) & (north[1:] >= 0), 0, low(abs(north)))
+        near_east = np.where((east[:-1] <= 0) & (east[1:] >= 0), 0, low(abs(east)))
+        limit = self.radius * self.radius
+        touches = np.add.outer(near_north ** 2, near_east ** 2) <= limit
+        inside = np.add.outer(high(abs(north)) ** 2, high(abs(east)) ** 2) <= limit
+        if self.corridor_length:
+            # along and across are sums of a row term and a column term, so
+            # their extremes over a cell's corners separate the same way
+            along_north, along_east = north * self.cos, east * self.sin
+            across_north, across_east = -north * self.sin, east * self.cos
+            along_min = np.add.outer(low(along_north), low(along_east))
+            along_max = np.add.outer(high(along_north), high(along_east))
+            across_min = np.add.outer(low(across_north), low(across_east))
+            across_max = np.add.outer(high(across_north), high(across_east))
+            touches |= ((along_max >= 0) & (along_min <= self.corridor_length)
+                        & (across_max >= -self.half_width) & (across_min <= self.half_width))
+            inside |= ((along_min >= 0) & (along_max <= self.corridor_length)
+                       & (across_min >= -self.half_width) & (across_max <= self.half_width))
+        row_index, col_index = np.nonzero(touches)
+        cells = zip((row_index + row_min).tolist(), (col_index + col_min).tolist())
+        return dict(zip(cells, inside[row_index, col_index].tolist()))
+
+
+class ContinuousQueries:
+    """Standing "cars inside a moving region" queries with enter/leave deltas.
+
+    Car positions live in a VehicleRegistry with a cell grid (pass one in to
+    share the registry that already tracks the cars; car updates must then
+    go through update_car), and every query registers itself on the cells
+    its region touches. A car update is checked only against the queries
+    watching its cell and the ones it is already inside. A query move
+    skips cells that lie wholly inside both the old and new region, and
+    checks cars only in boundary cells (or drops a whole cell it left), so
+    the work tracks the cars near the moving boundary rather than the
+    fleet or even the region. Every update returns the deltas it caused as
+    (query_id, car_id, ENTER or LEAVE). Thread-safe.
+    """
+
+    def __init__(self, radius, cell_size=DEFAULT_CELL_SIZE, corridor_length=DEFAULT_CORRIDOR_LENGTH,
+                 corridor_width=DEFAULT_CORRIDOR_WIDTH, ttl=QUERY_TTL, registry=None):
+        self.radius = radius
+        self.corridor_length = corridor_length
+        self.corridor_width = corridor_width
+        self.ttl = ttl
+        self.cars = VehicleRegistry(cell_size=cell_size) if registry is None else registry
+        if self.cars.cell_degrees is None:
+            raise ValueError("ContinuousQueries needs a VehicleRegistry with a cell_size")
+        self.regions = {}  # query id -> MovingRegion
+        self.members = {}  # query id -> set of car ids inside
+        self.covered = {}  # query id -> {cell: True if wholly inside the region}
+        self.updated = {}  # query id -> timestamp of the last move
+        self.watchers = {}  # cell -> set of query ids covering it
+        self.memberships = {}  # car id -> set of query ids it is inside
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.regions)
+
+    def _enter(self, query_id, car_id, deltas):
+        self.members[query_id].add(car_id)
+        self.memberships.setdefault(car_id, set()).add(query_id)
+        deltas.append((query_id, car_id, ENTER))
+
+    def _leave(self, query_id, car_id, deltas):
+        self.members[query_id].discard(car_id)
+        queries = self.memberships.get(car_id)
+        if queries is not None:
+            queries.discard(query_id)
+            if not queries:
+                del self.memberships[car_id]
+        deltas.append((query_id, car_id, LEAVE))
+
+    def update_query(self, query_id, latitude, longitude, heading=None, radius=None, timestamp=None):
+        """Register or move a query; returns the deltas"""
+        region = MovingRegion(latitude, longitude, self.radius if radius is None else radius, heading,
+                              self.corridor_length, self.corridor_width)
+        deltas = []
+        with self.lock:
+            old_covered = self.covered.get(query_id, {})
+            new_covered = region.cover(self.cars.cell_degrees)
+            members = self.members.setdefault(query_id, set())
+            self.regions[query_id] = region
+            self.covered[query_id] = new_covered
+            if timestamp is not None:
+                self.updated[query_id] = timestamp
+            for cell in old_covered.keys() - new_covered.keys():
+                watching = self.watchers.get(cell)
+                if watching is not None:
+                    watching.discard(query_id)
+                    if not watching:
+                        del self.watchers[cell]
+            for cell in new_covered.keys() - old_covered.keys():
+                self.watchers.setdefault(cell, set()).add(query_id)
+
+            check = []
+            cars = self.cars
+            with cars.lock:
+                for cell in old_covered.keys() | new_covered.keys():
+                    inside_now = new_covered.get(cell)
+                    if inside_now and old_covered.get(cell):
+                        continue  # Members before, members still
+                    bucket = cars.cells.get(cell)
+                    if not bucket:
+                        continue
+                    if inside_now:
+                        for car_id in [cars.ids[slot] for slot in bucket]:
+                            if car_id not in members:
+                                self._enter(query_id, car_id, deltas)
+                    elif inside_now is None:
+                        for car_id in [cars.ids[slot] for slot in bucket if cars.ids[slot] in members]:
+                            self._leave(query_id, car_id, deltas)
+                    else:
+                        check.extend(bucket)
+                if check:
+                    slots = np.array(check, dtype=np.int64)
+                    mask = region.contains(cars.columns["latitude"][slots], cars.columns["longitude"][slots])
+                    for slot, inside in zip(check, mask.tolist()):
+                        car_id = cars.ids[slot]
+                        if inside and car_id not in members:
+                            self._enter(query_id, car_id, deltas)
+                        elif not inside and car_id in members:
+                            self._leave(query_id, car_id, deltas)
+        return deltas
+
+    def remove_query(self, query_id):
+        """Drop a query; every car inside it leaves"""
+        deltas = []
+        with self.lock:
+            if query_id not in self.regions:
+                return deltas
+            for car_id in list(self.members[query_id]):
+                self._leave(query_id, car_id, deltas)
+            for cell in self.covered.pop(query_id):
+                watching = self.watchers.get(cell)
+                if watching is not None:
+                    watching.discard(query_id)
+                    if not watching:
+                        del self.watchers[cell]
+            del self.regions[query_id], self.members[query_id]
+            self.updated.pop(query_id, None)
+        return deltas
+
+    def expire(self, now):
+        """Remove queries not moved within ttl seconds of now; returns the deltas"""
+        with self.lock:
+            stale = [query_id for query_id, updated in self.updated.items() if now - updated > self.ttl]
+        deltas = []
+        for query_id in stale:
+            deltas.extend(self.remove_query(query_id))
+        return deltas
+
+    def update_car(self, car_id, latitude, longitude):
+        """Insert or move a car; returns the deltas"""
+        deltas = []
+        with self.lock:
+            self.cars.update(car_id, latitude, longitude)
+            cell = grid_cell(latitude, longitude, self.cars.cell_degrees)
+            candidates = set(self.watchers.get(cell, ()))
+            candidates.update(self.memberships.get(car_id, ()))
+            for query_id in candidates:
+                inside = self.covered[query_id].get(cell) or (
+                    cell in self.covered[query_id] and bool(self.regions[query_id].contains(latitude, longitude)))
+                if inside and car_id not in self.members[query_id]:
+                    self._enter(query_id, car_id, deltas)
+                elif not inside and car_id in self.members[query_id]:
+                    self._leave(query_id, car_id, deltas)
+        return deltas
+
+    def remove_car(self, car_id):
+        deltas = []
+        with self.lock:
+            self.cars.remove(car_id)
+            for query_id in list(self.memberships.get(car_id, ())):
+                self._leave(query_id, car_id, deltas)
+        return deltas
+
+    def inside(self, query_id):
+        """Cars currently inside a query"""
+        with self.lock:
+            return set(self.members.get(query_id, ()))
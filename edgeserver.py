@@ -1,16 +1,25 @@
-import paho.mqtt.client as mqtt
+import sys
 import json
 import time
-import math
-from geopy.distance import geodesic
-from tempserver import send_data_to_main_server
+import asyncio
+from edgestate import EdgeState, STORE_INTERVAL
+from telemetry import TOPIC_VEHICLE_STATUS_FRAME, is_frame
+from codec import decode
+from shardededge import ShardedEdge
+from asyncingest import AsyncIngest
+from priority import PriorityDispatcher, EMERGENCY, HIGH, NORMAL, BULK, topic_priorities
+from transport import BROKER, PORT, create_client
+import geo
+# Kept for callers of the original edgeserver.calculate_distance (haversine meters)
+from geo import haversine_distance as calculate_distance
+import metrics
+from uplink import send_data_to_main_server, uplink_for
 
-# MQTT broker details
-BROKER = "broker.emqx.io"  # Replace with your broker's address
-PORT = 1883
+# MQTT broker details come from transport (MQTT_BROKER / MQTT_PORT / MQTT_TRANSPORT)
 TOPIC_VEHICLE_STATUS_CAR1 = "myvehiclestatus/car1"
 TOPIC_VEHICLE_STATUS_CAR2 = "myvehiclestatus/car2"
 TOPIC_VEHICLE_STATUS_CAR3 = "myvehiclestatus/car3"
+VEHICLE_STATUS_TOPICS = [TOPIC_VEHICLE_STATUS_CAR1, TOPIC_VEHICLE_STATUS_CAR2, TOPIC_VEHICLE_STATUS_CAR3, TOPIC_VEHICLE_STATUS_FRAME]
 TOPIC_SERVER_MAIN_CONTENT_SEND = "servermaincontentsend"
 TOPIC_SEND_SERVER_DATA = "sendserverdata"  # Existing topic
 TOPIC_SEND_SERVER_DATA1 = "sendserverdata1"  # New topic
@@ -22,30 +31,41 @@ TOPIC_TRAFFIC = "traffic"
 TOPIC_AMBLOC = "ambloc"
 TOPIC_CAR_LOCATION = "car/location"
 TOPIC_INPUT = "input"
+TOPIC_TRAJECTORY = "trajectory"  # Uplink event topic for drained vehicle tracks
+TOPIC_AMBULANCE_ALERT = "ambulance/{}"  # Per-car enter/leave notices for nearby ambulances
+FORWARDED_TOPICS = [TOPIC_ACCIDENT, TOPIC_OVERSPEEDING, TOPIC_AUTHORITIES, TOPIC_ROAD_CONDITION, TOPIC_TRAFFIC]
+
+# Priority lane per topic (accident > traffic > telemetry); MQTT_TOPIC_PRIORITIES overrides entries
+TOPIC_PRIORITIES = topic_priorities({
+    TOPIC_ACCIDENT: EMERGENCY,
+    TOPIC_AUTHORITIES: EMERGENCY,
+    TOPIC_AMBLOC: EMERGENCY,
+    TOPIC_OVERSPEEDING: HIGH,
+    TOPIC_INPUT: HIGH,
+    TOPIC_ROAD_CONDITION: NORMAL,
+    TOPIC_TRAFFIC: NORMAL,
+    TOPIC_CAR_LOCATION: NORMAL,
+    TOPIC_SEND_SERVER_DATA: NORMAL,
+    TOPIC_SEND_SERVER_DATA1: NORMAL,
+    **{topic: BULK for topic in VEHICLE_STATUS_TOPICS},
+})
 
 # Data storage
-vehicle_status_data = []
-last_speed_store_time = 0
-last_location = {}
-car_locations = {}
-
-# Thresholds
-SPEED_CAP = 80  # Speed cap in km/h
-LOCATION_DISTANCE_THRESHOLD = 5  # Location threshold in meters
-STORE_INTERVAL = 30 * 60  # 30 minutes in seconds
-
-# Function to calculate distance between two coordinates (latitude, longitude)
-def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371 * 1000  # Radius of Earth in meters
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+state = EdgeState()
+vehicle_status_data = state.vehicle_status_data
+trajectories = state.trajectories
+vehicles = state.vehicles
+sharded = None  # ShardedEdge when run with --shards N; owns the vehicle state instead of state
+
+metrics.gauge("edge_vehicles_tracked", lambda: len(trajectories), "Vehicles with a trajectory")
+metrics.gauge("edge_trajectory_readings", lambda: trajectories.readings, "Vehicle readings seen by the trajectory store")
+metrics.gauge("edge_trajectory_points_kept", lambda: trajectories.kept, "Readings kept as trajectory points")
+metrics.gauge("edge_car_locations", lambda: len(vehicles), "Cars known from car/location updates")
+metrics.gauge("edge_status_buffer", lambda: len(vehicle_status_data), "Buffered server data records")
+metrics.gauge("edge_active_ambulances", lambda: len(state.ambulances), "Ambulances with a moving-radius query")
 
 def calculate_geodesic_distance(coord1, coord2):
-    return geodesic(coord1, coord2).meters
+    return float(geo.distance(coord1[0], coord1[1], coord2[0], coord2[1], method="ellipsoidal"))
 
 # Callback for MQTT connection
 def on_connect(client, userdata, flags, rc):
@@ -55,6 +75,7 @@ def on_connect(client, userdata, flags, rc):
             (TOPIC_VEHICLE_STATUS_CAR1, 0), 
             (TOPIC_VEHICLE_STATUS_CAR2, 0), 
             (TOPIC_VEHICLE_STATUS_CAR3, 0), 
+            (TOPIC_VEHICLE_STATUS_FRAME, 0),
             (TOPIC_ACCIDENT, 0), 
             (TOPIC_OVERSPEEDING, 0), 
             (TOPIC_AUTHORITIES, 0), 
@@ -70,47 +91,67 @@ def on_connect(client, userdata, flags, rc):
     else:
         print(f"Failed to connect, return code {rc}")
 
+# Queue one event for the main server; emergency events flush their batch at once
+def forward_upstream(client, data, topic=None):
+    uplink_for(client).send(topic, data, urgent=TOPIC_PRIORITIES.get(topic) == EMERGENCY)
+    print(f"Queued for {TOPIC_SERVER_MAIN_CONTENT_SEND}: {data}")
+
+# Queue events on the uplink one by one; an event that cannot be encoded is
+# logged and skipped instead of losing the rest. Returns how many were queued.
+def queue_upload(uplink, topic, events):
+    queued = 0
+    for event in events:
+        try:
+            uplink.send(topic, event)
+            queued += 1
+        except (TypeError, ValueError) as e:
+            print(f"Skipping {topic} event that cannot be encoded: {e}")
+    return queued
+
+# Upload drained trajectories and buffered server data, then flush the uplink
+def upload_state(client):
+    uplink = uplink_for(client)
+    tracks = (sharded if sharded is not None else state).drain()
+    queue_upload(uplink, TOPIC_TRAJECTORY, tracks)
+    records = vehicle_status_data[:]
+    queued = queue_upload(uplink, TOPIC_SEND_SERVER_DATA1, records)
+    # Records are only dropped once they are on the uplink
+    del vehicle_status_data[:len(records)]
+    send_data_to_main_server(client)
+    print(f"Uploaded {len(tracks)} trajectories and {queued} of {len(records)} records")
+
+# Tell each car when an ambulance's region reaches it or moves past it
+def publish_ambulance_notices(client, notices):
+    for car_id, notice in notices:
+        client.publish(TOPIC_AMBULANCE_ALERT.format(car_id), json.dumps(notice))
+
 # Callback for receiving messages
+@metrics.instrument("edgeserver")
 def on_message(client, userdata, msg):
-    global last_speed_store_time, last_location, car_locations
-    topic = msg.topic
-    payload = msg.payload.decode()
-    timestamp = time.time()
+    process_message(client, msg.topic, msg.payload, time.time())
 
+# Handle one message; forward(data, topic) replaces the direct upstream publish
+def process_message(client, topic, payload, timestamp, forward=None):
     try:
-        data = json.loads(payload)
-
-        if topic in [TOPIC_VEHICLE_STATUS_CAR1, TOPIC_VEHICLE_STATUS_CAR2, TOPIC_VEHICLE_STATUS_CAR3]:
-            car_id = data["vehicle_id"]
-            latitude = data["latitude"]
-            longitude = data["longitude"]
-            speed = data.get("speed", None)
-
-            # Store speed if it exceeds the cap or 30 minutes have passed
-            if speed and (speed > SPEED_CAP or timestamp - last_speed_store_time >= STORE_INTERVAL):
-                vehicle_status_data.append({"id": car_id, "speed": speed, "timestamp": timestamp})
-                last_speed_store_time = timestamp
-                print(f"Stored speed: {speed} km/h for {car_id}")
-
-            # Check if the car has moved more than 5 meters
-            if car_id in last_location:
-                prev_lat, prev_lon = last_location[car_id]
-                distance = calculate_distance(prev_lat, prev_lon, latitude, longitude)
-                if distance >= LOCATION_DISTANCE_THRESHOLD:
-                    vehicle_status_data.append({"id": car_id, "latitude": latitude, "longitude": longitude, "timestamp": timestamp})
-                    last_location[car_id] = (latitude, longitude)
-                    print(f"Stored location: {data} (Distance: {distance:.2f} meters)")
+        if sharded is not None and topic in VEHICLE_STATUS_TOPICS:
+            # Workers decode the payload themselves
+            sharded.submit_status(payload, timestamp)
+            return
+
+        # Status frames stay columnar; everything else is stored or forwarded as JSON
+        data = decode(payload, as_lists=topic not in VEHICLE_STATUS_TOPICS)
+
+        if topic in VEHICLE_STATUS_TOPICS:
+            if is_frame(data):
+                state.handle_vehicle_frame(data, timestamp)
             else:
-                # Store the first location
-                last_location[car_id] = (latitude, longitude)
-                vehicle_status_data.append({"id": car_id, "latitude": latitude, "longitude": longitude, "timestamp": timestamp})
-                print(f"Stored initial location: {data}")
+                state.handle_vehicle_status(data, timestamp)
 
         elif topic == TOPIC_SEND_SERVER_DATA:
             print(f"Processing data received on {TOPIC_SEND_SERVER_DATA}: {data}")
             # Process the data and take necessary actions
             # Example: Send the data to the main server
-            send_data_to_main_server(client, data)
+            send_data_to_main_server(client, data, topic)
 
         elif topic == TOPIC_SEND_SERVER_DATA1:
             print(f"Processing data received on {TOPIC_SEND_SERVER_DATA1}: {data}")
@@ -119,30 +160,38 @@ def on_message(client, userdata, msg):
             vehicle_status_data.append(data)
 
         # Process data for other topics and send to servermaincontentsend
-        elif topic in [TOPIC_ACCIDENT, TOPIC_OVERSPEEDING, TOPIC_AUTHORITIES, TOPIC_ROAD_CONDITION, TOPIC_TRAFFIC]:
+        elif topic in FORWARDED_TOPICS:
             print(f"Data received on topic {topic}: {data}")
-            client.publish(TOPIC_SERVER_MAIN_CONTENT_SEND, json.dumps(data))
-            print(f"Published to {TOPIC_SERVER_MAIN_CONTENT_SEND}: {data}")
+            if forward is None:
+                forward_upstream(client, data, topic)
+            else:
+                forward(data, topic)
 
         elif topic == TOPIC_AMBLOC:
             print(f"Received ambulance location: {data}")
-            ambulance_coords = (data['location']['latitude'], data['location']['longitude'])
-            cars_within_radius = []
-            for car_id, car_coords in car_locations.items():
-                distance = calculate_geodesic_distance(ambulance_coords, car_coords)
-                if distance <= 50:
-                    cars_within_radius.append(car_id)
-            print(f"Cars within 50 meters of the ambulance: {cars_within_radius}")
+            ambulance_id = data.get('id', 'ambulance')
+            active = data.get('active', True)
+            location = data['location'] if active else {}
+            # Sharded mode hands the notices to publish_ambulance_notices from its notice thread
+            owner = sharded if sharded is not None else state
+            notices = owner.update_ambulance(ambulance_id, location.get('latitude'), location.get('longitude'),
+                                             data.get('heading'), active, timestamp)
+            if notices:
+                publish_ambulance_notices(client, notices)
+                print(f"Ambulance {ambulance_id}: {len(notices)} cars entered or left its area")
 
         elif topic == TOPIC_CAR_LOCATION:
             car_location = data
             car_id = car_location['id']
             car_coords = (car_location['location']['latitude'], car_location['location']['longitude'])
-            car_locations[car_id] = car_coords
+            owner = sharded if sharded is not None else state
+            notices = owner.update_car_location(car_id, car_coords)
+            if notices:
+                publish_ambulance_notices(client, notices)
             print(f"Updated car location: {car_id} -> {car_coords}")
 
         elif topic == TOPIC_INPUT:
-            input_state = payload.strip().lower()
+            input_state = payload.decode().strip().lower()
             if input_state == "true":
                 print("Received 'true' on input topic. Ready to process emergency messages.")
             elif input_state == "false":
@@ -151,15 +200,77 @@ def on_message(client, userdata, msg):
                 print("Invalid input received. Expected 'true' or 'false'.")
 
     except KeyError as e:
+        metrics.record_error("edgeserver", topic, "key")
         print(f"KeyError: {e}. Check the keys in the received JSON data.")
+    except ValueError as e:
+        metrics.record_error("edgeserver", topic, "decode")
+        print(f"Failed to decode message on {topic}: {e}")
     except Exception as e:
+        metrics.record_error("edgeserver", topic, "handler")
         print(f"Error processing message: {e}")
 
+# asyncio mode: receive into priority lanes, process and forward concurrently
+async def main_async(client):
+    ingest = AsyncIngest(
+        lambda topic, payload, timestamp: process_message(client, topic, payload, timestamp, ingest.forward),
+        TOPIC_PRIORITIES,
+        upstream=lambda data, topic: forward_upstream(client, data, topic),
+        component="edgeserver",
+    )
+    runner = asyncio.create_task(ingest.run())
+    await asyncio.sleep(0)  # Let the ingest bind to the loop before messages arrive
+    client.on_message = lambda client, userdata, msg: ingest.submit(msg.topic, msg.payload)
+
+    try:
+        print(f"Connecting to broker {BROKER}:{PORT}...")
+        client.connect(BROKER, PORT, 60)
+    except Exception as e:
+        print(f"Error: Unable to connect to broker. {e}")
+        ingest.stop()
+        await runner
+        return
+
+    metrics.serve()
+    client.loop_start()
+    loop = asyncio.get_running_loop()
+    try:
+        # Periodic upload to the main server, off the event loop
+        while not runner.done():
+            await loop.run_in_executor(None, upload_state, client)
+            await asyncio.wait([runner], timeout=STORE_INTERVAL)
+    finally:
+        ingest.stop()
+        await runner
+        client.loop_stop()
+
 # Main function
 def main():
-    client = mqtt.Client()
+    global sharded
+    client = create_client()
     client.on_connect = on_connect
-    client.on_message = on_message
+
+    # Optional sharded mode: python edgeserver.py --shards N
+    if "--shards" in sys.argv:
+        sharded = ShardedEdge(int(sys.argv[sys.argv.index("--shards") + 1]),
+                              on_notices=lambda notices: publish_ambulance_notices(client, notices))
+        sharded.start()
+        print(f"Running with {sharded.shards} vehicle state shards")
+
+    # Optional asyncio mode: python edgeserver.py --async
+    if "--async" in sys.argv:
+        try:
+            asyncio.run(main_async(client))
+        except KeyboardInterrupt:
+            print("Stopping the server.")
+            client.disconnect()
+        finally:
+            if sharded is not None:
+                sharded.stop()
+        return
+
+    # Emergency topics get their own queue and worker, ahead of telemetry
+    dispatcher = PriorityDispatcher(on_message, TOPIC_PRIORITIES, component="edgeserver")
+    client.on_message = dispatcher.on_message
 
     # Connect to the MQTT broker
     try:
@@ -171,16 +282,24 @@ def main():
 
     # Start the MQTT client loop
     try:
+        metrics.serve()
+        dispatcher.start()
         client.loop_start()
 
-        # Simulate sending data to main server periodically
+        # Upload to the main server periodically
         while True:
-            send_data_to_main_server(client)
             time.sleep(STORE_INTERVAL)
+            try:
+                upload_state(client)
+            except Exception as e:
+                print(f"Error uploading state: {e}")
 
     except KeyboardInterrupt:
         print("Stopping the server.")
         client.disconnect()
+        dispatcher.stop(drain=False)
+        if sharded is not None:
+            sharded.stop()
 
 # Run the script
 if __name__ == "__main__":
@@ -0,0 +1,85 @@
+import threading
+from continuousquery import ContinuousQueries
+from registry import VehicleRegistry
+from spatialindex import DEFAULT_CELL_SIZE
+from trajectory import TrajectoryStore
+from telemetry import frame_arrays
+
+# Thresholds
+SPEED_CAP = 80  # Speed cap in km/h
+LOCATION_DISTANCE_THRESHOLD = 5  # Location threshold in meters
+STORE_INTERVAL = 30 * 60  # 30 minutes in seconds
+AMBULANCE_RADIUS = 50  # Radius in meters for cars near an ambulance
+
+
+class EdgeState:
+    """Per-vehicle state kept by the edge server.
+
+    edgeserver runs a single instance; in sharded mode every worker process
+    owns one instance holding just the vehicles routed to it, and every
+    ambulance update is broadcast so each shard tracks the ambulances over
+    its own cars. Trajectories have their own lock and the ambulance
+    queries are thread-safe, so priority lane workers can move cars and
+    ambulances while a telemetry frame is being stored.
+    """
+
+    def __init__(self):
+        self.vehicle_status_data = []
+        # Simplified per-vehicle tracks; a point is kept once a car strays more
+        # than LOCATION_DISTANCE_THRESHOLD from its dead-reckoned position
+        self.trajectories = TrajectoryStore(LOCATION_DISTANCE_THRESHOLD, STORE_INTERVAL, SPEED_CAP)
+        # Latest car/location position of every car, gridded for the ambulance queries
+        self.vehicles = VehicleRegistry(cell_size=DEFAULT_CELL_SIZE)
+        # Moving radius (plus a corridor ahead when the heading is known) around each active ambulance
+        self.ambulances = ContinuousQueries(AMBULANCE_RADIUS, registry=self.vehicles)
+        self.trajectories_lock = threading.Lock()
+
+    # Store speed and movement for a single vehicle status reading
+    def handle_vehicle_status(self, data, timestamp):
+        car_id = data["vehicle_id"]
+        speed = data.get("speed", None)
+        with self.trajectories_lock:
+            kept_point, kept_speed = self.trajectories.add(car_id, timestamp, data["latitude"], data["longitude"], speed)
+        if kept_speed:
+            print(f"Stored speed: {speed} km/h for {car_id}")
+        if kept_point:
+            print(f"Stored location: {data}")
+
+    # Store speed and movement for a batched frame of readings in one pass
+    def handle_vehicle_frame(self, data, timestamp):
+        car_ids, latitudes, longitudes, speeds, timestamps = frame_arrays(data, timestamp)
+        if not car_ids:
+            return
+        with self.trajectories_lock:
+            kept, sampled = self.trajectories.add_many(car_ids, timestamps, latitudes, longitudes, speeds)
+        print(f"Stored {len(kept)} locations and {len(sampled)} speeds from a frame of {len(car_ids)}")
+
+    def update_car_location(self, car_id, car_coords):
+        """Record a car's position (in self.vehicles); returns the ambulance notices it caused"""
+        return self.ambulance_notices(self.ambulances.update_car(car_id, car_coords[0], car_coords[1]))
+
+    def update_ambulance(self, ambulance_id, latitude, longitude, heading=None, active=True, timestamp=None):
+        """Move an ambulance's query (drop it when inactive) and expire quiet ones; returns the notices"""
+        if active:
+            deltas = self.ambulances.update_query(ambulance_id, latitude, longitude, heading, timestamp=timestamp)
+        else:
+            deltas = self.ambulances.remove_query(ambulance_id)
+        if timestamp is not None:
+            deltas += self.ambulances.expire(timestamp)
+        return self.ambulance_notices(deltas)
+
+    def ambulance_notices(self, deltas):
+        """(car id, notice) for each enter/leave delta, with the ambulance's current position"""
+        notices = []
+        for ambulance_id, car_id, event in deltas:
+            region = self.ambulances.regions.get(ambulance_id)
+            notice = {"ambulance_id": ambulance_id, "event": event}
+            if region is not None:
+                notice.update(latitude=region.latitude, longitude=region.longitude, heading=region.heading)
+            notices.append((car_id, notice))
+        return notices
+
+    def drain(self):
+        """Kept trajectory points per vehicle, cleared as they are returned"""
+        with self.trajectories_lock:
+            return self.trajectories.drain()
@@ -0,0 +1,97 @@
+import math
+import time
+import numpy as np
+from telemetry import FRAME_VERSION
+
+EARTH_RADIUS = 6371 * 1000  # Radius of Earth in meters
+
+# Defaults: a fleet spread over 10 km around Bangalore
+DEFAULT_CENTER = (12.9716, 77.5946)
+DEFAULT_RADIUS = 10000  # meters
+DEFAULT_MEAN_SPEED = 45  # km/h
+MAX_SPEED = 150  # km/h
+SPEED_REVERSION = 0.1  # Fraction of the gap to the vehicle's cruise speed closed per second
+SPEED_NOISE = 3  # km/h of random acceleration per sqrt(second)
+TURN_NOISE = 0.15  # Radians of heading change per sqrt(second)
+
+
+class FleetSimulator:
+    """Vectorized simulator for N vehicles moving along plausible trajectories.
+
+    Every vehicle has a position, heading and speed held in NumPy arrays.
+    Speeds revert towards a per-vehicle cruise speed with random noise,
+    headings random-walk, and vehicles that leave the area turn back towards
+    the centre. step() advances the whole fleet at once, so ticks for a
+    million vehicles stay cheap.
+    """
+
+    def __init__(self, vehicle_count, center=DEFAULT_CENTER, radius=DEFAULT_RADIUS,
+                 mean_speed=DEFAULT_MEAN_SPEED, seed=None, id_prefix="car"):
+        self.rng = np.random.default_rng(seed)
+        self.count = vehicle_count
+        self.center = center
+        self.radius = radius
+        self.vehicle_ids = [f"{id_prefix}{i}" for i in range(vehicle_count)]
+
+        # Uniform random positions inside the area
+        distance = radius * np.sqrt(self.rng.random(vehicle_count))
+        bearing = self.rng.uniform(0, 2 * math.pi, vehicle_count)
+        self.latitude = center[0] + np.degrees(distance * np.cos(bearing) / EARTH_RADIUS)
+        self.longitude = center[1] + np.degrees(
+            distance * np.sin(bearing) / (EARTH_RADIUS * math.cos(math.radians(center[0]))))
+        self.heading = self.rng.uniform(0, 2 * math.pi, vehicle_count)
+        self.cruise_speed = np.clip(self.rng.normal(mean_speed, mean_speed / 3, vehicle_count), 5, MAX_SPEED)
+        self.speed = self.cruise_speed.copy()
+        self.timestamp = time.time()
+
+    def step(self, dt=1.0):
+        """Advance every vehicle by dt seconds"""
+        noise = math.sqrt(dt)
+        self.speed += SPEED_REVERSION * dt * (self.cruise_speed - self.speed)
+        self.speed += self.rng.normal(0, SPEED_NOISE * noise, self.count)
+        np.clip(self.speed, 0, MAX_SPEED, out=self.speed)
+        self.heading += self.rng.normal(0, TURN_NOISE * noise, self.count)
+
+        # Vehicles outside the area head back towards the centre
+        north = (self.latitude - self.center[0]) * (math.pi / 180) * EARTH_RADIUS
+        east = (self.longitude - self.center[1]) * (math.pi / 180) * EARTH_RADIUS * math.cos(math.radians(self.center[0]))
+        outside = north * north + east * east > self.radius * self.radius
+        if outside.any():
+            self.heading[outside] = np.arctan2(-east[outside], -north[outside])
+
+        meters = self.speed * (dt / 3.6)
+        lat_rad = np.radians(self.latitude)
+        self.latitude += np.degrees(meters * np.cos(self.heading) / EARTH_RADIUS)
+        self.longitude += np.degrees(meters * np.sin(self.heading) / (EARTH_RADIUS * np.cos(lat_rad)))
+        self.timestamp += dt
+
+    def frame(self, start=0, stop=None):
+        """Telemetry frame (NumPy columns) for vehicles start..stop"""
+        stop = self.count if stop is None else stop
+        return {
+            "frame": FRAME_VERSION,
+            "vehicle_id": self.vehicle_ids[start:stop],
+            "latitude": self.latitude[start:stop],
+            "longitude": self.longitude[start:stop],
+            "speed": self.speed[start:stop],
+            "timestamp": np.full(stop - start, self.timestamp),
+        }
+
+    def frames(self, batch_size):
+        for start in range(0, self.count, batch_size):
+            yield self.frame(start, min(start + batch_size, self.count))
+
+    def readings(self, start=0, stop=None):
+        """Per-vehicle reading dicts, for publishers that send one message per car"""
+        stop = self.count if stop is None else stop
+        return [
+            {"vehicle_id": vehicle_id, "latitude": lat, "longitude": lon, "speed": speed, "timestamp": self.timestamp}
+            for vehicle_id, lat, lon, speed in zip(
+                self.vehicle_ids[start:stop], self.latitude[start:stop].tolist(),
+                self.longitude[start:stop].tolist(), self.speed[start:stop].tolist())
+        ]
+
+
+def json_frame(frame):
+    """Convert a frame's NumPy columns to lists so it can go through json.dumps"""
+    return {name: value.tolist() if isinstance(value, np.ndarray) else value for name, value in frame.items()}
@@ -0,0 +1,152 @@
+import math
+import numpy as np
+
+EARTH_RADIUS = 6371 * 1000  # Mean radius of Earth in meters
+
+# WGS-84 ellipsoid, the same model geopy's geodesic uses
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+
+# Vincenty iteration limits; city-scale pairs converge in 2-4 iterations
+VINCENTY_TOLERANCE = 1e-12
+VINCENTY_MAX_ITERATIONS = 200
+
+# Accuracy tiers, cheapest first:
+#   equirectangular  flat-earth approximation, within a meter of haversine at city scale
+#   haversine        great circle on a sphere, up to ~0.5% off the ellipsoid
+#   ellipsoidal      Vincenty on WGS-84, matches geopy's geodesic to millimeters
+METHODS = ("equirectangular", "haversine", "ellipsoidal")
+
+
+# Scalar haversine for single pairs, where NumPy call overhead would dominate
+def haversine_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    a = math.sin((lat2 - lat1) / 2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2)**2
+    return EARTH_RADIUS * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+# Scalar flat-earth distance for single pairs
+def equirectangular_distance(lat1, lon1, lat2, lon2):
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS * math.sqrt(x * x + y * y)
+
+
+def _arrays(*values):
+    return np.broadcast_arrays(*(np.asarray(value, dtype=np.float64) for value in values))
+
+
+def equirectangular(lat1, lon1, lat2, lon2):
+    """Flat-earth distance in meters; arguments broadcast like NumPy arrays"""
+    lat1, lon1, lat2, lon2 = _arrays(lat1, lon1, lat2, lon2)
+    x = np.radians(lon2 - lon1) * np.cos(np.radians((lat1 + lat2) / 2))
+    y = np.radians(lat2 - lat1)
+    return EARTH_RADIUS * np.hypot(x, y)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters on a sphere; arguments broadcast"""
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in _arrays(lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2)**2
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def vincenty(lat1, lon1, lat2, lon2):
+    """Ellipsoidal (WGS-84) distance in meters by Vincenty's inverse formula.
+
+    All pairs iterate together; pairs that have converged stop changing and
+    the loop ends once every pair is within tolerance. Nearly antipodal
+    pairs, where the method does not converge, fall back to haversine.
+    """
+    lat1, lon1, lat2, lon2 = _arrays(lat1, lon1, lat2, lon2)
+    f = WGS84_F
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(VINCENTY_MAX_ITERATIONS):
+            sinLam, cosLam = np.sin(lam), np.cos(lam)
+            sinSigma = np.hypot(cosU2 * sinLam, cosU1 * sinU2 - sinU1 * cosU2 * cosLam)
+            cosSigma = sinU1 * sinU2 + cosU1 * cosU2 * cosLam
+            sigma = np.arctan2(sinSigma, cosSigma)
+            sinAlpha = np.where(sinSigma == 0, 0.0, cosU1 * cosU2 * sinLam / sinSigma)
+            cos2Alpha = 1 - sinAlpha * sinAlpha
+            # Equatorial lines have cos2Alpha == 0
+            cos2SigmaM = np.where(cos2Alpha == 0, 0.0, cosSigma - 2 * sinU1 * sinU2 / cos2Alpha)
+            C = f / 16 * cos2Alpha * (4 + f * (4 - 3 * cos2Alpha))
+            previous = lam
+            lam = L + (1 - C) * f * sinAlpha * (
+                sigma + C * sinSigma * (cos2SigmaM + C * cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM)))
+            converged = np.abs(lam - previous) < VINCENTY_TOLERANCE
+            if converged.all():
+                break
+
+        u2 = cos2Alpha * (WGS84_A**2 - WGS84_B**2) / WGS84_B**2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        deltaSigma = B * sinSigma * (cos2SigmaM + B / 4 * (
+            cosSigma * (-1 + 2 * cos2SigmaM**2)
+            - B / 6 * cos2SigmaM * (-3 + 4 * sinSigma**2) * (-3 + 4 * cos2SigmaM**2)))
+        meters = WGS84_B * A * (sigma - deltaSigma)
+
+    if not converged.all():
+        meters = np.where(converged, meters, haversine(lat1, lon1, lat2, lon2))
+    return meters
+
+
+_KERNELS = {"equirectangular": equirectangular, "haversine": haversine, "ellipsoidal": vincenty}
+
+
+def distance(lat1, lon1, lat2, lon2, method="haversine"):
+    """Distance in meters between points; scalars and arrays broadcast.
+
+    One-to-many is distance(lat, lon, lats, lons); see distance_matrix for
+    many-to-many.
+    """
+    try:
+        kernel = _KERNELS[method]
+    except KeyError:
+        raise ValueError(f"Unknown distance method: {method}") from None
+    return kernel(lat1, lon1, lat2, lon2)
+
+
+def distance_matrix(lats1, lons1, lats2, lons2, method="haversine"):
+    """len(lats1) x len(lats2) matrix of distances in meters"""
+    lats1 = np.asarray(lats1, dtype=np.float64)[:, None]
+    lons1 = np.asarray(lons1, dtype=np.float64)[:, None]
+    return distance(lats1, lons1, lats2, lons2, method)
+
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Initial great-circle bearing in degrees clockwise from north (0..360)"""
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in _arrays(lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    x = np.sin(dlon) * np.cos(lat2)
+    y = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(x, y)) % 360
+
+
+def within_radius(lat, lon, lats, lons, radius, method="haversine"):
+    """Boolean mask of the points within radius meters of (lat, lon).
+
+    Arguments broadcast, so lat/lon may also be column vectors for a
+    many-to-many mask. The ellipsoidal tier first discards points well
+    outside the radius with the equirectangular kernel and runs Vincenty
+    only on the survivors.
+    """
+    if method != "ellipsoidal":
+        return distance(lat, lon, lats, lons, method) <= radius
+    lat, lon, lats, lons = _arrays(lat, lon, lats, lons)
+    if lat.ndim == 0:
+        # A single pair of points: nothing to prefilter
+        return vincenty(lat, lon, lats, lons) <= radius
+    mask = equirectangular(lat, lon, lats, lons) <= radius * 1.01 + 1
+    if mask.any():
+        mask[mask] = vincenty(lat[mask], lon[mask], lats[mask], lons[mask]) <= radius
+    return mask
@@ -0,0 +1,190 @@
+import json
+import time
+import uuid
+import threading
+from geo import equirectangular_distance
+from spatialindex import GridIndex
+import metrics
+
+# Reports of the same kind within this distance and time window are one incident
+INCIDENT_RADIUS = 150  # meters from the first report
+INCIDENT_WINDOW = 300  # seconds since the incident's latest report
+
+# Per-reporter acknowledgements are published in batches of at most
+# ACK_BATCH_SIZE, and no acknowledgement waits longer than ACK_DELAY
+ACK_BATCH_SIZE = 200
+ACK_DELAY = 0.25
+
+
+class Incident:
+    """One real-world event and the reports that described it"""
+
+    __slots__ = ("incident_id", "kind", "latitude", "longitude", "first_seen", "last_seen", "reports", "reporters")
+
+    def __init__(self, kind, latitude, longitude, timestamp):
+        self.incident_id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.latitude = latitude
+        self.longitude = longitude
+        self.first_seen = timestamp
+        self.last_seen = timestamp
+        self.reports = 0
+        self.reporters = set()
+
+    def to_dict(self):
+        return {"incident_id": self.incident_id, "kind": self.kind,
+                "location": {"lat": self.latitude, "lng": self.longitude},
+                "first_seen": self.first_seen, "last_seen": self.last_seen,
+                "reports": self.reports, "reporters": len(self.reporters)}
+
+
+class IncidentCoalescer:
+    """Folds reports of the same kind, place and time into one Incident.
+
+    Open incidents sit in a GridIndex per kind at the location of their
+    first report, so a report only looks at incidents in the few cells
+    around it. A report within radius meters of an open incident whose
+    latest report is at most window seconds old joins it (the nearest,
+    if several); otherwise it opens a new one. Anchoring at the first
+    report keeps a stream of reports from dragging an incident down the
+    road. Thread-safe.
+    """
+
+    def __init__(self, radius=INCIDENT_RADIUS, window=INCIDENT_WINDOW):
+        self.radius = radius
+        self.window = window
+        self.incidents = {}  # incident id -> Incident
+        self.indexes = {}  # kind -> GridIndex of open incident ids
+        self.swept = 0.0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.incidents)
+
+    def report(self, kind, latitude, longitude, reporter=None, timestamp=None):
+        """Record one report; returns (incident, True if the report opened it)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            if timestamp - self.swept > self.window / 10:
+                self._expire(timestamp)
+            index = self.indexes.get(kind)
+            if index is None:
+                index = self.indexes[kind] = GridIndex(self.radius)
+            nearest = None
+            nearest_distance = self.radius
+            for incident_id, lat, lon in index.candidates(latitude, longitude, self.radius):
+                incident = self.incidents[incident_id]
+                if timestamp - incident.last_seen > self.window:
+                    continue
+                meters = equirectangular_distance(latitude, longitude, lat, lon)
+                if meters <= nearest_distance:
+                    nearest, nearest_distance = incident, meters
+            created = nearest is None
+            if created:
+                nearest = Incident(kind, latitude, longitude, timestamp)
+                self.incidents[nearest.incident_id] = nearest
+                index.update(nearest.incident_id, latitude, longitude)
+            nearest.last_seen = max(nearest.last_seen, timestamp)
+            nearest.reports += 1
+            if reporter is not None:
+                nearest.reporters.add(reporter)
+        return nearest, created
+
+    def expire(self, now=None):
+        """Close incidents with no report for window seconds; returns how many"""
+        with self.lock:
+            return self._expire(time.time() if now is None else now)
+
+    def _expire(self, now):
+        self.swept = now
+        stale = [incident for incident in self.incidents.values() if now - incident.last_seen > self.window]
+        for incident in stale:
+            del self.incidents[incident.incident_id]
+            self.indexes[incident.kind].remove(incident.incident_id)
+        return len(stale)
+
+
+class AckBatcher:
+    """Publishes per-reporter acknowledgements in batches from a background thread.
+
+    add() only queues the acknowledgement under its response topic. A topic's
+    batch is published as one message {"acks": [...]} once it holds
+    max_batch acknowledgements or its oldest one is max_delay old, so a
+    burst of reports for one crash costs a handful of publishes.
+    """
+
+    def __init__(self, client, max_batch=ACK_BATCH_SIZE, max_delay=ACK_DELAY):
+        self.client = client
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending = {}  # response topic -> (deadline, list of acks)
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def __len__(self):
+        with self.condition:
+            return sum(len(acks) for _, acks in self.pending.values())
+
+    def add(self, topic, ack):
+        with self.condition:
+            entry = self.pending.get(topic)
+            if entry is None:
+                entry = self.pending[topic] = (time.monotonic() + self.max_delay, [])
+                self.condition.notify()
+            entry[1].append(ack)
+            if len(entry[1]) >= self.max_batch:
+                del self.pending[topic]
+                full = entry[1]
+            else:
+                full = None
+        if full is not None:
+            self._publish(topic, full)
+
+    def _publish(self, topic, acks):
+        try:
+            self.client.publish(topic, json.dumps({"acks": acks}))
+            metrics.registry.inc("button_ack_batches_total", (("topic", topic),))
+        except Exception as e:
+            print(f"Failed to publish acknowledgements to {topic}: {e}")
+
+    def flush(self):
+        """Publish every pending batch now"""
+        with self.condition:
+            pending, self.pending = self.pending, {}
+        for topic, (_, acks) in pending.items():
+            self._publish(topic, acks)
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the thread and publish what is still pending"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                now = time.monotonic()
+                due = [topic for topic, (deadline, _) in self.pending.items() if deadline <= now]
+                while self.running and not due:
+                    deadlines = [deadline for deadline, _ in self.pending.values()]
+                    self.condition.wait(min(deadlines) - now if deadlines else None)
+                    now = time.monotonic()
+                    due = [topic for topic, (deadline, _) in self.pending.items() if deadline <= now]
+                if not self.running:
+                    return
+                batches = [(topic, self.pending.pop(topic)[1]) for topic in due]
+            for topic, acks in batches:
+                self._publish(topic, acks)
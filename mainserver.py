@@ -1,24 +1,91 @@
-from flask import Flask, request, jsonify
-import paho.mqtt.client as mqtt
-import json
+from flask import Flask, Response, request, jsonify
+import os
+from urllib.parse import quote
+from topicstore import TopicStore
+from segmentstore import SegmentStore, FSYNC_INTERVAL
+from responsecache import ResponseCache
+from tiles import TileAggregator, MAX_ZOOM
+from codec import decode
+from uplink import TOPIC_UPLINK, Deduplicator, decode_batch, is_batch
+from transport import BROKER, PORT, create_client
+from priority import PriorityDispatcher, EMERGENCY, HIGH, NORMAL, BULK, topic_priorities
+import metrics
 
 app = Flask(__name__)
 
-# In-memory storage for demonstration purposes
+# Per-topic bounded, time-indexed message storage
+MAX_ROWS_PER_TOPIC = 100000
+MAX_AGE_SECONDS = 24 * 60 * 60
+DEFAULT_QUERY_LIMIT = 1000
+MAX_QUERY_LIMIT = 10000
+# Durable per-topic segment files live under MAIN_STORE_DIR; unset keeps rows in memory only
+STORE_DIR = os.environ.get("MAIN_STORE_DIR")
+# Seconds between fsyncs of the segment files; rows written since the last one can be lost on power failure
+FSYNC_SECONDS = float(os.environ.get("MAIN_STORE_FSYNC_SECONDS", FSYNC_INTERVAL))
+
+# Streaming / long-poll settings
+MAX_WAIT_SECONDS = 30  # Longest a long-poll get_data request may block
+STREAM_KEEPALIVE_SECONDS = 15  # Idle interval before an SSE keep-alive comment
+STREAM_BATCH = 500  # Rows read per wake-up of a stream
+
+# Serialized /get_data responses, reused until their topic changes (new rows or expired ones)
+response_cache = ResponseCache()
+
+def open_store(topic):
+    on_expire = lambda: response_cache.bump(topic)
+    if STORE_DIR:
+        return SegmentStore(os.path.join(STORE_DIR, quote(topic, safe="")), MAX_ROWS_PER_TOPIC, MAX_AGE_SECONDS,
+                            fsync_interval=FSYNC_SECONDS, on_expire=on_expire)
+    return TopicStore(MAX_ROWS_PER_TOPIC, MAX_AGE_SECONDS, on_expire=on_expire)
+
 data_store = {
-    "accident": [],
-    "cartow": [],
-    "overspeeding": [],
-    "roadcondition": [],
-    "traffic": [],
-    "myvehiclestatus": [],
-    "serverdata/carid": [],
-    "Serversend1": []
+    topic: open_store(topic)
+    for topic in [
+        "accident",
+        "cartow",
+        "overspeeding",
+        "roadcondition",
+        "traffic",
+        "myvehiclestatus",
+        "serverdata/carid",
+        "Serversend1",
+        # Event topics that only arrive in edge uplink batches
+        "authorities",
+        "trajectory",
+        "sendserverdata",
+        "sendserverdata1"
+    ]
 }
 
+# Priority lane per topic; MQTT_TOPIC_PRIORITIES overrides entries. Accidents
+# also arrive directly from the broker, so they never wait behind uplink batches.
+TOPIC_PRIORITIES = topic_priorities({
+    "accident": EMERGENCY,
+    "cartow": HIGH,
+    "overspeeding": HIGH,
+    "roadcondition": NORMAL,
+    "traffic": NORMAL,
+    "serverdata/carid": NORMAL,
+    "Serversend1": NORMAL,
+    TOPIC_UPLINK: NORMAL,
+    "myvehiclestatus": BULK,
+})
+
+# Time-decayed heatmap counters per map tile, served by /tiles/<z>/<x>/<y>
+TILE_LAYERS = ["traffic", "roadcondition"]
+TILE_MAX_AGE = 5  # Seconds a browser may reuse a tile response
+tiles = TileAggregator(TILE_LAYERS)
+
+# Edge uplink batches may be replayed after a stall; each is stored once
+uplink_dedup = Deduplicator()
+
+metrics.gauge("main_stored_rows", lambda: {topic: len(store) for topic, store in data_store.items()},
+              "Rows held per topic", label="topic")
+metrics.gauge("main_tile_cells", lambda: len(tiles), "Heatmap tile cells across all zoom levels")
+
 # MQTT broker details
-broker = "broker.emqx.io"
-port = 1883
+broker = BROKER
+port = PORT
 
 # Callback when the client successfully connects to the broker
 def on_connect(client, userdata, flags, rc):
@@ -33,32 +100,175 @@ def on_connect(client, userdata, flags, rc):
         client.subscribe("myvehiclestatus")
         client.subscribe("serverdata/carid")
         client.subscribe("Serversend1")
+        client.subscribe(TOPIC_UPLINK)
     else:
         print(f"Failed to connect, return code {rc}")
 
 # Callback when a message is received from the broker
+@metrics.instrument("mainserver")
 def on_message(client, userdata, msg):
     topic = msg.topic
-    payload = json.loads(msg.payload.decode())
+    if topic == TOPIC_UPLINK and is_batch(msg.payload):
+        store_batch(msg.payload)
+        return
+    try:
+        payload = decode(msg.payload, as_lists=True)
+    except ValueError as e:
+        metrics.record_error("mainserver", topic, "decode")
+        print(f"Failed to decode message on {topic}: {e}")
+        return
     if topic in data_store:
         data_store[topic].append(payload)
+        response_cache.bump(topic)
+        tiles.add(topic, payload)
         print(f"Received and stored message on {topic}: {payload}")
 
+# Store every event of an edge uplink batch under its own topic
+def store_batch(payload):
+    try:
+        source, seq, events = decode_batch(payload)
+    except (ValueError, KeyError) as e:
+        metrics.record_error("mainserver", TOPIC_UPLINK, "decode")
+        print(f"Failed to decode uplink batch: {e}")
+        return
+    if not uplink_dedup.is_new(source, seq):
+        metrics.registry.inc("uplink_duplicate_batches_total")
+        return
+    stored = 0
+    changed = set()
+    for event in events:
+        store = data_store.get(event.get("topic"))
+        if store is not None:
+            store.append(event.get("data"))
+            tiles.add(event["topic"], event.get("data"))
+            changed.add(event["topic"])
+            stored += 1
+    for topic in changed:
+        response_cache.bump(topic)
+    print(f"Stored {stored} of {len(events)} events from uplink batch {seq}")
+
 # Initialize MQTT client
-mqtt_client = mqtt.Client()
+mqtt_client = create_client()
 mqtt_client.on_connect = on_connect
-mqtt_client.on_message = on_message
+dispatcher = PriorityDispatcher(on_message, TOPIC_PRIORITIES, component="mainserver")
+mqtt_client.on_message = dispatcher.on_message
 
 @app.route('/')
 def index():
     return jsonify({"message": "Welcome to the Button Server!"})
 
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+# Parse the since/until/cursor/limit query parameters for get_data
+def parse_query_args(args):
+    values = {}
+    for name, convert in (('since', float), ('until', float), ('cursor', int), ('limit', int), ('wait', float)):
+        raw = args.get(name)
+        try:
+            values[name] = convert(raw) if raw else None
+        except ValueError:
+            raise ValueError(f"Invalid value for {name}: {raw}")
+
+    limit = values['limit'] if values['limit'] is not None else DEFAULT_QUERY_LIMIT
+    if limit <= 0:
+        raise ValueError("limit must be a positive integer")
+    wait = min(max(values['wait'] or 0, 0), MAX_WAIT_SECONDS)
+    return values['since'], values['until'], values['cursor'], min(limit, MAX_QUERY_LIMIT), wait
+
 @app.route('/get_data/<topic>', methods=['GET'])
 def get_data(topic):
-    if topic in data_store:
-        return jsonify(data_store[topic]), 200
+    if topic not in data_store:
+        return jsonify({"error": "Invalid topic"}), 400
+    try:
+        since, until, cursor, limit, wait = parse_query_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    shape = (since, until, cursor, limit)
+    store = data_store[topic]
+    # Drop rows past max_age first; that bumps the topic's version, so no cached body still holds them
+    store.expire()
+    entry = response_cache.get(topic, shape)
+    if entry is None or (wait and not entry.count):
+        version = response_cache.version(topic)
+        if cursor is not None and since is None and until is None:
+            # Incremental poll: always hand back where to resume, and with wait
+            # set, block until a new event arrives instead of returning empty
+            seq, rows = store.read_raw(cursor, limit)
+            if not rows and wait and store.wait_for(seq, wait):
+                version = response_cache.version(topic)
+                seq, rows = store.read_raw(seq, limit)
+            next_cursor = seq + len(rows)
+        else:
+            rows, next_cursor = store.query_raw(since, until, cursor, limit)
+        # Rows are already JSON, so the body is assembled without re-encoding them
+        entry = response_cache.put(topic, shape, version, b"[" + b",".join(rows) + b"]", len(rows), next_cursor)
+    return cached_response(entry)
+
+# Serve a cached body: 304 if the client has it, gzipped if the client accepts it
+def cached_response(entry):
+    if request.if_none_match.contains_weak(entry.etag):
+        response = Response(status=304)
     else:
+        body = entry.gzipped() if request.accept_encodings.quality('gzip') > 0 else None
+        response = Response(body or entry.body, content_type='application/json')
+        if body is not None:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(entry.etag, weak=True)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    if entry.next_cursor is not None:
+        response.headers['X-Next-Cursor'] = str(entry.next_cursor)
+    return response
+
+# Heatmap aggregates for one map tile, as a grid of finer cells per layer
+@app.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+def get_tile(z, x, y):
+    try:
+        zoom, layers = tiles.tile(z, x, y)
+    except ValueError as e:
+        return jsonify({"error": str(e), "max_zoom": MAX_ZOOM}), 404
+    response = jsonify({"z": z, "x": x, "y": y, "cell_zoom": zoom, "layers": layers})
+    response.headers['Cache-Control'] = f'max-age={TILE_MAX_AGE}'
+    # The map page is not served by this app; tiles are public aggregates
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+# Server-Sent Events stream of new messages on a topic
+@app.route('/stream/<topic>', methods=['GET'])
+def stream(topic):
+    if topic not in data_store:
         return jsonify({"error": "Invalid topic"}), 400
+    store = data_store[topic]
+
+    # Resume after Last-Event-ID on reconnect, else start from ?cursor or from now
+    last_event_id = request.headers.get('Last-Event-ID')
+    try:
+        if last_event_id:
+            cursor = int(last_event_id) + 1
+        else:
+            cursor = request.args.get('cursor', store.next_seq, type=int)
+    except ValueError:
+        return jsonify({"error": "Invalid Last-Event-ID"}), 400
+
+    def events(cursor):
+        yield "retry: 2000\n\n"
+        while True:
+            if not store.wait_for(cursor, STREAM_KEEPALIVE_SECONDS):
+                yield ": keep-alive\n\n"
+                continue
+            seq, rows = store.read_raw(cursor, STREAM_BATCH)
+            chunks = []
+            for row in rows:
+                chunks.append(f"id: {seq}\ndata: {row.decode()}\n\n")
+                seq += 1
+            cursor = seq
+            yield "".join(chunks)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(events(cursor), mimetype='text/event-stream', headers=headers)
 
 # Main function to connect to MQTT broker and start Flask app
 def main():
@@ -68,6 +278,7 @@ def main():
         print(f"Error connecting to MQTT broker: {e}")
         return
 
+    dispatcher.start()
     mqtt_client.loop_start()
     app.run(host='0.0.0.0', port=5000, debug=True)
 
@@ -0,0 +1,281 @@
+import os
+import re
+import math
+import xml.etree.ElementTree as ET
+import numpy as np
+from spatialindex import METERS_PER_DEGREE
+
+# Path of the OSM XML road-network extract; unset disables map matching
+ROAD_NETWORK_ENV = "ROAD_NETWORK"
+
+# Grid cell edge over road segments, in meters
+DEFAULT_CELL_SIZE = 100
+
+# Matching thresholds (meters)
+MAX_MATCH_DISTANCE = 40  # Points farther than this from every road stay unmatched
+STICKY_DISTANCE = 8  # Within this of the previous segment's interior, keep it without a search
+TRANSITION_PENALTY = 15  # Added to segments not connected to the previous match
+HEADING_PENALTY = 10  # Added per 90 degrees between the travel direction and the segment
+MIN_HEADING_MOVE = 3  # Movement needed before a travel direction is derived from two points
+
+# km/h by highway class, for ways without a usable maxspeed tag
+DEFAULT_MAX_SPEEDS = {
+    "motorway": 100, "motorway_link": 60, "trunk": 80, "trunk_link": 50, "primary": 60, "primary_link": 40,
+    "secondary": 50, "secondary_link": 40, "tertiary": 50, "tertiary_link": 40, "unclassified": 40,
+    "residential": 30, "living_street": 20, "service": 20,
+}
+# Highway classes cars do not drive on
+NON_ROAD_HIGHWAYS = {"footway", "path", "cycleway", "steps", "pedestrian", "bridleway", "corridor", "proposed",
+                     "construction", "platform", "elevator"}
+
+_SPEED = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(mph|km/h|kmh|kph)?\s*$")
+
+
+def parse_max_speed(value, highway=None):
+    """km/h from an OSM maxspeed tag, falling back to the highway class default"""
+    if value:
+        match = _SPEED.match(value.split(";")[0])
+        if match:
+            speed = float(match.group(1))
+            return speed * 1.609344 if match.group(2) == "mph" else speed
+    return DEFAULT_MAX_SPEEDS.get(highway)
+
+
+def load_osm(path, cell_size=DEFAULT_CELL_SIZE):
+    """RoadNetwork from the drivable highway ways of an OSM XML extract.
+
+    The file is streamed: every top-level element (node, way, relation, ...)
+    is cleared and detached from the root once it has been read, so only
+    node coordinates and the kept ways' node lists are held while parsing.
+    """
+    nodes = {}
+    ways = []
+    root = None
+    depth = 0
+    for event, element in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue  # The root itself, or a tag/nd/member inside a top-level element
+        if element.tag == "node":
+            nodes[int(element.get("id"))] = (float(element.get("lat")), float(element.get("lon")))
+        elif element.tag == "way":
+            tags = {tag.get("k"): tag.get("v") for tag in element.iter("tag")}
+            highway = tags.get("highway")
+            if highway and highway not in NON_ROAD_HIGHWAYS:
+                refs = [int(nd.get("ref")) for nd in element.iter("nd")]
+                ways.append((int(element.get("id")), refs, tags))
+        element.clear()
+        root.clear()
+    return RoadNetwork(ways, nodes, cell_size)
+
+
+def network_from_env(cell_size=DEFAULT_CELL_SIZE):
+    """RoadNetwork loaded from $ROAD_NETWORK, or None if it is not set"""
+    path = os.environ.get(ROAD_NETWORK_ENV)
+    if not path:
+        return None
+    network = load_osm(path, cell_size)
+    print(f"Loaded {len(network)} road segments from {path}")
+    return network
+
+
+class RoadNetwork:
+    """Road segments (consecutive node pairs of each way) in NumPy columns.
+
+    A static grid maps every cell a segment's bounding box overlaps to the
+    segment, so the candidates near a point come from the few cells around
+    it. Segment ids are row numbers; segment_key gives the stable
+    "<way id>:<position>" name used outside this module.
+    """
+
+    def __init__(self, ways, nodes, cell_size=DEFAULT_CELL_SIZE):
+        self.way_ids = []
+        self.names = []
+        self.max_speeds = []
+        self.way_start = []
+        oneway = []
+        starts, ends, segment_ways = [], [], []
+        for way_id, refs, tags in ways:
+            refs = [ref for ref in refs if ref in nodes]
+            if len(refs) < 2:
+                continue
+            way = len(self.way_ids)
+            self.way_ids.append(way_id)
+            self.names.append(tags.get("name") or tags.get("ref"))
+            self.max_speeds.append(parse_max_speed(tags.get("maxspeed"), tags.get("highway")))
+            self.way_start.append(len(starts))
+            direction = tags.get("oneway")
+            oneway.append(direction in ("yes", "true", "1", "-1") or tags.get("junction") == "roundabout")
+            if direction == "-1":
+                refs = refs[::-1]
+            starts.extend(refs[:-1])
+            ends.extend(refs[1:])
+            segment_ways.extend([way] * (len(refs) - 1))
+        self.oneway = np.array(oneway, dtype=bool)
+        self.node1 = np.array(starts, dtype=np.int64)
+        self.node2 = np.array(ends, dtype=np.int64)
+        self.way = np.array(segment_ways, dtype=np.int32)
+        self.lat1 = np.array([nodes[ref][0] for ref in starts], dtype=np.float64)
+        self.lon1 = np.array([nodes[ref][1] for ref in starts], dtype=np.float64)
+        self.lat2 = np.array([nodes[ref][0] for ref in ends], dtype=np.float64)
+        self.lon2 = np.array([nodes[ref][1] for ref in ends], dtype=np.float64)
+        self.cell_degrees = cell_size / METERS_PER_DEGREE
+        self.cells = self._build_grid()
+
+    def __len__(self):
+        return len(self.node1)
+
+    def _build_grid(self):
+        degrees = self.cell_degrees
+        row_min = np.floor(np.minimum(self.lat1, self.lat2) / degrees).astype(np.int64)
+        row_max = np.floor(np.maximum(self.lat1, self.lat2) / degrees).astype(np.int64)
+        col_min = np.floor(np.minimum(self.lon1, self.lon2) / degrees).astype(np.int64)
+        col_max = np.floor(np.maximum(self.lon1, self.lon2) / degrees).astype(np.int64)
+        cells = {}
+        for segment, (r0, r1, c0, c1) in enumerate(zip(row_min.tolist(), row_max.tolist(),
+                                                       col_min.tolist(), col_max.tolist())):
+            for row in range(r0, r1 + 1):
+                for col in range(c0, c1 + 1):
+                    cells.setdefault((row, col), []).append(segment)
+        return {cell: np.array(segments, dtype=np.int64) for cell, segments in cells.items()}
+
+    def candidates(self, latitude, longitude, radius):
+        """Ids of the segments in the cells overlapping radius meters around the point"""
+        degrees = self.cell_degrees
+        lat_span = radius / METERS_PER_DEGREE
+        lon_span = lat_span / max(math.cos(math.radians(latitude)), 1e-6)
+        found = [self.cells.get((row, col))
+                 for row in range(math.floor((latitude - lat_span) / degrees),
+                                  math.floor((latitude + lat_span) / degrees) + 1)
+                 for col in range(math.floor((longitude - lon_span) / degrees),
+                                  math.floor((longitude + lon_span) / degrees) + 1)]
+        found = [segments for segments in found if segments is not None]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return found[0] if len(found) == 1 else np.concatenate(found)
+
+    def project(self, segments, latitude, longitude):
+        """(distances in meters, position along each segment 0..1, bearings in degrees) for the point"""
+        lon_scale = math.cos(math.radians(latitude)) * METERS_PER_DEGREE
+        ax = (self.lon1[segments] - longitude) * lon_scale
+        ay = (self.lat1[segments] - latitude) * METERS_PER_DEGREE
+        dx = (self.lon2[segments] - longitude) * lon_scale - ax
+        dy = (self.lat2[segments] - latitude) * METERS_PER_DEGREE - ay
+        length = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            along = np.clip(np.where(length > 0, -(ax * dx + ay * dy) / length, 0.0), 0.0, 1.0)
+        distances = np.hypot(ax + along * dx, ay + along * dy)
+        return distances, along, np.degrees(np.arctan2(dx, dy)) % 360
+
+    def project_one(self, segment, latitude, longitude):
+        """(distance in meters, position along 0..1) of the point against one segment"""
+        lon_scale = math.cos(math.radians(latitude)) * METERS_PER_DEGREE
+        ax = (self.lon1[segment] - longitude) * lon_scale
+        ay = (self.lat1[segment] - latitude) * METERS_PER_DEGREE
+        dx = (self.lon2[segment] - longitude) * lon_scale - ax
+        dy = (self.lat2[segment] - latitude) * METERS_PER_DEGREE - ay
+        length = dx * dx + dy * dy
+        along = min(max(-(ax * dx + ay * dy) / length, 0.0), 1.0) if length > 0 else 0.0
+        return math.hypot(ax + along * dx, ay + along * dy), along
+
+    def segment_key(self, segment):
+        way = self.way[segment]
+        return f"{self.way_ids[way]}:{segment - self.way_start[way]}"
+
+    def max_speed(self, segment):
+        """Speed limit of the segment's way in km/h, or None if unknown"""
+        return self.max_speeds[self.way[segment]]
+
+    def road_name(self, segment):
+        return self.names[self.way[segment]]
+
+
+class MapMatcher:
+    """Incremental snapping of vehicle GPS points to road segments.
+
+    Each vehicle's previous match is kept. A point still within
+    STICKY_DISTANCE of the interior of that segment, or of the next segment
+    of the same way once the car has passed its end, is matched after one
+    or two scalar projections, which covers most readings of a car driving
+    along a road. Otherwise the segments near the point are scored together:
+    distance, plus a penalty for segments not sharing a node or way with
+    the previous match, plus a penalty for pointing away from the travel
+    direction (either way along two-way roads). Not thread-safe; callers
+    own the locking.
+    """
+
+    def __init__(self, network, max_distance=MAX_MATCH_DISTANCE, sticky_distance=STICKY_DISTANCE,
+                 transition_penalty=TRANSITION_PENALTY, heading_penalty=HEADING_PENALTY):
+        self.network = network
+        self.max_distance = max_distance
+        self.sticky_distance = sticky_distance
+        self.transition_penalty = transition_penalty
+        self.heading_penalty = heading_penalty
+        self.previous = {}  # vehicle id -> (segment, latitude, longitude)
+        self.sticky = 0
+        self.searched = 0
+
+    def __len__(self):
+        return len(self.previous)
+
+    def match(self, vehicle_id, latitude, longitude, heading=None):
+        """Segment id for the vehicle's new position, or None if no road is near"""
+        network = self.network
+        previous = self.previous.get(vehicle_id)
+        if previous is not None:
+            segment = previous[0]
+            distance, along = network.project_one(segment, latitude, longitude)
+            if along >= 1.0 or along <= 0.0:
+                # Past an end: try the next segment of the same way in that direction
+                following = segment + 1 if along >= 1.0 else segment - 1
+                if 0 <= following < len(network.way) and network.way[following] == network.way[segment]:
+                    segment = following
+                    distance, along = network.project_one(segment, latitude, longitude)
+            if distance <= self.sticky_distance and 0.0 < along < 1.0:
+                self.sticky += 1
+                self.previous[vehicle_id] = (segment, latitude, longitude)
+                return segment
+        self.searched += 1
+        segments = network.candidates(latitude, longitude, self.max_distance)
+        if len(segments):
+            distances, _, bearings = network.project(segments, latitude, longitude)
+            scores = distances.copy()
+            if previous is not None:
+                last = previous[0]
+                connected = ((network.way[segments] == network.way[last])
+                             | (network.node1[segments] == network.node1[last])
+                             | (network.node1[segments] == network.node2[last])
+                             | (network.node2[segments] == network.node1[last])
+                             | (network.node2[segments] == network.node2[last]))
+                scores += np.where(connected, 0.0, self.transition_penalty)
+                if heading is None:
+                    heading = self._travel_direction(previous, latitude, longitude)
+            if heading is not None:
+                turn = np.abs((bearings - heading + 180) % 360 - 180)
+                two_way = ~network.oneway[network.way[segments]]
+                turn = np.where(two_way, np.minimum(turn, 180 - turn), turn)
+                scores += self.heading_penalty * turn / 90
+            scores[distances > self.max_distance] = np.inf
+            best = int(np.argmin(scores))
+            if scores[best] < np.inf:
+                segment = int(segments[best])
+                self.previous[vehicle_id] = (segment, latitude, longitude)
+                return segment
+        self.previous.pop(vehicle_id, None)
+        return None
+
+    @staticmethod
+    def _travel_direction(previous, latitude, longitude):
+        north = (latitude - previous[1]) * METERS_PER_DEGREE
+        east = (longitude - previous[2]) * math.cos(math.radians(latitude)) * METERS_PER_DEGREE
+        if north * north + east * east < MIN_HEADING_MOVE * MIN_HEADING_MOVE:
+            return None
+        return math.degrees(math.atan2(east, north)) % 360
+
+    def forget(self, vehicle_id):
+        self.previous.pop(vehicle_id, None)
@@ -0,0 +1,201 @@
+import os
+import threading
+from time import perf_counter
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Handler latency histogram bucket upper bounds in seconds (10 us .. 10 s)
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Port for the standalone /metrics listener of components without Flask; 0 disables it
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """In-process metrics registry for the MQTT handlers.
+
+    Counters and latency histograms are keyed by (component, topic) and
+    updated under one short lock, so recording a message costs two
+    perf_counter calls, a bisect and a few dict operations. Gauges are
+    callbacks evaluated only when the metrics are rendered, so sizes of
+    in-memory state cost nothing on the hot path.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+        self.help = {}
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def gauge(self, name, function, help_text="", label=None):
+        """Register a gauge read from function() at render time.
+
+        With label set, function returns a dict and each item becomes one
+        series labelled label="key".
+        """
+        self.gauges[name] = (function, label)
+        if help_text:
+            self.help[name] = help_text
+
+    def describe(self, name, help_text):
+        self.help[name] = help_text
+
+    def handler_histogram(self, component, topic):
+        key = ("mqtt_handler_seconds", (("component", component), ("topic", topic)))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def record_error(self, component, topic, kind):
+        """Count a failed message; kind is decode, key or handler"""
+        self.inc("mqtt_errors_total", (("component", component), ("topic", topic), ("kind", kind)))
+
+    def instrument(self, component):
+        """Decorator for paho-style on_message callbacks (msg is the last argument)
+
+        Each topic's histogram is looked up once and cached in the wrapper;
+        the histogram count doubles as mqtt_messages_total.
+        """
+        def decorator(handler):
+            histograms = {}
+            lock = self.lock
+
+            @wraps(handler)
+            def wrapper(*args):
+                start = perf_counter()
+                try:
+                    return handler(*args)
+                finally:
+                    elapsed = perf_counter() - start
+                    topic = args[-1].topic
+                    histogram = histograms.get(topic)
+                    if histogram is None:
+                        histogram = histograms[topic] = self.handler_histogram(component, topic)
+                    with lock:
+                        histogram.observe(elapsed)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """Prometheus text exposition of every metric"""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.counts), h.total, h.count)) for key, h in self.histograms.items())
+        lines = []
+        seen = set()
+        messages = []
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (name, labels), (counts, total, count) in histograms:
+            if name == "mqtt_handler_seconds":
+                messages.append((labels, count))
+            header(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        for labels, count in messages:
+            header("mqtt_messages_total", "counter")
+            lines.append(f"mqtt_messages_total{_format_labels(labels)} {count}")
+        for name, (function, label) in sorted(self.gauges.items()):
+            try:
+                value = function()
+            except Exception as e:
+                lines.append(f"# gauge {name} failed: {e}")
+                continue
+            header(name, "gauge")
+            if label is None:
+                lines.append(f"{name} {value}")
+            else:
+                for key, item in sorted(value.items()):
+                    lines.append(f"{name}{_format_labels(((label, key),))} {item}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by every component
+registry = Metrics()
+registry.describe("mqtt_messages_total", "MQTT messages handled, by component and topic")
+registry.describe("mqtt_errors_total", "MQTT messages that failed to decode or process")
+registry.describe("mqtt_handler_seconds", "Time spent in on_message, by component and topic")
+
+instrument = registry.instrument
+record_error = registry.record_error
+gauge = registry.gauge
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=None, host="0.0.0.0"):
+    """Serve /metrics over HTTP from a daemon thread, for components without Flask"""
+    port = METRICS_PORT if port is None else port
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on port {port}")
+    return server
@@ -1,12 +1,16 @@
+import sys
 import time
-import json
 import random
-import paho.mqtt.client as mqtt
+from telemetry import TOPIC_VEHICLE_STATUS_FRAME
+from codec import BINARY_TOPICS, encode, encode_binary, encode_for_topic
+from fleetsim import FleetSimulator, json_frame
+from transport import BROKER, PORT, create_client
 
 # MQTT broker details
-broker = "broker.emqx.io"
-port = 1883
+broker = BROKER
+port = PORT
 topics = ["accident", "cartow", "overspeeding", "roadcondition", "traffic", "myvehiclestatus/car1", "Serversend1"]
+FRAME_BATCH_SIZE = 1000  # Readings per published frame
 
 # Function to simulate continuous random location updates
 def simulate_location(client, start_lat, start_lon, duration_sec):
@@ -30,11 +34,31 @@ def simulate_location(client, start_lat, start_lon, duration_sec):
 
         # Publish location to all topics
         for topic in topics:
-            client.publish(topic, json.dumps(location))
+            client.publish(topic, encode_for_topic(topic, location))
             print(f"Published to {topic}: {location}")
         
         time.sleep(1)  # Ensure the updates are sent once every second
 
+# Function to simulate a fleet moving along random trajectories, publishing
+# it as batched frames rate_hz times a second
+def simulate_fleet(client, vehicle_count, start_lat, start_lon, duration_sec, rate_hz=1, batch_size=FRAME_BATCH_SIZE):
+    fleet = FleetSimulator(vehicle_count, center=(start_lat, start_lon))
+    interval = 1 / rate_hz
+    for _ in range(int(duration_sec * rate_hz)):
+        tick_start = time.time()
+        fleet.step(interval)
+        for frame in fleet.frames(batch_size):
+            client.publish(TOPIC_VEHICLE_STATUS_FRAME, encode_frame(frame))
+        print(f"Published {vehicle_count} readings to {TOPIC_VEHICLE_STATUS_FRAME}")
+
+        time.sleep(max(0, interval - (time.time() - tick_start)))
+
+# Encode a simulator frame in the format negotiated for the frame topic
+def encode_frame(frame):
+    if TOPIC_VEHICLE_STATUS_FRAME in BINARY_TOPICS:
+        return encode_binary(frame, delta=True)
+    return encode(json_frame(frame))
+
 # Callback when the client successfully connects to the broker
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
@@ -52,7 +76,7 @@ def on_message(client, userdata, msg):
 
 # Main function to connect to MQTT broker and send location updates
 def main():
-    client = mqtt.Client()
+    client = create_client()
     client.on_connect = on_connect
     client.on_message = on_message
 
@@ -68,8 +92,13 @@ def main():
     start_latitude = 12.9716  # Starting latitude (Bangalore)
     start_longitude = 77.5946  # Starting longitude (Bangalore)
     duration_seconds = 10  # Duration for which location updates are generated
+    fleet_size = int(sys.argv[1]) if len(sys.argv) > 1 else 0  # Simulate a batched fleet when given
+    rate_hz = float(sys.argv[2]) if len(sys.argv) > 2 else 1  # Fleet updates per second
 
-    simulate_location(client, start_latitude, start_longitude, duration_seconds)
+    if fleet_size:
+        simulate_fleet(client, fleet_size, start_latitude, start_longitude, duration_seconds, rate_hz)
+    else:
+        simulate_location(client, start_latitude, start_longitude, duration_seconds)
 
     client.loop_stop()
 
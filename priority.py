@@ -0,0 +1,239 @@
+import os
+import time
+import threading
+from collections import deque
+from transport import topic_matches
+import metrics
+
+# Priority levels; lower values are always served first
+EMERGENCY = 0
+HIGH = 1
+NORMAL = 2
+BULK = 3
+LANE_NAMES = {EMERGENCY: "emergency", HIGH: "high", NORMAL: "normal", BULK: "bulk"}
+LEVELS = {name: priority for priority, name in LANE_NAMES.items()}
+
+# What a full lane does with one more message
+DROP_OLDEST = "drop-oldest"  # Evict the lane's oldest message; fresh telemetry beats stale
+DROP_NEWEST = "drop-newest"  # Reject the incoming message
+NEVER_DROP = "never-drop"  # Admit it anyway; the lane may grow past its capacity
+
+# Lane capacity and overflow policy per priority level
+DEFAULT_LANES = {
+    EMERGENCY: (1000, NEVER_DROP),
+    HIGH: (5000, DROP_OLDEST),
+    NORMAL: (5000, DROP_OLDEST),
+    BULK: (20000, DROP_OLDEST),
+}
+
+# Worker threads per priority level in PriorityDispatcher. One per lane keeps
+# each lane in arrival order (e.g. a vehicle's status readings).
+DEFAULT_WORKERS = {EMERGENCY: 1, HIGH: 1, NORMAL: 1, BULK: 1}
+
+# Per-topic priority overrides, e.g. "accident=emergency,myvehiclestatus/#=bulk"
+PRIORITIES_ENV = "MQTT_TOPIC_PRIORITIES"
+
+
+def parse_priorities(spec):
+    """Parse "topic=level,..." (level is a lane name or number) into a dict"""
+    priorities = {}
+    for entry in spec.split(","):
+        if not entry.strip():
+            continue
+        topic, _, level = entry.rpartition("=")
+        level = level.strip().lower()
+        if not topic or (level not in LEVELS and not level.isdigit()):
+            raise ValueError(f"Invalid topic priority: {entry!r}")
+        priorities[topic.strip()] = LEVELS[level] if level in LEVELS else int(level)
+    return priorities
+
+
+def topic_priorities(defaults):
+    """defaults updated with the overrides in MQTT_TOPIC_PRIORITIES"""
+    return {**defaults, **parse_priorities(os.environ.get(PRIORITIES_ENV, ""))}
+
+
+class TopicPriorities:
+    """Topic -> priority lookup; filters may use MQTT wildcards.
+
+    Exact topics are a dict hit. A topic matched through a wildcard filter
+    (or not at all) is resolved once and cached.
+    """
+
+    def __init__(self, priorities, default_priority=BULK):
+        self.priorities = dict(priorities)
+        self.wildcards = [(topic_filter, priority) for topic_filter, priority in self.priorities.items()
+                          if "+" in topic_filter or "#" in topic_filter]
+        self.default_priority = default_priority
+
+    def __call__(self, topic):
+        priority = self.priorities.get(topic)
+        if priority is None:
+            priority = self.default_priority
+            for topic_filter, level in self.wildcards:
+                if topic_matches(topic_filter, topic):
+                    priority = level
+                    break
+            self.priorities[topic] = priority
+        return priority
+
+
+class PriorityLanes:
+    """Bounded FIFO lane per priority level with a per-lane overflow policy.
+
+    take() always returns the oldest message of the most urgent non-empty
+    lane, so a flood of bulk messages can fill and churn its own lane but
+    never delays an emergency message by more than the item in progress.
+    Not thread-safe; callers own the locking (or the event loop).
+    """
+
+    def __init__(self, lanes=None):
+        lanes = DEFAULT_LANES if lanes is None else lanes
+        self.order = sorted(lanes)
+        self.limits = dict(lanes)
+        self.lanes = {priority: deque() for priority in self.order}
+        self.dropped = {priority: 0 for priority in self.order}
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def offer(self, priority, item):
+        """Queue item; returns False if the lane's policy rejected it"""
+        lane = self.lanes[priority]
+        capacity, policy = self.limits[priority]
+        if len(lane) >= capacity:
+            if policy == DROP_NEWEST:
+                self._drop(priority)
+                return False
+            if policy == DROP_OLDEST:
+                lane.popleft()
+                self.size -= 1
+                self._drop(priority)
+        lane.append(item)
+        self.size += 1
+        return True
+
+    def _drop(self, priority):
+        self.dropped[priority] += 1
+        metrics.registry.inc("ingest_dropped_total", (("lane", LANE_NAMES.get(priority, str(priority))),))
+
+    def take(self):
+        """Pop (priority, item) from the most urgent non-empty lane, or None"""
+        if not self.size:
+            return None
+        for priority in self.order:
+            lane = self.lanes[priority]
+            if lane:
+                self.size -= 1
+                return priority, lane.popleft()
+        return None
+
+    def take_from(self, priority):
+        """Pop the oldest item of one lane, or None"""
+        lane = self.lanes[priority]
+        if not lane:
+            return None
+        self.size -= 1
+        return lane.popleft()
+
+    def pending_above(self, priority):
+        """True if a more urgent lane has messages waiting"""
+        for level in self.order:
+            if level >= priority:
+                return False
+            if self.lanes[level]:
+                return True
+        return False
+
+    def depths(self):
+        return {LANE_NAMES.get(priority, str(priority)): len(lane) for priority, lane in self.lanes.items()}
+
+
+class PriorityDispatcher:
+    """Threaded priority lanes in front of a paho-style on_message handler.
+
+    Set dispatcher.on_message as the client's callback: paho's network
+    thread only queues the message in its topic's lane. Every lane has its
+    own worker threads calling handler(client, userdata, msg), so an
+    emergency message waits only for other emergency messages, never behind
+    a telemetry backlog. After each message a lower-lane worker yields the
+    GIL if a more urgent lane has work, which keeps emergency latency flat
+    while bulk workers are busy.
+    """
+
+    def __init__(self, handler, priorities, lanes=None, workers=None, default_priority=BULK, component="dispatch"):
+        self.handler = handler
+        self.priority_of = TopicPriorities(priorities, default_priority)
+        self.lanes = PriorityLanes(lanes)
+        self.workers = dict(DEFAULT_WORKERS if workers is None else workers)
+        self.component = component
+        self.lock = threading.Lock()
+        self.ready = {priority: threading.Condition(self.lock) for priority in self.lanes.order}
+        self.threads = []
+        self.running = False
+        self.wait_labels = {priority: (("component", component), ("lane", LANE_NAMES.get(priority, str(priority))))
+                            for priority in self.lanes.order}
+        metrics.gauge(f"{component}_queue_depth", self.depths, "Messages waiting per priority lane", label="lane")
+        metrics.registry.describe("dispatch_queue_wait_seconds", "Time messages spent queued before a worker took them")
+
+    def on_message(self, client, userdata, msg):
+        """paho on_message callback: queue msg in its topic's lane"""
+        priority = self.priority_of(msg.topic)
+        with self.lock:
+            if self.lanes.offer(priority, (client, userdata, msg, time.perf_counter())):
+                self.ready[priority].notify()
+
+    def _work(self, priority):
+        ready = self.ready[priority]
+        lanes = self.lanes
+        labels = self.wait_labels[priority]
+        while True:
+            with self.lock:
+                entry = lanes.take_from(priority)
+                while entry is None:
+                    if not self.running:
+                        return
+                    ready.wait()
+                    entry = lanes.take_from(priority)
+            client, userdata, msg, queued_at = entry
+            metrics.registry.observe("dispatch_queue_wait_seconds", labels, time.perf_counter() - queued_at)
+            try:
+                self.handler(client, userdata, msg)
+            except Exception as e:
+                metrics.record_error(self.component, msg.topic, "handler")
+                print(f"Error handling message on {msg.topic}: {e}")
+            if lanes.pending_above(priority):
+                time.sleep(0)  # Let a more urgent lane's worker have the GIL
+
+    def start(self):
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        for priority in self.lanes.order:
+            for i in range(max(1, self.workers.get(priority, 1))):
+                name = f"{self.component}-{LANE_NAMES.get(priority, priority)}-{i}"
+                thread = threading.Thread(target=self._work, args=(priority,), name=name, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stop(self, drain=True):
+        """Stop the workers; with drain, after they have emptied their lanes"""
+        with self.lock:
+            self.running = False
+            if not drain:
+                for lane in self.lanes.lanes.values():
+                    self.lanes.size -= len(lane)
+                    lane.clear()
+            for ready in self.ready.values():
+                ready.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def __len__(self):
+        return len(self.lanes)
+
+    def depths(self):
+        return self.lanes.depths()
@@ -0,0 +1,280 @@
+import time
+import threading
+import numpy as np
+from geo import within_radius
+from spatialindex import grid_cell, cells_covering, METERS_PER_DEGREE
+
+# Slots allocated up front; the columns double whenever they fill up
+DEFAULT_CAPACITY = 1024
+
+# Column name -> dtype. Positions need float64 (float32 is ~1 m at these
+# longitudes); speed and heading are fine at float32.
+COLUMNS = {
+    "latitude": np.float64,
+    "longitude": np.float64,
+    "speed": np.float32,
+    "heading": np.float32,
+    "last_seen": np.float64,
+}
+
+
+class VehicleRegistry:
+    """Latest position, speed, heading and report time of every vehicle.
+
+    Each vehicle_id is interned once to a dense integer slot and its state
+    lives in one NumPy column per field, so a vehicle costs a dict entry
+    plus a few bytes per column instead of a tuple and boxed floats in
+    several dicts. Slots of removed vehicles are reused. Fields never
+    reported are NaN. Fleet-wide scans (radius, averages, expiry) run over
+    the columns of the live slots in one pass.
+
+    With a cell_size, the registry also keeps a uniform grid of slots, so
+    radius queries only look at the cells around the point, and a change
+    counter per cell that is bumped whenever a vehicle enters, leaves or
+    moves within it. neighbors() caches each vehicle's list against those
+    counters, and ContinuousQueries watches the same cells. Thread-safe.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, cell_size=None):
+        self.slots = {}  # vehicle id -> slot
+        self.ids = []  # slot -> vehicle id, None when free
+        self.free = []  # slots released by remove(), reused first
+        self.capacity = capacity
+        self.columns = {name: np.full(capacity, np.nan, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self.live = np.zeros(capacity, dtype=bool)
+        self.cell_degrees = cell_size / METERS_PER_DEGREE if cell_size else None
+        self.cells = {}  # cell -> set of slots with a position in it
+        self.versions = {}  # cell -> change counter
+        self.neighbor_cache = {}  # slot -> ((radius, method), ((cell, version), ...), neighbor ids)
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self.slots
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.full(capacity, np.nan, dtype=column.dtype)
+            grown[:self.capacity] = column
+            self.columns[name] = grown
+        live = np.zeros(capacity, dtype=bool)
+        live[:self.capacity] = self.live
+        self.live = live
+        self.capacity = capacity
+
+    def _intern(self, vehicle_id):
+        slot = self.slots.get(vehicle_id)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.ids[slot] = vehicle_id
+            else:
+                slot = len(self.ids)
+                if slot >= self.capacity:
+                    self._grow(slot + 1)
+                self.ids.append(vehicle_id)
+            self.slots[vehicle_id] = slot
+            self.live[slot] = True
+        return slot
+
+    def _touch(self, cell):
+        self.versions[cell] = self.versions.get(cell, 0) + 1
+
+    def _cell_of_slot(self, slot):
+        """Grid cell of a slot's current position, None without one"""
+        latitude = self.columns["latitude"].item(slot)
+        if latitude != latitude:
+            return None
+        return grid_cell(latitude, self.columns["longitude"].item(slot), self.cell_degrees)
+
+    def _place(self, slot, latitude, longitude):
+        """Write a position, moving the slot between grid cells if needed"""
+        latitudes = self.columns["latitude"]
+        longitudes = self.columns["longitude"]
+        if self.cell_degrees is not None:
+            old_latitude = latitudes.item(slot)
+            old_longitude = longitudes.item(slot)
+            if old_latitude == latitude and old_longitude == longitude:
+                return
+            new = grid_cell(latitude, longitude, self.cell_degrees)
+            old = None if old_latitude != old_latitude else grid_cell(old_latitude, old_longitude, self.cell_degrees)
+            if old is not None:
+                self._touch(old)
+                if old != new:
+                    self._discard(slot, old)
+            if old != new:
+                self.cells.setdefault(new, set()).add(slot)
+            self._touch(new)
+        latitudes[slot] = latitude
+        longitudes[slot] = longitude
+
+    def _discard(self, slot, cell):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(slot)
+            if not bucket:
+                del self.cells[cell]
+
+    def slot(self, vehicle_id):
+        """The vehicle's slot, or None if it is not registered"""
+        return self.slots.get(vehicle_id)
+
+    def update(self, vehicle_id, latitude=None, longitude=None, speed=None, heading=None, timestamp=None):
+        """Register or update a vehicle; fields left as None keep their value. Returns its slot."""
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            slot = self._intern(vehicle_id)
+            columns = self.columns
+            if latitude is not None:
+                self._place(slot, latitude, longitude)
+            if speed is not None:
+                columns["speed"][slot] = speed
+            if heading is not None:
+                columns["heading"][slot] = heading
+            columns["last_seen"][slot] = timestamp
+        return slot
+
+    def update_many(self, vehicle_ids, latitudes, longitudes, speeds=None, headings=None, timestamps=None):
+        """Vectorized update for a frame of readings; returns the slots as an array"""
+        with self.lock:
+            slots = np.fromiter((self._intern(vehicle_id) for vehicle_id in vehicle_ids), dtype=np.int64,
+                                count=len(vehicle_ids))
+            columns = self.columns
+            if self.cell_degrees is None:
+                columns["latitude"][slots] = latitudes
+                columns["longitude"][slots] = longitudes
+            else:
+                for slot, latitude, longitude in zip(slots.tolist(), np.asarray(latitudes, dtype=np.float64).tolist(),
+                                                     np.asarray(longitudes, dtype=np.float64).tolist()):
+                    self._place(slot, latitude, longitude)
+            if speeds is not None:
+                columns["speed"][slots] = speeds
+            if headings is not None:
+                columns["heading"][slots] = headings
+            columns["last_seen"][slots] = time.time() if timestamps is None else timestamps
+        return slots
+
+    def remove(self, vehicle_id):
+        with self.lock:
+            slot = self.slots.pop(vehicle_id, None)
+            if slot is None:
+                return False
+            self._release(slot)
+        return True
+
+    def _release(self, slot):
+        if self.cell_degrees is not None:
+            cell = self._cell_of_slot(slot)
+            if cell is not None:
+                self._discard(slot, cell)
+                self._touch(cell)
+            self.neighbor_cache.pop(slot, None)
+        self.ids[slot] = None
+        self.live[slot] = False
+        for column in self.columns.values():
+            column[slot] = np.nan
+        self.free.append(slot)
+
+    def clear(self):
+        with self.lock:
+            self.slots.clear()
+            self.ids = []
+            self.free = []
+            for column in self.columns.values():
+                column.fill(np.nan)
+            self.live.fill(False)
+            self.cells.clear()
+            self.versions.clear()
+            self.neighbor_cache.clear()
+
+    def get(self, vehicle_id, field="location"):
+        """(latitude, longitude) for field "location", else that field's value; None if unknown"""
+        slot = self.slots.get(vehicle_id)
+        if slot is None:
+            return None
+        if field == "location":
+            return float(self.columns["latitude"][slot]), float(self.columns["longitude"][slot])
+        return float(self.columns[field][slot])
+
+    def live_slots(self):
+        """Slots currently holding a vehicle"""
+        return np.flatnonzero(self.live[:len(self.ids)])
+
+    def vehicle_ids(self, slots):
+        return [self.ids[slot] for slot in slots.tolist()]
+
+    def _slots_in(self, cells):
+        cells_map = self.cells
+        return np.array([slot for cell in cells for slot in cells_map.get(cell, ())], dtype=np.int64)
+
+    def _candidates(self, latitude, longitude, radius):
+        """Slots that may lie within radius: the covering cells with a grid, else every live slot"""
+        if self.cell_degrees is None:
+            return self.live_slots()
+        return self._slots_in(cells_covering(latitude, longitude, radius * 1.01 + 1, self.cell_degrees))
+
+    def within_radius(self, latitude, longitude, radius, method="haversine"):
+        """Ids of vehicles with a known position within radius meters, from one pass over the columns"""
+        with self.lock:
+            slots = self._candidates(latitude, longitude, radius)
+            mask = within_radius(latitude, longitude, self.columns["latitude"][slots],
+                                 self.columns["longitude"][slots], radius, method)
+            return self.vehicle_ids(slots[mask])
+
+    def neighbors(self, vehicle_id, radius, method="haversine"):
+        """Ids of the other vehicles within radius of vehicle_id (empty if it has no position).
+
+        Needs a cell_size. The list is cached with the change counters of
+        the cells it covered and reused until one of them moves, which
+        includes the vehicle itself moving, so repeated lookups in a quiet
+        neighborhood cost a few dict reads.
+        """
+        with self.lock:
+            slot = self.slots.get(vehicle_id)
+            if slot is None:
+                return []
+            versions = self.versions
+            cached = self.neighbor_cache.get(slot)
+            if (cached is not None and cached[0] == (radius, method)
+                    and all(versions.get(cell, 0) == version for cell, version in cached[1])):
+                return cached[2]
+            latitude = float(self.columns["latitude"][slot])
+            longitude = float(self.columns["longitude"][slot])
+            if latitude != latitude:
+                return []  # No position yet
+            cells = cells_covering(latitude, longitude, radius * 1.01 + 1, self.cell_degrees)
+            slots = self._slots_in(cells)
+            slots = slots[slots != slot]
+            mask = within_radius(latitude, longitude, self.columns["latitude"][slots],
+                                 self.columns["longitude"][slots], radius, method)
+            result = self.vehicle_ids(slots[mask])
+            self.neighbor_cache[slot] = ((radius, method), tuple((cell, versions.get(cell, 0)) for cell in cells),
+                                         result)
+            return result
+
+    def mean(self, field="speed"):
+        """Mean of a field over the vehicles that reported it (0 if none did)"""
+        with self.lock:
+            values = self.columns[field][:len(self.ids)]
+            known = values[~np.isnan(values)]
+        return float(known.mean()) if len(known) else 0
+
+    def expire(self, older_than):
+        """Remove vehicles not seen since older_than; returns their ids"""
+        with self.lock:
+            slots = self.live_slots()
+            stale = slots[self.columns["last_seen"][slots] < older_than]
+            removed = self.vehicle_ids(stale)
+            for vehicle_id, slot in zip(removed, stale.tolist()):
+                del self.slots[vehicle_id]
+                self._release(slot)
+        return removed
+
+    def nbytes(self):
+        """Bytes held by the columns"""
+        return sum(column.nbytes for column in self.columns.values()) + self.live.nbytes
@@ -0,0 +1,90 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+import metrics
+
+# Cached responses kept across all topics and query shapes (least recently used go first)
+MAX_ENTRIES = 2048
+# Bodies smaller than this are never gzipped; the header overhead outweighs the savings
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+
+class CachedResponse:
+    """A serialized response body with its ETag and lazily gzipped copy"""
+
+    __slots__ = ("version", "body", "count", "next_cursor", "etag", "_gzipped", "_lock")
+
+    def __init__(self, version, body, count, next_cursor):
+        self.version = version
+        self.body = body
+        self.count = count
+        self.next_cursor = next_cursor
+        # Content hash, so a restarted server (versions reset) never matches a stale tag
+        self.etag = hashlib.blake2b(body, digest_size=12).hexdigest()
+        self._gzipped = None
+        self._lock = threading.Lock()
+
+    def gzipped(self):
+        """gzip-compressed body, compressed once per cached response; None if too small"""
+        if len(self.body) < GZIP_MIN_BYTES:
+            return None
+        if self._gzipped is None:
+            with self._lock:
+                if self._gzipped is None:
+                    self._gzipped = gzip.compress(self.body, GZIP_LEVEL)
+        return self._gzipped
+
+
+class ResponseCache:
+    """Per-topic version counters and serialized responses keyed by query shape.
+
+    Writers call bump(topic) after storing a message, and stores call it
+    when they drop expired rows. A cached response is
+    only served while its topic is still at the version it was built
+    from, so a response is serialized at most once per topic change no
+    matter how many clients poll the same query. Read the version before
+    querying the store: a response built from newer rows under an older
+    version is merely recomputed after the next bump, never served stale.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.versions = {}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        metrics.gauge("response_cache_entries", lambda: len(self.entries), "Cached serialized responses")
+
+    def version(self, topic):
+        return self.versions.get(topic, 0)
+
+    def bump(self, topic):
+        with self.lock:
+            self.versions[topic] = self.versions.get(topic, 0) + 1
+
+    def get(self, topic, shape):
+        """Cached response for (topic, shape) at the topic's current version, or None"""
+        key = (topic, shape)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry.version == self.versions.get(topic, 0):
+                self.entries.move_to_end(key)
+                hit = True
+            else:
+                entry = None
+                hit = False
+        metrics.registry.inc("response_cache_lookups_total", (("result", "hit" if hit else "miss"),))
+        return entry
+
+    def put(self, topic, shape, version, body, count, next_cursor):
+        """Cache a freshly built body for (topic, shape) as of version and return its entry"""
+        entry = CachedResponse(version, body, count, next_cursor)
+        key = (topic, shape)
+        with self.lock:
+            if version == self.versions.get(topic, 0):
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return entry
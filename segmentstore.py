@@ -0,0 +1,383 @@
+import os
+import json
+import mmap
+import time
+import threading
+from bisect import bisect_right
+import numpy as np
+from topicstore import DEFAULT_MAX_ROWS, DEFAULT_MAX_AGE
+
+# On-disk layout, one directory per topic and two files per segment:
+#   <base seq>.data   payloads as compact JSON, back to back
+#   <base seq>.index  one fixed-width INDEX_DTYPE entry per payload
+# The index entry is written after its payload, so a torn write at a crash
+# only ever leaves a data tail without an index entry, which is cut off on open.
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<u8"), ("length", "<u4")])
+DATA_SUFFIX = ".data"
+INDEX_SUFFIX = ".index"
+SEGMENT_BYTES = 16 * 1024 * 1024  # Data size at which the active segment is sealed
+SPARSE_EVERY = 64  # Index entries per in-memory timestamp sample
+FSYNC_INTERVAL = 1.0  # Seconds of appends between fsyncs (0 = every append, None = only on roll and close)
+
+
+class Segment:
+    """One data/index file pair holding consecutive rows from seq base on.
+
+    Nothing is read at construction. The files are memory-mapped on the first
+    read, and a timestamp of every SPARSE_EVERY-th row is copied into memory.
+    A time lookup bisects that sparse sample and then at most SPARSE_EVERY
+    mapped index entries. Rows appended after the mapping are read with
+    pread: their index entries are kept in an in-memory tail and their
+    payloads read straight from the data file. The files are remapped only
+    once the tail outgrows the mapped rows, so reads of a busy active
+    segment do not pay an mmap per request.
+    """
+
+    def __init__(self, directory, base):
+        self.base = base
+        name = os.path.join(directory, f"{base:020d}")
+        self.data_path = name + DATA_SUFFIX
+        self.index_path = name + INDEX_SUFFIX
+        self.count = os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize if os.path.exists(self.index_path) else 0
+        self.data_size = 0
+        self.first_timestamp = None
+        self.maps = None
+        self.index = None
+        self.sparse = None
+        self.mapped = 0  # Rows covered by the current maps
+        self.fds = None  # (index, data) descriptors for pread
+        self.tail = np.empty(0, INDEX_DTYPE)  # Entries of rows [mapped, mapped + tail_count)
+        self.tail_count = 0
+
+    @property
+    def end(self):
+        return self.base + self.count
+
+    def entry(self, i):
+        """Index entry i read straight from the file, without mapping"""
+        with open(self.index_path, "rb") as f:
+            f.seek(i * INDEX_DTYPE.itemsize)
+            return np.frombuffer(f.read(INDEX_DTYPE.itemsize), INDEX_DTYPE)[0]
+
+    def first_time(self):
+        if self.first_timestamp is None and self.count:
+            self.first_timestamp = float(self.entry(0)["timestamp"])
+        return self.first_timestamp
+
+    def _map(self):
+        if self.maps is not None and self.count - self.mapped <= self.mapped:
+            self._read_tail()
+            return
+        self.unmap()
+        self.fds = tuple(os.open(path, os.O_RDONLY) for path in (self.index_path, self.data_path))
+        self.maps = [mmap.mmap(fd, 0, access=mmap.ACCESS_READ) for fd in self.fds]
+        self.index = np.frombuffer(self.maps[0], INDEX_DTYPE, self.count)
+        self.sparse = self.index["timestamp"][::SPARSE_EVERY].copy()
+        self.mapped = self.count
+
+    def _read_tail(self):
+        """pread the index entries appended since the last read into the tail"""
+        needed = self.count - self.mapped
+        if needed <= self.tail_count:
+            return
+        if needed > len(self.tail):
+            grown = np.empty(max(needed, 2 * len(self.tail), SPARSE_EVERY), INDEX_DTYPE)
+            grown[:self.tail_count] = self.tail[:self.tail_count]
+            self.tail = grown
+        size = INDEX_DTYPE.itemsize
+        raw = os.pread(self.fds[0], (needed - self.tail_count) * size, (self.mapped + self.tail_count) * size)
+        self.tail[self.tail_count:needed] = np.frombuffer(raw, INDEX_DTYPE)
+        self.tail_count = needed
+
+    def unmap(self):
+        if self.maps is not None:
+            self.index = self.sparse = None
+            for m in self.maps:
+                m.close()
+            for fd in self.fds:
+                os.close(fd)
+            self.maps = self.fds = None
+            self.mapped = 0
+            self.tail = np.empty(0, INDEX_DTYPE)
+            self.tail_count = 0
+
+    def _entries(self, start, stop):
+        """Index entries of local rows [start, stop), from the mapping and the tail"""
+        mapped = self.mapped
+        if stop <= mapped:
+            return self.index[start:stop]
+        tail = self.tail[max(start - mapped, 0):stop - mapped]
+        if start >= mapped:
+            return tail
+        return np.concatenate((self.index[start:mapped], tail))
+
+    def timestamp(self, i):
+        """Timestamp of local row i"""
+        self._map()
+        return float(self._entries(i, i + 1)["timestamp"][0])
+
+    def search(self, timestamp, side):
+        """Local position of timestamp among this segment's rows (bisect_left/right)"""
+        if not self.count:
+            return 0
+        self._map()
+        block = int(np.searchsorted(self.sparse, timestamp, side))
+        if block == 0:
+            return 0
+        start = (block - 1) * SPARSE_EVERY
+        stop = min(block * SPARSE_EVERY + 1, self.mapped)
+        position = start + int(np.searchsorted(self.index["timestamp"][start:stop], timestamp, side))
+        if position == self.mapped and self.tail_count:
+            position += int(np.searchsorted(self.tail["timestamp"][:self.tail_count], timestamp, side))
+        return position
+
+    def rows(self, start, stop):
+        """Raw JSON payloads of local rows [start, stop)"""
+        if start >= stop:
+            return []
+        self._map()
+        entries = self._entries(start, stop)
+        offsets = entries["offset"].tolist()
+        lengths = entries["length"].tolist()
+        if stop <= self.mapped:
+            data, base = self.maps[1], 0
+        else:
+            # Past the mapping: one pread of the payloads' contiguous byte range
+            base = offsets[0]
+            data = os.pread(self.fds[1], offsets[-1] + lengths[-1] - base, base)
+        return [data[offset - base:offset - base + length] for offset, length in zip(offsets, lengths)]
+
+    def delete(self):
+        self.unmap()
+        for path in (self.data_path, self.index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class SegmentStore:
+    """Durable, time-indexed message log for a single topic.
+
+    Drop-in replacement for TopicStore backed by append-only segment files.
+    Opening a store only lists its directory and checks the tail of the
+    active segment; nothing is replayed. Queries locate rows through the
+    fixed-width index and hand back payload bytes sliced from the mapped
+    data file, so query_raw and read_raw never decode a row. Retention by
+    row count and age is exact for readers; on disk, segments are deleted
+    whole once every row in them has expired.
+
+    Every append is flushed to the OS before it returns, so a crashed server
+    process loses nothing. The files are fsynced once fsync_interval seconds
+    have passed since the last sync (checked on append), when a segment is
+    sealed and on close; a power loss or kernel crash can lose the rows
+    appended since the last fsync. on_expire works as in TopicStore.
+    """
+
+    def __init__(self, directory, max_rows=DEFAULT_MAX_ROWS, max_age=DEFAULT_MAX_AGE, segment_bytes=SEGMENT_BYTES,
+                 fsync_interval=FSYNC_INTERVAL, on_expire=None):
+        self.directory = directory
+        self.on_expire = on_expire
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.synced_at = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        bases = sorted(int(name[:-len(INDEX_SUFFIX)]) for name in os.listdir(directory) if name.endswith(INDEX_SUFFIX))
+        self.segments = [Segment(directory, base) for base in bases] or [Segment(directory, 0)]
+        self.bases = [segment.base for segment in self.segments]
+        self.last_timestamp = None
+        self._recover(self.segments[-1])
+        self.head = self.segments[0].base  # Sequence number of the oldest retained row
+        self.head_timestamp = None
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.data_file = open(self.segments[-1].data_path, "ab")
+        self.index_file = open(self.segments[-1].index_path, "ab")
+        self._expire(time.time())
+
+    def _recover(self, segment):
+        """Cut a torn tail off the active segment and find where appends resume"""
+        data_size = os.path.getsize(segment.data_path) if os.path.exists(segment.data_path) else 0
+        while segment.count:
+            last = segment.entry(segment.count - 1)
+            end = int(last["offset"]) + int(last["length"])
+            if end <= data_size:
+                self.last_timestamp = float(last["timestamp"])
+                data_size = end
+                break
+            segment.count -= 1
+        else:
+            data_size = 0
+        for path, size in ((segment.index_path, segment.count * INDEX_DTYPE.itemsize), (segment.data_path, data_size)):
+            with open(path, "ab") as f:
+                f.truncate(size)
+        segment.data_size = data_size
+        if self.last_timestamp is None and len(self.segments) > 1:
+            previous = self.segments[-2]
+            self.last_timestamp = float(previous.entry(previous.count - 1)["timestamp"])
+
+    def __len__(self):
+        return self.next_seq - self.head
+
+    @property
+    def first_seq(self):
+        return self.head
+
+    @property
+    def next_seq(self):
+        return self.segments[-1].end
+
+    def append(self, payload, timestamp=None):
+        """Store a payload and return its sequence number"""
+        if timestamp is None:
+            timestamp = time.time()
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        with self.lock:
+            if self.last_timestamp is not None and timestamp < self.last_timestamp:
+                # Keep the index sorted if the clock steps backwards
+                timestamp = self.last_timestamp
+            segment = self.segments[-1]
+            if segment.data_size >= self.segment_bytes:
+                segment = self._roll()
+            seq = segment.end
+            entry = np.array((timestamp, segment.data_size, len(body)), INDEX_DTYPE)
+            self.data_file.write(body)
+            self.data_file.flush()
+            self.index_file.write(entry.tobytes())
+            self.index_file.flush()
+            if self.fsync_interval is not None and time.monotonic() - self.synced_at >= self.fsync_interval:
+                self._sync()
+            segment.data_size += len(body)
+            segment.count += 1
+            self.last_timestamp = timestamp
+            if segment.first_timestamp is None:
+                segment.first_timestamp = timestamp
+            self._expire(timestamp)
+            self.changed.notify_all()
+        return seq
+
+    def _sync(self):
+        for f in (self.data_file, self.index_file):
+            f.flush()
+            os.fsync(f.fileno())
+        self.synced_at = time.monotonic()
+
+    def _roll(self):
+        """Seal the active segment and start a new one at next_seq"""
+        self._sync()
+        for f in (self.data_file, self.index_file):
+            f.close()
+        segment = Segment(self.directory, self.next_seq)
+        self.segments.append(segment)
+        self.bases.append(segment.base)
+        self.data_file = open(segment.data_path, "ab")
+        self.index_file = open(segment.index_path, "ab")
+        return segment
+
+    def expire(self, now=None):
+        with self.lock:
+            self._expire(time.time() if now is None else now)
+
+    def _expire(self, now):
+        head = max(self.head, self.next_seq - self.max_rows)
+        if head != self.head:
+            self.head_timestamp = None
+        if self.max_age is not None and head < self.next_seq:
+            cutoff = now - self.max_age
+            if self.head_timestamp is None or self.head_timestamp < cutoff:
+                head = self._seq_for_time(cutoff, "left", head, self.next_seq)
+                self.head_timestamp = self._timestamp_at(head)
+        if head != self.head:
+            self.head = head
+            if self.on_expire is not None:
+                self.on_expire()
+        # Delete sealed segments that hold only expired rows
+        while len(self.segments) > 1 and self.segments[0].end <= self.head:
+            self.segments.pop(0).delete()
+            self.bases.pop(0)
+
+    def _segment_index(self, seq):
+        return max(bisect_right(self.bases, seq) - 1, 0)
+
+    def _timestamp_at(self, seq):
+        if seq >= self.next_seq:
+            return None
+        segment = self.segments[self._segment_index(seq)]
+        return segment.timestamp(seq - segment.base)
+
+    def _seq_for_time(self, timestamp, side, lo, hi):
+        """First seq in [lo, hi] whose row is at or after (left) / after (right) timestamp"""
+        i = self._segment_index(lo)
+        # Skip whole segments using just their first timestamps
+        while i + 1 < len(self.segments) and self.segments[i + 1].base < hi:
+            first = self.segments[i + 1].first_time()
+            if first is None or (first > timestamp if side == "right" else first >= timestamp):
+                break
+            i += 1
+        segment = self.segments[i]
+        seq = segment.base + segment.search(timestamp, side)
+        return min(max(seq, lo), hi)
+
+    def _rows(self, start, stop):
+        rows = []
+        i = self._segment_index(start)
+        while start < stop:
+            segment = self.segments[i]
+            end = min(stop, segment.end)
+            rows.extend(segment.rows(start - segment.base, end - segment.base))
+            start = end
+            i += 1
+        return rows
+
+    def query_raw(self, since=None, until=None, cursor=None, limit=None):
+        """Like query, but rows are the stored JSON bytes"""
+        with self.lock:
+            self._expire(time.time())
+            start = self.head
+            end = self.next_seq
+            if cursor is not None:
+                start = min(max(start, cursor), end)
+            if since is not None:
+                start = self._seq_for_time(since, "left", start, end)
+            if until is not None:
+                end = self._seq_for_time(until, "right", start, end)
+            if limit is not None and cursor is None and since is None:
+                start = max(start, end - limit)
+            stop = end if limit is None else min(end, start + limit)
+            rows = self._rows(start, stop)
+            next_cursor = stop if stop < end else None
+        return rows, next_cursor
+
+    def query(self, since=None, until=None, cursor=None, limit=None):
+        """Return (payloads, next_cursor) for rows in [since, until]; see TopicStore.query"""
+        rows, next_cursor = self.query_raw(since, until, cursor, limit)
+        return [json.loads(row) for row in rows], next_cursor
+
+    def read_raw(self, cursor, limit=None):
+        """Like read, but rows are the stored JSON bytes"""
+        with self.lock:
+            self._expire(time.time())
+            end = self.next_seq
+            start = min(max(self.head, cursor), end)
+            stop = end if limit is None else min(end, start + limit)
+            return start, self._rows(start, stop)
+
+    def read(self, cursor, limit=None):
+        """Return (seq, payloads) for rows from cursor on; see TopicStore.read"""
+        seq, rows = self.read_raw(cursor, limit)
+        return seq, [json.loads(row) for row in rows]
+
+    def wait_for(self, cursor, timeout):
+        """Block until a row with sequence number >= cursor exists; False on timeout"""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.next_seq > cursor, timeout)
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            for f in (self.data_file, self.index_file):
+                f.close()
+            for segment in self.segments:
+                segment.unmap()
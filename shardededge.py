@@ -0,0 +1,247 @@
+import os
+import sys
+import zlib
+import itertools
+import threading
+import multiprocessing as mp
+import numpy as np
+from edgestate import EdgeState
+from codec import decode, is_binary, HEADER, VEHICLE_ID_BYTES
+from telemetry import is_frame, frame_arrays
+
+# Commands are sent to workers in batches to amortize queue and pickling costs
+DEFAULT_BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.05  # Seconds a partial batch may wait before being sent
+QUERY_TIMEOUT = 10  # Seconds to wait for every shard to answer a query
+
+VEHICLE_ID_KEY = b'"vehicle_id"'
+
+
+def shard_for(vehicle_id, shards):
+    """Stable shard number for a vehicle, the same in every process"""
+    return zlib.crc32(str(vehicle_id).encode()) % shards
+
+
+def extract_vehicle_id(payload):
+    """Read vehicle_id from a single-reading payload without decoding all of it"""
+    if is_binary(payload):
+        return payload[HEADER.size:HEADER.size + VEHICLE_ID_BYTES].rstrip(b"\0").decode()
+    start = payload.find(VEHICLE_ID_KEY)
+    if start >= 0:
+        start = payload.index(b":", start + len(VEHICLE_ID_KEY)) + 1
+        while payload[start:start + 1] in (b" ", b"\t"):
+            start += 1
+        if payload[start:start + 1] == b'"':
+            value = payload[start + 1:payload.index(b'"', start + 1)]
+            if b"\\" not in value:
+                return value.decode()
+    return decode(payload)["vehicle_id"]
+
+
+def _is_multi_reading(payload):
+    if is_binary(payload):
+        return HEADER.unpack_from(payload)[3] != 1
+    return b'"frame"' in payload
+
+
+def _worker(inbox, results, notices, quiet):
+    if quiet:
+        sys.stdout = open(os.devnull, "w")
+    state = EdgeState()
+    while True:
+        for command in inbox.get():
+            kind = command[0]
+            try:
+                if kind == "status":
+                    _, payload, timestamp = command
+                    data = decode(payload)
+                    if is_frame(data):
+                        state.handle_vehicle_frame(data, timestamp)
+                    else:
+                        state.handle_vehicle_status(data, timestamp)
+                elif kind == "frame":
+                    state.handle_vehicle_frame(command[1], command[2])
+                elif kind == "location":
+                    caused = state.update_car_location(command[1], command[2])
+                    if caused:
+                        notices.put(caused)
+                elif kind == "ambulance":
+                    caused = state.update_ambulance(*command[1:])
+                    if caused:
+                        notices.put(caused)
+                elif kind == "drain":
+                    results.put((command[1], state.drain()))
+                elif kind == "stats":
+                    memory = state.trajectories.memory_report()
+                    results.put((command[1], {
+                        "vehicles": memory["vehicles"],
+                        "cars": len(state.vehicles),
+                        "records": len(state.vehicle_status_data),
+                        "points": memory["points"],
+                        "bytes": memory["bytes"],
+                    }))
+                elif kind == "stop":
+                    return
+            except Exception as e:
+                print(f"Error processing {kind} in shard: {e}")
+
+
+class ShardedEdge:
+    """Partitions edge server vehicle state across worker processes.
+
+    Vehicle status readings and car locations are routed by a hash of the
+    vehicle id, so each worker owns an EdgeState for its slice of the fleet.
+    Single readings are forwarded as raw payloads and decoded by the worker;
+    frames are split into per-shard sub-frames. Ambulance updates are
+    broadcast, so every shard keeps the ambulance queries over its own cars;
+    the enter/leave notices they cause are handed to on_notices from a
+    thread in this process. Queries that need the whole fleet, such as
+    draining trajectories, are fanned out to every shard and the answers
+    merged.
+    """
+
+    def __init__(self, shards=None, batch_size=DEFAULT_BATCH_SIZE, quiet=False, on_notices=None):
+        self.shards = shards or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.quiet = quiet
+        self.on_notices = on_notices  # Called with a list of (car id, notice) as shards report them
+        self.context = mp.get_context("spawn")
+        self.inboxes = []
+        self.workers = []
+        self.results = None
+        self.notices = None
+        self.notice_thread = None
+        self.buffers = [[] for _ in range(self.shards)]
+        self.buffer_lock = threading.Lock()
+        self.query_lock = threading.Lock()
+        self.query_ids = itertools.count()
+        self.stop_event = threading.Event()
+        self.flush_thread = None
+
+    def start(self):
+        self.results = self.context.Queue()
+        self.notices = self.context.Queue()
+        for _ in range(self.shards):
+            inbox = self.context.Queue()
+            worker = self.context.Process(target=_worker, args=(inbox, self.results, self.notices, self.quiet),
+                                          daemon=True)
+            worker.start()
+            self.inboxes.append(inbox)
+            self.workers.append(worker)
+        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flush_thread.start()
+        self.notice_thread = threading.Thread(target=self._notice_loop, daemon=True)
+        self.notice_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.flush_thread is not None:
+            self.flush_thread.join()
+        for shard in range(self.shards):
+            self._send(shard, ("stop",))
+        self.flush()
+        for worker in self.workers:
+            worker.join()
+        self.notices.put(None)
+        self.notice_thread.join()
+        self.inboxes = []
+        self.workers = []
+
+    def _send(self, shard, command):
+        # Queue.put only hands the batch to a feeder thread, so it is done
+        # under the lock to keep each shard's batches in order
+        with self.buffer_lock:
+            buffer = self.buffers[shard]
+            buffer.append(command)
+            if len(buffer) >= self.batch_size:
+                self.buffers[shard] = []
+                self.inboxes[shard].put(buffer)
+
+    def flush(self):
+        with self.buffer_lock:
+            for shard, buffer in enumerate(self.buffers):
+                if buffer:
+                    self.buffers[shard] = []
+                    self.inboxes[shard].put(buffer)
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(FLUSH_INTERVAL):
+            self.flush()
+
+    def _notice_loop(self):
+        while True:
+            notices = self.notices.get()
+            if notices is None:
+                return
+            if self.on_notices is not None:
+                try:
+                    self.on_notices(notices)
+                except Exception as e:
+                    print(f"Error delivering ambulance notices: {e}")
+
+    def submit_status(self, payload, timestamp):
+        """Route a raw vehicle status payload (single reading or frame)"""
+        if _is_multi_reading(payload):
+            data = decode(payload)
+            if is_frame(data):
+                self.submit_frame(data, timestamp)
+                return
+            vehicle_id = data["vehicle_id"]
+        else:
+            vehicle_id = extract_vehicle_id(payload)
+        self._send(shard_for(vehicle_id, self.shards), ("status", payload, timestamp))
+
+    def submit_frame(self, data, timestamp):
+        """Split a decoded frame into one sub-frame per shard"""
+        car_ids, latitudes, longitudes, speeds, timestamps = frame_arrays(data, timestamp)
+        if not car_ids:
+            return
+        owners = np.fromiter((shard_for(car_id, self.shards) for car_id in car_ids),
+                             dtype=np.int64, count=len(car_ids))
+        for shard in np.unique(owners).tolist():
+            rows = np.flatnonzero(owners == shard)
+            sub_frame = {
+                "frame": data["frame"],
+                "vehicle_id": [car_ids[i] for i in rows.tolist()],
+                "latitude": latitudes[rows],
+                "longitude": longitudes[rows],
+                "speed": speeds[rows],
+                "timestamp": timestamps[rows],
+            }
+            self._send(shard, ("frame", sub_frame, timestamp))
+
+    def update_car_location(self, car_id, car_coords):
+        """Route a car position to its shard; notices arrive through on_notices"""
+        self._send(shard_for(car_id, self.shards), ("location", car_id, car_coords))
+
+    def update_ambulance(self, ambulance_id, latitude, longitude, heading=None, active=True, timestamp=None):
+        """Broadcast an ambulance move (or removal) to every shard at once; notices arrive through on_notices"""
+        self._broadcast(("ambulance", ambulance_id, latitude, longitude, heading, active, timestamp))
+
+    def _broadcast(self, command):
+        for shard in range(self.shards):
+            self._send(shard, command)
+        self.flush()
+
+    def _fan_out(self, command):
+        with self.query_lock:
+            query_id = next(self.query_ids)
+            self._broadcast((command[0], query_id) + command[1:])
+            answers = []
+            while len(answers) < self.shards:
+                answer_id, answer = self.results.get(timeout=QUERY_TIMEOUT)
+                if answer_id == query_id:
+                    answers.append(answer)
+        return answers
+
+    def drain(self):
+        """Kept trajectory points from every shard, cleared as they are returned"""
+        return [track for answer in self._fan_out(("drain",)) for track in answer]
+
+    def stats(self):
+        """Totals across shards; also waits until everything sent so far is processed"""
+        totals = {}
+        for answer in self._fan_out(("stats",)):
+            for key, value in answer.items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
@@ -0,0 +1,109 @@
+import math
+import numpy as np
+from geo import within_radius
+
+# Approximate length of one degree of latitude in meters
+METERS_PER_DEGREE = 111320.0
+
+# Default grid cell edge in meters, sized around the 50 m ambulance radius
+DEFAULT_CELL_SIZE = 50
+
+
+def grid_cell(latitude, longitude, cell_degrees):
+    """(row, col) of the square cell, cell_degrees on a side, holding the point"""
+    return (math.floor(latitude / cell_degrees), math.floor(longitude / cell_degrees))
+
+
+def cells_covering(latitude, longitude, radius, cell_degrees):
+    """Cells overlapping the bounding box of a radius around the point"""
+    lat_span = radius / METERS_PER_DEGREE
+    lon_scale = max(math.cos(math.radians(latitude)), 1e-6)
+    lon_span = lat_span / lon_scale
+    row_min, col_min = grid_cell(latitude - lat_span, longitude - lon_span, cell_degrees)
+    row_max, col_max = grid_cell(latitude + lat_span, longitude + lon_span, cell_degrees)
+    return [(row, col) for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1)]
+
+
+class GridIndex:
+    """Uniform lat/lon cell grid for "which cars are within R meters" lookups.
+
+    Cells are square in degrees of latitude; each update only touches the
+    car's old and new cell, and a radius query only scans the cells that
+    overlap the query's bounding box.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cell_degrees = cell_size / METERS_PER_DEGREE
+        self.cells = {}
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, item_id):
+        return item_id in self.positions
+
+    def cell_of(self, latitude, longitude):
+        return grid_cell(latitude, longitude, self.cell_degrees)
+
+    def update(self, item_id, latitude, longitude):
+        """Insert or move an item, touching at most two cells"""
+        cell = self.cell_of(latitude, longitude)
+        previous = self.positions.get(item_id)
+        if previous is not None and previous[2] != cell:
+            self._discard(item_id, previous[2])
+        if previous is None or previous[2] != cell:
+            self.cells.setdefault(cell, set()).add(item_id)
+        self.positions[item_id] = (latitude, longitude, cell)
+
+    def remove(self, item_id):
+        previous = self.positions.pop(item_id, None)
+        if previous is not None:
+            self._discard(item_id, previous[2])
+
+    def _discard(self, item_id, cell):
+        bucket = self.cells.get(cell)
+        if bucket is not None:
+            bucket.discard(item_id)
+            if not bucket:
+                del self.cells[cell]
+
+    def get(self, item_id):
+        position = self.positions.get(item_id)
+        if position is None:
+            return None
+        return position[0], position[1]
+
+    def cells_covering(self, latitude, longitude, radius):
+        """Cells overlapping the bounding box of a radius around the point"""
+        return cells_covering(latitude, longitude, radius, self.cell_degrees)
+
+    def candidates(self, latitude, longitude, radius):
+        """Yield (id, lat, lon) for every item in the cells overlapping the radius"""
+        return self._items_in(self.cells_covering(latitude, longitude, radius))
+
+    def _items_in(self, cells):
+        for cell in cells:
+            bucket = self.cells.get(cell)
+            if bucket:
+                for item_id in bucket:
+                    item_lat, item_lon, _ = self.positions[item_id]
+                    yield item_id, item_lat, item_lon
+
+    def query_radius(self, latitude, longitude, radius, exact=True):
+        """Return ids within radius meters of the point.
+
+        Candidates from the overlapping cells are checked in one batch:
+        ellipsoidal (WGS-84) distance when exact is set, otherwise the
+        equirectangular approximation.
+        """
+        margin = radius * 1.01 + 1 if exact else radius
+        found = list(self.candidates(latitude, longitude, margin))
+        if not found:
+            return []
+        item_ids, item_lats, item_lons = zip(*found)
+        mask = within_radius(latitude, longitude, np.array(item_lats), np.array(item_lons), radius,
+                             method="ellipsoidal" if exact else "equirectangular")
+        return [item_ids[i] for i in np.flatnonzero(mask).tolist()]
+
@@ -0,0 +1,62 @@
+import time
+import numpy as np
+
+# Batched telemetry frames: many vehicle readings in one message, stored as
+# parallel columns instead of one JSON object per reading, e.g.
+#   {"frame": 1, "vehicle_id": [...], "latitude": [...], "longitude": [...],
+#    "speed": [...], "timestamp": [...]}
+FRAME_VERSION = 1
+FRAME_COLUMNS = ("vehicle_id", "latitude", "longitude", "speed", "timestamp")
+TOPIC_VEHICLE_STATUS_FRAME = "myvehiclestatus/frame"
+
+
+def build_frame(readings, timestamp=None):
+    """Pack a list of per-vehicle reading dicts into one columnar frame"""
+    if timestamp is None:
+        timestamp = time.time()
+    return {
+        "frame": FRAME_VERSION,
+        "vehicle_id": [reading["vehicle_id"] for reading in readings],
+        "latitude": [reading["latitude"] for reading in readings],
+        "longitude": [reading["longitude"] for reading in readings],
+        "speed": [reading.get("speed", 0) for reading in readings],
+        "timestamp": [reading.get("timestamp", timestamp) for reading in readings],
+    }
+
+
+def is_frame(data):
+    return isinstance(data, dict) and "frame" in data and isinstance(data.get("vehicle_id"), list)
+
+
+def frame_arrays(data, timestamp=None):
+    """Return (vehicle_ids, latitudes, longitudes, speeds, timestamps) with NumPy columns.
+
+    Missing speed or timestamp columns default to 0 and the receive time.
+    """
+    vehicle_ids = data["vehicle_id"]
+    count = len(vehicle_ids)
+    latitudes = np.asarray(data["latitude"], dtype=np.float64)
+    longitudes = np.asarray(data["longitude"], dtype=np.float64)
+    if len(latitudes) != count or len(longitudes) != count:
+        raise ValueError("Frame columns have different lengths")
+    speeds = data.get("speed")
+    if speeds is None:
+        speeds = np.zeros(count)
+    speeds = np.asarray(speeds, dtype=np.float64)
+    timestamps = data.get("timestamp")
+    if timestamps is None:
+        timestamps = np.full(count, time.time() if timestamp is None else timestamp)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(speeds) != count or len(timestamps) != count:
+        raise ValueError("Frame columns have different lengths")
+    return vehicle_ids, latitudes, longitudes, speeds, timestamps
+
+
+def frame_readings(data):
+    """Expand a frame back into per-reading dicts for consumers that want them"""
+    vehicle_ids, latitudes, longitudes, speeds, timestamps = frame_arrays(data)
+    return [
+        {"vehicle_id": vehicle_id, "latitude": lat, "longitude": lon, "speed": speed, "timestamp": ts}
+        for vehicle_id, lat, lon, speed, ts in zip(
+            vehicle_ids, latitudes.tolist(), longitudes.tolist(), speeds.tolist(), timestamps.tolist())
+    ]
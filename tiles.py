@@ -0,0 +1,154 @@
+import math
+import time
+import threading
+
+# Slippy-map zoom levels (Leaflet z/x/y). Counters are kept for every zoom
+# from DETAIL_LEVELS to MAX_ZOOM; a tile request at zoom z is answered with
+# the cells DETAIL_LEVELS zooms further in (an 8 x 8 grid per tile).
+MAX_ZOOM = 16
+DETAIL_LEVELS = 3
+
+# Events lose half their weight every HALF_LIFE seconds
+HALF_LIFE = 600
+# Cells whose decayed weight falls below this are dropped when pruning
+MIN_WEIGHT = 0.01
+PRUNE_INTERVAL = 60  # seconds between prune passes
+# Largest decay exponent stored before the landmark is moved forward
+MAX_EXPONENT = 200
+
+# Slippy-map projection limit; Web Mercator is undefined at the poles
+MAX_LATITUDE = 85.05112878
+
+
+def tile_coordinates(latitude, longitude, zoom=MAX_ZOOM):
+    """(x, y) of the Web Mercator tile holding the point at zoom"""
+    latitude = min(max(latitude, -MAX_LATITUDE), MAX_LATITUDE)
+    scale = 1 << zoom
+    x = int((longitude + 180.0) / 360.0 * scale)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * scale)
+    return min(max(x, 0), scale - 1), min(max(y, 0), scale - 1)
+
+
+def event_position(event):
+    """(latitude, longitude) of an event in any of the payload shapes in use, or None"""
+    location = event.get("location", event)
+    if not isinstance(location, dict):
+        return None
+    for lat_key, lon_key in (("latitude", "longitude"), ("lat", "lng"), ("lat", "lon")):
+        latitude = location.get(lat_key)
+        longitude = location.get(lon_key)
+        if isinstance(latitude, (int, float)) and isinstance(longitude, (int, float)):
+            return latitude, longitude
+    return None
+
+
+class TileAggregator:
+    """Time-decayed per-tile event counts and speeds for map layers.
+
+    Every event adds its weight to one cell per kept zoom (the parent
+    tiles of its MAX_ZOOM tile are found by shifting), so an update is a
+    dozen dict additions and a tile read only touches the cells of that
+    tile, no matter how much history went in. Decay uses forward
+    weighting: an event at time t adds exp((t - landmark) / tau) and reads
+    scale by exp(-(now - landmark) / tau), so cells never need to be
+    touched just because time passed. Cells hold per layer [weight,
+    weighted speed sum, speed weight]. Thread-safe.
+    """
+
+    def __init__(self, layers, half_life=HALF_LIFE, detail=DETAIL_LEVELS):
+        self.layers = {layer: i * 3 for i, layer in enumerate(layers)}
+        self.width = len(self.layers) * 3
+        self.tau = half_life / math.log(2)
+        self.detail = detail
+        self.cells = {zoom: {} for zoom in range(detail, MAX_ZOOM + 1)}
+        self.levels = [(MAX_ZOOM - zoom, cells) for zoom, cells in self.cells.items()]
+        self.landmark = None  # Time the stored weights are relative to; set by the first event
+        self.pruned = None
+        self.events = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(cells) for cells in self.cells.values())
+
+    def add(self, layer, event, timestamp=None):
+        """Count an event (or every row of a telemetry frame); returns how many were placed"""
+        offset = self.layers.get(layer)
+        if offset is None or not isinstance(event, dict):
+            return 0
+        timestamp = time.time() if timestamp is None else timestamp
+        if isinstance(event.get("latitude"), list):
+            speeds = event.get("speed") or [None] * len(event["latitude"])
+            points = [(lat, lon, speed) for lat, lon, speed in zip(event["latitude"], event["longitude"], speeds)]
+        else:
+            position = event_position(event)
+            if position is None:
+                return 0
+            points = [(position[0], position[1], event.get("speed"))]
+        with self.lock:
+            if self.landmark is None:
+                self.landmark = self.pruned = timestamp
+            elif (timestamp - self.landmark) / self.tau > MAX_EXPONENT:
+                self._rebase(timestamp)
+            weight = math.exp((timestamp - self.landmark) / self.tau)
+            for latitude, longitude, speed in points:
+                x, y = tile_coordinates(latitude, longitude)
+                has_speed = isinstance(speed, (int, float))
+                for shift, cells in self.levels:
+                    key = (x >> shift, y >> shift)
+                    cell = cells.get(key)
+                    if cell is None:
+                        cell = cells[key] = [0.0] * self.width
+                    cell[offset] += weight
+                    if has_speed:
+                        cell[offset + 1] += weight * speed
+                        cell[offset + 2] += weight
+            self.events += len(points)
+            if timestamp - self.pruned > PRUNE_INTERVAL:
+                self._prune(timestamp)
+        return len(points)
+
+    def _rebase(self, timestamp):
+        """Move the landmark to timestamp, rescaling every cell"""
+        factor = math.exp(-(timestamp - self.landmark) / self.tau)
+        for cells in self.cells.values():
+            for cell in cells.values():
+                for i in range(self.width):
+                    cell[i] *= factor
+        self.landmark = timestamp
+
+    def _prune(self, now):
+        self.pruned = now
+        threshold = MIN_WEIGHT * math.exp((now - self.landmark) / self.tau)
+        for cells in self.cells.values():
+            stale = [key for key, cell in cells.items() if max(cell[0::3]) < threshold]
+            for key in stale:
+                del cells[key]
+
+    def tile(self, z, x, y, now=None):
+        """Decayed aggregates of the cells inside tile z/x/y.
+
+        Returns (cell zoom, {layer: [[x, y, weight, mean speed or None], ...]})
+        with cells DETAIL_LEVELS zooms further in (capped at MAX_ZOOM).
+        """
+        if not 0 <= z <= MAX_ZOOM or not (0 <= x < 1 << z and 0 <= y < 1 << z):
+            raise ValueError(f"No tile {z}/{x}/{y}")
+        zoom = max(min(z + self.detail, MAX_ZOOM), self.detail)
+        span = 1 << (zoom - z)
+        keys = [(cx, cy) for cx in range(x * span, (x + 1) * span) for cy in range(y * span, (y + 1) * span)]
+        now = time.time() if now is None else now
+        layers = {layer: [] for layer in self.layers}
+        with self.lock:
+            if self.landmark is None:
+                return zoom, layers
+            scale = math.exp(min((self.landmark - now) / self.tau, MAX_EXPONENT))
+            cells = self.cells[zoom]
+            found = [(key, list(cell)) for key, cell in ((key, cells.get(key)) for key in keys) if cell is not None]
+        for (cx, cy), cell in found:
+            for layer, offset in self.layers.items():
+                weight = cell[offset] * scale
+                if weight < MIN_WEIGHT:
+                    continue
+                speed_weight = cell[offset + 2]
+                mean_speed = round(cell[offset + 1] / speed_weight, 1) if speed_weight else None
+                layers[layer].append([cx, cy, round(weight, 3), mean_speed])
+        return zoom, layers
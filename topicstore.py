@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+# Retention defaults for each topic
+DEFAULT_MAX_ROWS = 100000
+DEFAULT_MAX_AGE = 24 * 60 * 60  # 24 hours in seconds
+
+
+class TopicStore:
+    """Bounded, time-indexed message log for a single topic.
+
+    Rows get consecutive sequence numbers and non-decreasing receive
+    timestamps, so a cursor maps straight to a list offset and a time range
+    is found by bisection. Queries therefore cost time proportional to the
+    rows they return. Old rows are dropped by count and by age, on writes
+    and on reads so an idle topic stops serving stale rows, and the backing
+    lists are compacted once the dropped prefix gets large.
+    Readers can block in wait_for until rows past a cursor arrive, and
+    on_expire, if given, is called (under the store lock) whenever rows are
+    dropped, so caches built from them can be invalidated.
+    """
+
+    def __init__(self, max_rows=DEFAULT_MAX_ROWS, max_age=DEFAULT_MAX_AGE, on_expire=None):
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.on_expire = on_expire
+        self.payloads = []
+        self.timestamps = []
+        self.head = 0  # Index of the oldest retained row
+        self.base_seq = 0  # Sequence number of payloads[0]
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def __len__(self):
+        return len(self.payloads) - self.head
+
+    @property
+    def first_seq(self):
+        return self.base_seq + self.head
+
+    @property
+    def next_seq(self):
+        return self.base_seq + len(self.payloads)
+
+    def append(self, payload, timestamp=None):
+        """Store a payload and return its sequence number"""
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            if self.timestamps and timestamp < self.timestamps[-1]:
+                # Keep the index sorted if the clock steps backwards
+                timestamp = self.timestamps[-1]
+            seq = self.next_seq
+            self.payloads.append(payload)
+            self.timestamps.append(timestamp)
+            self._expire(timestamp)
+            self.changed.notify_all()
+        return seq
+
+    def expire(self, now=None):
+        with self.lock:
+            self._expire(time.time() if now is None else now)
+
+    def _expire(self, now):
+        end = len(self.payloads)
+        head = max(self.head, end - self.max_rows)
+        if self.max_age is not None:
+            head = bisect_left(self.timestamps, now - self.max_age, head, end)
+        if head != self.head:
+            for i in range(self.head, head):
+                self.payloads[i] = None
+            self.head = head
+            if self.on_expire is not None:
+                self.on_expire()
+        if self.head > 1024 and self.head * 2 > end:
+            del self.payloads[:self.head]
+            del self.timestamps[:self.head]
+            self.base_seq += self.head
+            self.head = 0
+
+    def query(self, since=None, until=None, cursor=None, limit=None):
+        """Return (payloads, next_cursor) for rows in [since, until].
+
+        cursor is the sequence number of the first row wanted, as returned in
+        next_cursor by the previous page; next_cursor is None when the range
+        has been exhausted. Without cursor or since, a limited query returns
+        the newest limit rows of the range rather than the oldest.
+        """
+        with self.lock:
+            self._expire(time.time())
+            start = self.head
+            end = len(self.payloads)
+            if cursor is not None:
+                start = min(max(start, cursor - self.base_seq), end)
+            if since is not None:
+                start = bisect_left(self.timestamps, since, start, end)
+            if until is not None:
+                end = bisect_right(self.timestamps, until, start, end)
+            if limit is not None and cursor is None and since is None:
+                start = max(start, end - limit)
+            stop = end if limit is None else min(end, start + limit)
+            rows = self.payloads[start:stop]
+            next_cursor = self.base_seq + stop if stop < end else None
+        return rows, next_cursor
+
+    def query_raw(self, since=None, until=None, cursor=None, limit=None):
+        """Like query, but rows are JSON-encoded bytes"""
+        rows, next_cursor = self.query(since, until, cursor, limit)
+        return [json.dumps(row).encode() for row in rows], next_cursor
+
+    def read(self, cursor, limit=None):
+        """Return (seq, payloads) for rows from cursor on, seq being the first row's number.
+
+        A cursor that points at expired rows resumes from the oldest retained row.
+        """
+        with self.lock:
+            self._expire(time.time())
+            end = len(self.payloads)
+            start = min(max(self.head, cursor - self.base_seq), end)
+            stop = end if limit is None else min(end, start + limit)
+            return self.base_seq + start, self.payloads[start:stop]
+
+    def read_raw(self, cursor, limit=None):
+        """Like read, but rows are JSON-encoded bytes"""
+        seq, rows = self.read(cursor, limit)
+        return seq, [json.dumps(row).encode() for row in rows]
+
+    def wait_for(self, cursor, timeout):
+        """Block until a row with sequence number >= cursor exists; False on timeout"""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.next_seq > cursor, timeout)
@@ -0,0 +1,186 @@
+import math
+import threading
+import numpy as np
+from spatialindex import grid_cell, METERS_PER_DEGREE
+
+# Defaults for the per-cell rolling windows
+DEFAULT_CELL_SIZE = 500  # Grid cell edge in meters, standing in for a road segment
+DEFAULT_WINDOW_SECONDS = 60
+DEFAULT_SEGMENT_CAPACITY = 4096
+DEFAULT_OVERALL_CAPACITY = 1 << 17
+
+# Speed histogram bins, 1 km/h wide; faster readings land in the last bin
+SPEED_BINS = 256
+
+# Distinct vehicles seen in a window at which density becomes medium / high
+MEDIUM_DENSITY_VEHICLES = 5
+HIGH_DENSITY_VEHICLES = 20
+
+# Speed cap multipliers applied to the average speed for each density class
+DENSITY_MULTIPLIERS = {"high": 1.25, "medium": 1.5, "low": 1.75}
+
+
+def classify_density(vehicle_count):
+    if vehicle_count >= HIGH_DENSITY_VEHICLES:
+        return "high"
+    if vehicle_count >= MEDIUM_DENSITY_VEHICLES:
+        return "medium"
+    return "low"
+
+
+def speed_cap(avg_speed, density):
+    return avg_speed * DENSITY_MULTIPLIERS[density]
+
+
+class RollingWindow:
+    """Time- and size-bounded window of speed readings backed by NumPy rings.
+
+    A running total and a fixed-size speed histogram are adjusted on every
+    insert and eviction, so mean and percentile speeds cost the same no
+    matter how many readings the window holds.
+    """
+
+    def __init__(self, capacity, window_seconds):
+        self.capacity = capacity
+        self.window_seconds = window_seconds
+        self.speeds = np.zeros(capacity, dtype=np.float64)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.vehicles = [None] * capacity
+        self.histogram = np.zeros(SPEED_BINS, dtype=np.int64)
+        self.vehicle_counts = {}
+        self.head = 0
+        self.size = 0
+        self.speed_total = 0.0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, vehicle_id, speed, timestamp):
+        self.expire(timestamp)
+        if self.size == self.capacity:
+            self._evict()
+        tail = (self.head + self.size) % self.capacity
+        self.speeds[tail] = speed
+        self.timestamps[tail] = timestamp
+        self.vehicles[tail] = vehicle_id
+        self.histogram[self._bin(speed)] += 1
+        self.vehicle_counts[vehicle_id] = self.vehicle_counts.get(vehicle_id, 0) + 1
+        self.speed_total += speed
+        self.size += 1
+
+    def expire(self, now):
+        cutoff = now - self.window_seconds
+        while self.size and self.timestamps[self.head] < cutoff:
+            self._evict()
+
+    def _evict(self):
+        head = self.head
+        speed = self.speeds[head]
+        vehicle_id = self.vehicles[head]
+        self.histogram[self._bin(speed)] -= 1
+        remaining = self.vehicle_counts[vehicle_id] - 1
+        if remaining:
+            self.vehicle_counts[vehicle_id] = remaining
+        else:
+            del self.vehicle_counts[vehicle_id]
+        self.vehicles[head] = None
+        self.speed_total -= speed
+        self.head = (head + 1) % self.capacity
+        self.size -= 1
+        if self.size == 0:
+            # Reset so floating point drift cannot accumulate
+            self.speed_total = 0.0
+
+    @staticmethod
+    def _bin(speed):
+        return min(max(int(speed), 0), SPEED_BINS - 1)
+
+    def mean_speed(self):
+        if self.size == 0:
+            return 0
+        return self.speed_total / self.size
+
+    def percentile_speed(self, percentile):
+        """Speed at the given percentile, to the 1 km/h bin resolution"""
+        if self.size == 0:
+            return 0
+        rank = max(1, math.ceil(self.size * percentile / 100))
+        return float(np.searchsorted(np.cumsum(self.histogram), rank))
+
+    def vehicle_count(self):
+        return len(self.vehicle_counts)
+
+    def density(self):
+        return classify_density(self.vehicle_count())
+
+    def speed_cap(self):
+        return speed_cap(self.mean_speed(), self.density())
+
+
+class TrafficStats:
+    """Rolling speed and density statistics per grid cell and fleet-wide.
+
+    Each reading updates the window of the cell it falls in and the overall
+    window; speed caps come from the cell's mean speed and a density class
+    based on the distinct vehicles seen there during the window. Methods are
+    safe to call from the MQTT thread and a periodic publisher at once.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE, window_seconds=DEFAULT_WINDOW_SECONDS,
+                 segment_capacity=DEFAULT_SEGMENT_CAPACITY, overall_capacity=DEFAULT_OVERALL_CAPACITY):
+        self.cell_degrees = cell_size / METERS_PER_DEGREE
+        self.window_seconds = window_seconds
+        self.segment_capacity = segment_capacity
+        self.segments = {}
+        self.overall = RollingWindow(overall_capacity, window_seconds)
+        self.lock = threading.Lock()
+
+    def segment_of(self, latitude, longitude):
+        return grid_cell(latitude, longitude, self.cell_degrees)
+
+    def update(self, vehicle_id, latitude, longitude, speed, timestamp, segment=None):
+        """Record a reading and return the segment key it was filed under.
+
+        segment overrides the grid cell, e.g. with a map-matched road segment id.
+        """
+        if segment is None:
+            segment = self.segment_of(latitude, longitude)
+        with self.lock:
+            window = self.segments.get(segment)
+            if window is None:
+                window = self.segments[segment] = RollingWindow(self.segment_capacity, self.window_seconds)
+            window.add(vehicle_id, speed, timestamp)
+            self.overall.add(vehicle_id, speed, timestamp)
+        return segment
+
+    def segment(self, segment):
+        return self.segments.get(segment)
+
+    def speed_cap(self, segment):
+        with self.lock:
+            window = self.segments.get(segment)
+            if window is None:
+                return self.overall.speed_cap()
+            return window.speed_cap()
+
+    def segment_speed_caps(self):
+        with self.lock:
+            return {segment: window.speed_cap() for segment, window in self.segments.items()}
+
+    def overall_speed_cap(self):
+        """Fleet-wide cap, classed by the average vehicle count of active segments"""
+        with self.lock:
+            if not self.segments:
+                return 0
+            per_segment = self.overall.vehicle_count() / len(self.segments)
+            return speed_cap(self.overall.mean_speed(), classify_density(per_segment))
+
+    def prune(self, now):
+        """Expire old readings everywhere and drop segments that went quiet"""
+        with self.lock:
+            self.overall.expire(now)
+            for segment in list(self.segments):
+                window = self.segments[segment]
+                window.expire(now)
+                if len(window) == 0:
+                    del self.segments[segment]
@@ -0,0 +1,224 @@
+import sys
+from array import array
+import numpy as np
+from geo import equirectangular, equirectangular_distance
+
+# Largest deviation in meters between a reading and the dead-reckoned
+# position before the reading is kept as a new trajectory point
+DEFAULT_TOLERANCE = 5
+# Seconds between routine speed samples for one vehicle
+DEFAULT_SPEED_INTERVAL = 30 * 60
+# Speeds above this (km/h) are always sampled
+DEFAULT_SPEED_CAP = 80
+# Points kept per vehicle before the oldest quarter is dropped
+DEFAULT_MAX_POINTS = 4096
+
+
+class Trajectory:
+    """Compressed track of one vehicle, held in typed arrays.
+
+    The last kept point is the anchor. Its velocity is taken from the
+    previous anchor, and the position is dead-reckoned forward from it.
+    """
+
+    __slots__ = ("times", "latitudes", "longitudes", "speed_times", "speeds",
+                 "anchor_time", "anchor_lat", "anchor_lon", "velocity_lat", "velocity_lon", "last_speed_time")
+
+    def __init__(self):
+        self.times = array("d")
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.speed_times = array("d")
+        self.speeds = array("f")
+        self.anchor_time = None
+        self.anchor_lat = 0.0
+        self.anchor_lon = 0.0
+        self.velocity_lat = 0.0  # degrees per second
+        self.velocity_lon = 0.0
+        self.last_speed_time = float("-inf")
+
+    def __len__(self):
+        return len(self.times)
+
+    def predict(self, timestamp):
+        dt = timestamp - self.anchor_time
+        return self.anchor_lat + self.velocity_lat * dt, self.anchor_lon + self.velocity_lon * dt
+
+    def keep_point(self, timestamp, latitude, longitude, max_points):
+        if self.anchor_time is not None and timestamp > self.anchor_time:
+            dt = timestamp - self.anchor_time
+            self.velocity_lat = (latitude - self.anchor_lat) / dt
+            self.velocity_lon = (longitude - self.anchor_lon) / dt
+        self.anchor_time, self.anchor_lat, self.anchor_lon = timestamp, latitude, longitude
+        if len(self.times) >= max_points:
+            drop = max_points // 4
+            del self.times[:drop], self.latitudes[:drop], self.longitudes[:drop]
+        self.times.append(timestamp)
+        self.latitudes.append(latitude)
+        self.longitudes.append(longitude)
+
+    def keep_speed(self, timestamp, speed, max_points):
+        if len(self.speed_times) >= max_points:
+            drop = max_points // 4
+            del self.speed_times[:drop], self.speeds[:drop]
+        self.speed_times.append(timestamp)
+        self.speeds.append(speed)
+        self.last_speed_time = timestamp
+
+    def positions_at(self, timestamps):
+        """Reconstruct positions at the given times from the kept points.
+
+        Uses the same dead-reckoning model as the simplification, so every
+        reading that was dropped lies within tolerance of the result.
+        """
+        times = np.asarray(self.times)
+        latitudes = np.asarray(self.latitudes)
+        longitudes = np.asarray(self.longitudes)
+        dt = np.diff(times)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            velocity_lat = np.concatenate(([0.0], np.where(dt > 0, np.diff(latitudes) / dt, 0.0)))
+            velocity_lon = np.concatenate(([0.0], np.where(dt > 0, np.diff(longitudes) / dt, 0.0)))
+        index = np.clip(np.searchsorted(times, timestamps, side="right") - 1, 0, None)
+        elapsed = np.asarray(timestamps) - times[index]
+        return (latitudes[index] + velocity_lat[index] * elapsed,
+                longitudes[index] + velocity_lon[index] * elapsed)
+
+    def nbytes(self):
+        return (sys.getsizeof(self) + sys.getsizeof(self.times) + sys.getsizeof(self.latitudes)
+                + sys.getsizeof(self.longitudes) + sys.getsizeof(self.speed_times) + sys.getsizeof(self.speeds))
+
+
+class TrajectoryStore:
+    """Per-vehicle trajectories with online dead-reckoning simplification.
+
+    A reading is kept only when it lies more than tolerance meters from the
+    position predicted by the vehicle's last kept point and velocity. Parked
+    cars and cars driving straight at a steady speed therefore add nothing,
+    and points cluster at turns and speed changes. Speeds are sampled per
+    vehicle: every reading above the cap, otherwise once per interval.
+    """
+
+    def __init__(self, tolerance=DEFAULT_TOLERANCE, speed_interval=DEFAULT_SPEED_INTERVAL,
+                 speed_cap=DEFAULT_SPEED_CAP, max_points=DEFAULT_MAX_POINTS):
+        self.tolerance = tolerance
+        self.speed_interval = speed_interval
+        self.speed_cap = speed_cap
+        self.max_points = max_points
+        self.vehicles = {}
+        self.readings = 0
+        self.kept = 0
+
+    def __len__(self):
+        return len(self.vehicles)
+
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self.vehicles
+
+    def get(self, vehicle_id):
+        return self.vehicles.get(vehicle_id)
+
+    def last_location(self, vehicle_id):
+        track = self.vehicles.get(vehicle_id)
+        if track is None or track.anchor_time is None:
+            return None
+        return track.anchor_lat, track.anchor_lon
+
+    def add(self, vehicle_id, timestamp, latitude, longitude, speed=None):
+        """Record one reading; returns (kept_point, kept_speed)"""
+        self.readings += 1
+        track = self.vehicles.get(vehicle_id)
+        if track is None:
+            track = self.vehicles[vehicle_id] = Trajectory()
+
+        kept_speed = False
+        if speed and (speed > self.speed_cap or timestamp - track.last_speed_time >= self.speed_interval):
+            track.keep_speed(timestamp, speed, self.max_points)
+            kept_speed = True
+
+        if track.anchor_time is not None:
+            predicted_lat, predicted_lon = track.predict(timestamp)
+            if equirectangular_distance(predicted_lat, predicted_lon, latitude, longitude) <= self.tolerance:
+                return False, kept_speed
+        track.keep_point(timestamp, latitude, longitude, self.max_points)
+        self.kept += 1
+        return True, kept_speed
+
+    def add_many(self, vehicle_ids, timestamps, latitudes, longitudes, speeds):
+        """Record a batch of readings given as NumPy columns.
+
+        The dead-reckoning test runs vectorized over the batch; only the
+        readings that are kept touch per-vehicle state. Returns the indices
+        of kept points and kept speeds. A vehicle should appear at most once
+        per batch.
+        """
+        count = len(vehicle_ids)
+        self.readings += count
+        vehicles = self.vehicles
+        tracks = []
+        for vehicle_id in vehicle_ids:
+            track = vehicles.get(vehicle_id)
+            if track is None:
+                track = vehicles[vehicle_id] = Trajectory()
+            tracks.append(track)
+        state = np.array([
+            (track.anchor_time if track.anchor_time is not None else np.nan, track.anchor_lat, track.anchor_lon,
+             track.velocity_lat, track.velocity_lon, track.last_speed_time)
+            for track in tracks
+        ], dtype=np.float64).reshape(count, 6)
+        anchor_time, anchor_lat, anchor_lon, velocity_lat, velocity_lon, last_speed_time = state.T
+
+        dt = timestamps - anchor_time
+        error = equirectangular(anchor_lat + velocity_lat * dt, anchor_lon + velocity_lon * dt, latitudes, longitudes)
+        # NaN anchors (new vehicles) compare False, so they are kept
+        kept = np.flatnonzero(~(error <= self.tolerance))
+        self.kept += len(kept)
+        sampled = np.flatnonzero((speeds > 0) & ((speeds > self.speed_cap)
+                                                 | (timestamps - last_speed_time >= self.speed_interval)))
+
+        max_points = self.max_points
+        for i, ts, lat, lon in zip(kept.tolist(), timestamps[kept].tolist(),
+                                   latitudes[kept].tolist(), longitudes[kept].tolist()):
+            tracks[i].keep_point(ts, lat, lon, max_points)
+        for i, ts, speed in zip(sampled.tolist(), timestamps[sampled].tolist(), speeds[sampled].tolist()):
+            tracks[i].keep_speed(ts, speed, max_points)
+        return kept, sampled
+
+    def drain(self):
+        """Return kept points and speeds per vehicle as columns and clear them.
+
+        Anchors and speed timers stay, so simplification carries on across
+        drains.
+        """
+        batches = []
+        for vehicle_id, track in self.vehicles.items():
+            if not track.times and not track.speed_times:
+                continue
+            batches.append({
+                "id": vehicle_id,
+                "timestamp": track.times.tolist(),
+                "latitude": track.latitudes.tolist(),
+                "longitude": track.longitudes.tolist(),
+                "speed_timestamp": track.speed_times.tolist(),
+                "speed": track.speeds.tolist(),
+            })
+            del track.times[:], track.latitudes[:], track.longitudes[:], track.speed_times[:], track.speeds[:]
+        return batches
+
+    def remove(self, vehicle_id):
+        self.vehicles.pop(vehicle_id, None)
+
+    def memory_report(self):
+        """Vehicle, point and byte counts, including bytes per tracked vehicle"""
+        vehicles = len(self.vehicles)
+        points = sum(len(track.times) for track in self.vehicles.values())
+        speeds = sum(len(track.speed_times) for track in self.vehicles.values())
+        total = sys.getsizeof(self.vehicles) + sum(track.nbytes() for track in self.vehicles.values())
+        return {
+            "vehicles": vehicles,
+            "readings": self.readings,
+            "points": points,
+            "speed_samples": speeds,
+            "bytes": total,
+            "bytes_per_vehicle": total / vehicles if vehicles else 0.0,
+            "kept_ratio": self.kept / self.readings if self.readings else 0.0,
+        }
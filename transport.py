@@ -0,0 +1,232 @@
+import os
+import queue
+import threading
+
+# Broker selection, shared by every component. MQTT_TRANSPORT picks the
+# backend: "paho" (default) talks to a real broker, "loopback" delivers
+# messages inside the current process through LoopbackBroker.
+BROKER = os.environ.get("MQTT_BROKER", "broker.emqx.io")
+PORT = int(os.environ.get("MQTT_PORT", "1883"))
+TRANSPORT = os.environ.get("MQTT_TRANSPORT", "paho")
+
+
+def topic_matches(subscription, topic):
+    """MQTT topic filter matching with + (one level) and # (remaining levels)"""
+    if subscription == topic:
+        return True
+    filter_levels = subscription.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            # Topics starting with $ are not matched by a leading wildcard
+            return not (i == 0 and topic.startswith("$"))
+        if i >= len(topic_levels):
+            return False
+        if level == "+":
+            if i == 0 and topic.startswith("$"):
+                return False
+        elif level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class LoopbackMessage:
+    """Message object with the attributes paho's MQTTMessage exposes to callbacks"""
+
+    __slots__ = ("topic", "payload", "qos", "retain")
+
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+
+
+class PublishResult:
+    """Stand-in for paho's MQTTMessageInfo"""
+
+    rc = 0
+
+    def is_published(self):
+        return True
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+
+PUBLISHED = PublishResult()
+
+
+class LoopbackBroker:
+    """In-process pub/sub broker with MQTT topic wildcard semantics.
+
+    Subscriptions are matched once per distinct topic and the resulting
+    subscriber list is cached until subscriptions change, so steady-state
+    publishing is a dict lookup plus one call per subscriber.
+    """
+
+    def __init__(self):
+        self.subscriptions = {}  # topic filter -> list of clients
+        self.routes = {}  # topic -> clients subscribed to it, cached
+        self.lock = threading.Lock()
+
+    def subscribe(self, client, topic_filter):
+        with self.lock:
+            clients = self.subscriptions.setdefault(topic_filter, [])
+            if client not in clients:
+                clients.append(client)
+            self.routes = {}
+
+    def unsubscribe(self, client, topic_filter):
+        with self.lock:
+            clients = self.subscriptions.get(topic_filter, [])
+            if client in clients:
+                clients.remove(client)
+            if not clients:
+                self.subscriptions.pop(topic_filter, None)
+            self.routes = {}
+
+    def disconnect(self, client):
+        with self.lock:
+            for topic_filter in list(self.subscriptions):
+                clients = self.subscriptions[topic_filter]
+                if client in clients:
+                    clients.remove(client)
+                if not clients:
+                    del self.subscriptions[topic_filter]
+            self.routes = {}
+
+    def subscribers(self, topic):
+        routes = self.routes
+        clients = routes.get(topic)
+        if clients is None:
+            with self.lock:
+                matched = []
+                for topic_filter, subscribed in self.subscriptions.items():
+                    if topic_matches(topic_filter, topic):
+                        matched.extend(client for client in subscribed if client not in matched)
+                clients = self.routes[topic] = tuple(matched)
+        return clients
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        elif payload is None:
+            payload = b""
+        message = LoopbackMessage(topic, payload, qos, retain)
+        for client in self.subscribers(topic):
+            client.deliver(message)
+
+
+# Process-wide broker used by loopback clients unless one is passed in
+default_broker = LoopbackBroker()
+
+
+class LoopbackClient:
+    """Drop-in replacement for paho.mqtt.client.Client backed by LoopbackBroker.
+
+    By default messages are delivered synchronously inside publish(), which
+    is the fastest way to drive a pipeline in one thread. With threaded=True
+    each client gets its own receive queue and delivery thread, like paho's
+    network loop, once loop_start() or loop_forever() runs.
+    """
+
+    def __init__(self, client_id="", broker=None, threaded=False):
+        self.client_id = client_id
+        self.broker = broker or default_broker
+        self.threaded = threaded
+        self.on_connect = None
+        self.on_message = None
+        self.on_disconnect = None
+        self.userdata = None
+        self.connected = False
+        self.inbox = queue.Queue() if threaded else None
+        self.loop_thread = None
+        self.running = False
+
+    def user_data_set(self, userdata):
+        self.userdata = userdata
+
+    def connect(self, host=None, port=None, keepalive=60):
+        self.connected = True
+        if self.on_connect is not None:
+            self.on_connect(self, self.userdata, {}, 0)
+        return 0
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self):
+        self.connected = False
+        self.broker.disconnect(self)
+        if self.on_disconnect is not None:
+            self.on_disconnect(self, self.userdata, 0)
+        return 0
+
+    def is_connected(self):
+        return self.connected
+
+    def subscribe(self, topic, qos=0):
+        topics = topic if isinstance(topic, list) else [(topic, qos)]
+        for entry in topics:
+            self.broker.subscribe(self, entry[0] if isinstance(entry, tuple) else entry)
+        return 0, 1
+
+    def unsubscribe(self, topic):
+        for entry in topic if isinstance(topic, list) else [topic]:
+            self.broker.unsubscribe(self, entry)
+        return 0, 1
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        self.broker.publish(topic, payload, qos, retain)
+        return PUBLISHED
+
+    def deliver(self, message):
+        if self.inbox is not None:
+            self.inbox.put(message)
+        elif self.on_message is not None:
+            self.on_message(self, self.userdata, message)
+
+    def _loop(self):
+        while self.running:
+            message = self.inbox.get()
+            if message is None:
+                break
+            if self.on_message is not None:
+                self.on_message(self, self.userdata, message)
+
+    def loop_start(self):
+        if self.inbox is None or self.loop_thread is not None:
+            return 0
+        self.running = True
+        self.loop_thread = threading.Thread(target=self._loop, daemon=True)
+        self.loop_thread.start()
+        return 0
+
+    def loop_stop(self):
+        if self.loop_thread is not None:
+            self.running = False
+            self.inbox.put(None)
+            self.loop_thread.join()
+            self.loop_thread = None
+        return 0
+
+    def loop_forever(self):
+        if self.inbox is None:
+            # Synchronous delivery needs no loop; just park like paho would
+            threading.Event().wait()
+        self.running = True
+        self._loop()
+
+
+def create_client(client_id="", backend=None):
+    """Return an MQTT client for the configured backend (paho or loopback)"""
+    backend = backend or TRANSPORT
+    if backend == "loopback":
+        return LoopbackClient(client_id)
+    if backend == "loopback-threaded":
+        return LoopbackClient(client_id, threaded=True)
+    if backend != "paho":
+        raise ValueError(f"Unknown MQTT transport: {backend}")
+    import paho.mqtt.client as mqtt
+    return mqtt.Client(client_id)
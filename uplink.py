@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import uuid
+import zlib
+import struct
+import threading
+from collections import deque
+import metrics
+
+# Edge -> main server batches.
+#
+# Every batch is one MQTT message: a fixed header (magic, version,
+# compression, source id, sequence number) followed by the compressed JSON
+# body {"events": [{"topic": ..., "data": ...}, ...]}. The source id and
+# sequence number let the main server drop batches it has already stored,
+# which makes replaying spooled batches after a stall safe.
+TOPIC_UPLINK = "servermaincontentsend"
+MAGIC = 0xB8
+VERSION = 1
+HEADER = struct.Struct("<BBB16sQ")
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_ZSTD = 2
+COMPRESSIONS = {"none": COMPRESSION_NONE, "zlib": COMPRESSION_ZLIB, "zstd": COMPRESSION_ZSTD}
+
+# Batching and spill settings; UPLINK_COMPRESSION may be none, zlib or zstd
+COMPRESSION = os.environ.get("UPLINK_COMPRESSION", "zlib")
+SPOOL_DIR = os.environ.get("UPLINK_SPOOL_DIR", "uplink_spool")
+MAX_BATCH_EVENTS = 500
+MAX_BATCH_BYTES = 256 * 1024  # Uncompressed JSON size that forces a flush
+MAX_DELAY = 0.5  # Seconds an event may wait for its batch
+MAX_INFLIGHT = 64  # Unacknowledged batches before new ones are spilled to disk
+ACK_TIMEOUT = 30  # Seconds before an unacknowledged batch is spilled for replay
+ZLIB_LEVEL = 6
+DEDUP_WINDOW = 100000  # Sequence numbers remembered per source by the receiver
+
+
+def compress(body, compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(body, ZLIB_LEVEL)
+    if compression == COMPRESSION_ZSTD:
+        import zstandard
+        return zstandard.ZstdCompressor().compress(body)
+    return body
+
+
+def decompress(body, compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(body)
+    if compression == COMPRESSION_ZSTD:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(body)
+    if compression == COMPRESSION_NONE:
+        return body
+    raise ValueError(f"Unknown uplink compression: {compression}")
+
+
+def encode_event(topic, data):
+    """Compact JSON bytes of one batch event"""
+    return json.dumps({"topic": topic, "data": data}, separators=(",", ":")).encode()
+
+
+def encode_batch(source, seq, events, compression=COMPRESSION_ZLIB):
+    """Frame a batch from events already encoded with encode_event"""
+    body = b'{"events":[' + b",".join(events) + b"]}"
+    return HEADER.pack(MAGIC, VERSION, compression, source, seq) + compress(body, compression)
+
+
+def is_batch(payload):
+    return len(payload) >= HEADER.size and payload[0] == MAGIC
+
+
+def batch_header(payload):
+    """(source, seq) of a batch without decompressing it"""
+    magic, version, _, source, seq = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an uplink batch")
+    return source, seq
+
+
+def decode_batch(payload):
+    """Return (source, seq, events) for an encoded batch"""
+    magic, version, compression, source, seq = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not an uplink batch")
+    body = json.loads(decompress(bytes(payload[HEADER.size:]), compression))
+    return source, seq, body["events"]
+
+
+class Deduplicator:
+    """Remembers the last window sequence numbers seen from each source"""
+
+    def __init__(self, window=DEDUP_WINDOW):
+        self.window = window
+        self.seen = {}  # source -> (set of seqs, deque in arrival order)
+        self.lock = threading.Lock()
+
+    def is_new(self, source, seq):
+        """True the first time (source, seq) is offered"""
+        with self.lock:
+            entry = self.seen.get(source)
+            if entry is None:
+                entry = self.seen[source] = (set(), deque())
+            seqs, order = entry
+            if seq in seqs:
+                return False
+            seqs.add(seq)
+            order.append(seq)
+            if len(order) > self.window:
+                seqs.discard(order.popleft())
+            return True
+
+
+class Uplink:
+    """Batched, compressed, at-least-once edge -> main server publisher.
+
+    Events are collected until a batch reaches MAX_BATCH_EVENTS or
+    MAX_BATCH_BYTES or its oldest event is MAX_DELAY old, then published
+    with QoS 1 as one message. When the client is disconnected, publishing
+    fails or too many batches are unacknowledged, batches are written to a
+    spool directory instead and replayed in order once the link recovers.
+    Batches that stay unacknowledged past ACK_TIMEOUT are spooled too;
+    the receiver de-duplicates by (source, seq). Each event is encoded once,
+    when it is queued; publishing holds a separate send lock so batches
+    leave in sequence order whichever thread flushes them.
+    """
+
+    def __init__(self, client, topic=TOPIC_UPLINK, compression=COMPRESSION, spool_dir=SPOOL_DIR,
+                 max_events=MAX_BATCH_EVENTS, max_bytes=MAX_BATCH_BYTES, max_delay=MAX_DELAY,
+                 max_inflight=MAX_INFLIGHT, ack_timeout=ACK_TIMEOUT):
+        self.client = client
+        self.topic = topic
+        self.compression = COMPRESSIONS[compression] if isinstance(compression, str) else compression
+        self.spool_dir = spool_dir
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.max_inflight = max_inflight
+        self.ack_timeout = ack_timeout
+        self.source = uuid.uuid4().bytes
+        self.seq = 0
+        self.pending = []  # encoded events
+        self.pending_bytes = 0
+        self.pending_since = None
+        self.inflight = deque()  # (message info, seq, payload, spool path or None, sent at)
+        self.lock = threading.Lock()
+        self.send_lock = threading.Lock()  # held from taking a seq to publishing or spooling it
+        self.stop_event = threading.Event()
+        self.flush_thread = None
+        self.stats = {"events": 0, "batches": 0, "raw_bytes": 0, "sent_bytes": 0, "spilled": 0, "replayed": 0}
+
+    def send(self, topic, data, urgent=False):
+        """Queue one event; urgent events flush their batch immediately"""
+        event = encode_event(topic, data)
+        with self.lock:
+            if not self.pending:
+                self.pending_since = time.monotonic()
+            self.pending.append(event)
+            self.pending_bytes += len(event)
+            full = len(self.pending) >= self.max_events or self.pending_bytes >= self.max_bytes
+        if urgent or full:
+            self.flush()
+
+    def flush(self):
+        """Publish the pending batch now, spooling it if the link is unhealthy"""
+        with self.send_lock:
+            with self.lock:
+                if not self.pending:
+                    return
+                events, self.pending = self.pending, []
+                raw_bytes, self.pending_bytes = self.pending_bytes, 0
+                self.pending_since = None
+                self.seq += 1
+                seq = self.seq
+            payload = encode_batch(self.source, seq, events, self.compression)
+            with self.lock:
+                self.stats["events"] += len(events)
+                self.stats["batches"] += 1
+                self.stats["raw_bytes"] += raw_bytes
+                self.stats["sent_bytes"] += len(payload)
+            self._reap()
+            if not self._healthy() or not self._publish(seq, payload, None):
+                self._spill(seq, payload)
+
+    def _healthy(self):
+        is_connected = getattr(self.client, "is_connected", None)
+        if is_connected is not None and not is_connected():
+            return False
+        with self.lock:
+            return len(self.inflight) < self.max_inflight
+
+    def _publish(self, seq, payload, path):
+        try:
+            info = self.client.publish(self.topic, payload, qos=1)
+        except Exception as e:
+            print(f"Uplink publish failed: {e}")
+            return False
+        if getattr(info, "rc", 0) != 0:
+            return False
+        with self.lock:
+            self.inflight.append((info, seq, payload, path, time.monotonic()))
+        return True
+
+    def _reap(self):
+        """Drop acknowledged batches and spool the ones that timed out"""
+        now = time.monotonic()
+        timed_out = []
+        with self.lock:
+            kept = deque()
+            for entry in self.inflight:
+                info, seq, payload, path, sent_at = entry
+                if info.is_published():
+                    if path is not None:
+                        self._unlink(path)
+                elif now - sent_at >= self.ack_timeout:
+                    if path is None:
+                        timed_out.append((seq, payload))
+                else:
+                    kept.append(entry)
+            self.inflight = kept
+        for seq, payload in timed_out:
+            self._spill(seq, payload)
+
+    def _spool_path(self, seq):
+        return os.path.join(self.spool_dir, f"{self.source.hex()}-{seq:020d}.batch")
+
+    def _spill(self, seq, payload):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = self._spool_path(seq)
+        with open(path + ".tmp", "wb") as f:
+            f.write(payload)
+        os.replace(path + ".tmp", path)
+        with self.lock:
+            self.stats["spilled"] += 1
+        metrics.registry.inc("uplink_spilled_batches_total")
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def spooled(self):
+        """Spool files not currently awaiting acknowledgement, oldest first"""
+        if not os.path.isdir(self.spool_dir):
+            return []
+        with self.lock:
+            waiting = {entry[3] for entry in self.inflight}
+        names = sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".batch"))
+        paths = [os.path.join(self.spool_dir, name) for name in names]
+        return [path for path in paths if path not in waiting]
+
+    def replay(self):
+        """Publish spooled batches (from this or earlier runs) while the link is healthy"""
+        self._reap()
+        replayed = 0
+        with self.send_lock:
+            for path in self.spooled():
+                if not self._healthy():
+                    break
+                try:
+                    with open(path, "rb") as f:
+                        payload = f.read()
+                    _, seq = batch_header(payload)
+                except (OSError, ValueError, struct.error) as e:
+                    print(f"Skipping unreadable spool file {path}: {e}")
+                    continue
+                if not self._publish(seq, payload, path):
+                    break
+                replayed += 1
+        if replayed:
+            with self.lock:
+                self.stats["replayed"] += replayed
+        return replayed
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.max_delay / 2):
+            with self.lock:
+                due = self.pending_since is not None and time.monotonic() - self.pending_since >= self.max_delay
+            if due:
+                self.flush()
+            self.replay()
+
+    def start(self):
+        if self.flush_thread is None:
+            self.stop_event.clear()
+            self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self.flush_thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.flush_thread is not None:
+            self.flush_thread.join()
+            self.flush_thread = None
+        self.flush()
+
+
+_uplinks = {}
+_uplinks_lock = threading.Lock()
+
+
+def uplink_for(client):
+    """The shared, started Uplink for an MQTT client"""
+    with _uplinks_lock:
+        uplink = _uplinks.get(id(client))
+        if uplink is None:
+            uplink = _uplinks[id(client)] = Uplink(client)
+            uplink.start()
+        return uplink
+
+
+def send_data_to_main_server(client, data=None, topic="sendserverdata"):
+    """Send data (if any) to the main server and flush everything pending"""
+    uplink = uplink_for(client)
+    if data is not None:
+        uplink.send(topic, data)
+    uplink.flush()
@@ -0,0 +1,75 @@
+import json
+import threading
+from collections import deque
+
+# Default number of vehicle status records kept in memory
+DEFAULT_WINDOW_SIZE = 10000
+# Seconds between background flushes of new records to disk
+DEFAULT_FLUSH_INTERVAL = 5
+
+
+class WindowStore:
+    """Bounded in-memory window of vehicle status records.
+
+    Appending is O(1): the oldest record is evicted once the window is full.
+    Records can optionally be persisted by a background thread that appends
+    them to a JSONL log in batches.
+    """
+
+    def __init__(self, maxlen=DEFAULT_WINDOW_SIZE, log_path=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.records = deque(maxlen=maxlen)
+        self.log_path = log_path
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.flush_thread = None
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        with self.lock:
+            self.records.append(record)
+            if self.log_path is not None:
+                self.pending.append(record)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.records)
+
+    def flush(self):
+        """Append every record received since the last flush to the log"""
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch or self.log_path is None:
+            return 0
+        try:
+            with open(self.log_path, "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in batch))
+        except OSError:
+            # Keep the batch so the next flush retries it
+            with self.lock:
+                self.pending = batch + self.pending
+            raise
+        return len(batch)
+
+    def start_flusher(self):
+        if self.log_path is None or self.flush_thread is not None:
+            return
+        self.flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flush_thread.start()
+
+    def stop_flusher(self):
+        self.stop_event.set()
+        if self.flush_thread is not None:
+            self.flush_thread.join()
+            self.flush_thread = None
+        self.flush()
+
+    def _flush_loop(self):
+        while not self.stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Error flushing records to {self.log_path}: {e}")